@@ -83,7 +83,7 @@ class StripeSettingsForm(forms.ModelForm):
 class ResendSettingsForm(forms.ModelForm):
     class Meta:
         model = User
-        fields = ['resend_api_key', 'resend_from_email', 'resend_from_name']
+        fields = ['resend_api_key', 'resend_from_email', 'resend_from_name', 'payment_reminders_enabled']
         widgets = {
             'resend_api_key': forms.PasswordInput(attrs={
                 'class': 'form-control',
@@ -97,6 +97,7 @@ class ResendSettingsForm(forms.ModelForm):
                 'class': 'form-control',
                 'placeholder': 'Your Company Name'
             }),
+            'payment_reminders_enabled': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
         }
         help_texts = {
             'resend_api_key': _('Your Resend API key from resend.com (kept secure and never displayed)'),
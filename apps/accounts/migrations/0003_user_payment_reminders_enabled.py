@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0002_user_resend_api_key_user_resend_from_email_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='payment_reminders_enabled',
+            field=models.BooleanField(default=False, help_text='Email clients your default payment reminder template when their invoice becomes overdue', verbose_name='automatic payment reminders'),
+        ),
+    ]
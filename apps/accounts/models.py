@@ -43,6 +43,11 @@ class User(AbstractUser):
         blank=True,
         help_text=_('Name to display in "from" field of emails')
     )
+    payment_reminders_enabled = models.BooleanField(
+        _('automatic payment reminders'),
+        default=False,
+        help_text=_('Email clients your default payment reminder template when their invoice becomes overdue')
+    )
     
     # Organization info
     vat_number = models.CharField(_('VAT number'), max_length=50, blank=True)
@@ -0,0 +1,76 @@
+"""
+Django management command to load-test the AI gateway against the local
+stub backend (no network access or API key needed).
+"""
+
+import asyncio
+import time
+
+from django.core.management.base import BaseCommand
+from apps.ai_assistant.services import (
+    AI_MAX_CONCURRENCY, AI_TENANT_CONCURRENCY, AIGateway, AIGatewayError, CircuitBreaker, StubBackend,
+)
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent requests through the AI gateway using the stub backend and report latency'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Total requests')
+        parser.add_argument('--tenants', type=int, default=20, help='Distinct tenants issuing requests')
+        parser.add_argument('--latency', type=float, default=0.2, help='Mean stub latency in seconds')
+        parser.add_argument('--failure-rate', type=float, default=0.0, help='Share of stub calls that fail')
+        parser.add_argument('--concurrency', type=int, default=AI_MAX_CONCURRENCY, help='Global concurrency limit')
+        parser.add_argument('--tenant-concurrency', type=int, default=AI_TENANT_CONCURRENCY,
+                            help='Per-tenant concurrency limit')
+        parser.add_argument('--timeout', type=float, default=5.0, help='Per-attempt timeout in seconds')
+
+    def handle(self, *args, **options):
+        gateway = AIGateway(
+            backend=StubBackend(latency=options['latency'], failure_rate=options['failure_rate']),
+            max_concurrency=options['concurrency'],
+            tenant_concurrency=options['tenant_concurrency'],
+            timeout=options['timeout'],
+            breaker=CircuitBreaker(),
+        )
+
+        latencies = []
+        errors = {}
+
+        async def one(i):
+            started = time.perf_counter()
+            try:
+                await gateway.agenerate(f'Load test prompt {i}', tenant=i % options['tenants'])
+            except AIGatewayError as e:
+                errors[type(e).__name__] = errors.get(type(e).__name__, 0) + 1
+            else:
+                latencies.append(time.perf_counter() - started)
+
+        async def run():
+            await asyncio.gather(*(one(i) for i in range(options['requests'])))
+
+        self.stdout.write(
+            f"Sending {options['requests']} requests from {options['tenants']} tenants "
+            f"(global limit {options['concurrency']}, per tenant {options['tenant_concurrency']})..."
+        )
+        started = time.perf_counter()
+        asyncio.run(run())
+        seconds = time.perf_counter() - started
+
+        latencies.sort()
+
+        def percentile(p):
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(round(p / 100 * (len(latencies) - 1))))] * 1000
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ {len(latencies)} succeeded in {seconds:.2f}s ({len(latencies) / seconds:.1f} req/sec), "
+            f"p50 {percentile(50):.0f} ms, p95 {percentile(95):.0f} ms, p99 {percentile(99):.0f} ms"
+        ))
+        self.stdout.write(
+            f"Retries: {gateway.stats['retries']}, rejected: {gateway.stats['rejected']}, "
+            f"breaker trips: {gateway.breaker.trips}"
+        )
+        for name, count in sorted(errors.items()):
+            self.stdout.write(self.style.WARNING(f'{name}: {count}'))
@@ -1,8 +1,17 @@
 """
 AI Assistant services using Gemini API
 """
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from collections import OrderedDict
+
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from django.conf import settings
+from django.core.cache import cache
 from django.utils.translation import gettext as _
 from apps.crm.models import Contact, Company, Deal, Task
 import json
@@ -10,13 +19,363 @@ import json
 # Configure Gemini
 genai.configure(api_key=settings.GEMINI_API_KEY)
 
+GEMINI_MODEL = 'gemini-2.5-flash-lite'
+
+# Responses to deterministic prompts (deal analysis, drafts, template texts)
+AI_RESPONSE_CACHE_TIMEOUT = getattr(settings, 'AI_RESPONSE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def response_cache_key(model_name, prompt, updated_at=None):
+    """
+    Cache key of a model response: a hash of the model and the prompt, plus
+    the ``updated_at`` of the record the prompt describes so that editing it
+    makes old responses unreachable.
+    """
+    source = '\0'.join([model_name, prompt, updated_at.isoformat() if updated_at else ''])
+    return 'ai:response:' + hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+
+# AI gateway
+#
+# Every model call goes through one process-wide gateway that runs on its own
+# event loop thread, so sync views (via generate()) and async views (via
+# agenerate()/astream()) share the same limits:
+#
+# - a global and a per-tenant semaphore cap concurrent upstream calls
+# - each attempt has a timeout, and so does waiting for a slot
+# - retryable failures are retried with jittered exponential backoff
+# - a circuit breaker fails fast while the upstream keeps failing
+#
+# AI_BACKEND = 'stub' swaps Gemini for a local fake (see StubBackend) so the
+# gateway can be exercised and load-tested without network access.
+
+AI_BACKEND = getattr(settings, 'AI_BACKEND', 'gemini')
+AI_MAX_CONCURRENCY = getattr(settings, 'AI_MAX_CONCURRENCY', 16)
+AI_TENANT_CONCURRENCY = getattr(settings, 'AI_TENANT_CONCURRENCY', 2)
+AI_REQUEST_TIMEOUT = getattr(settings, 'AI_REQUEST_TIMEOUT', 30)
+AI_MAX_RETRIES = getattr(settings, 'AI_MAX_RETRIES', 2)
+AI_RETRY_BACKOFF = getattr(settings, 'AI_RETRY_BACKOFF', 0.5)
+AI_BREAKER_THRESHOLD = getattr(settings, 'AI_BREAKER_THRESHOLD', 5)
+AI_BREAKER_COOLDOWN = getattr(settings, 'AI_BREAKER_COOLDOWN', 30)
+AI_STUB_LATENCY = getattr(settings, 'AI_STUB_LATENCY', 0.2)
+AI_STUB_FAILURE_RATE = getattr(settings, 'AI_STUB_FAILURE_RATE', 0.0)
+
+RETRYABLE_ERRORS = (
+    asyncio.TimeoutError,
+    ConnectionError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.InternalServerError,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+)
+
+
+class AIGatewayError(Exception):
+    """The AI gateway could not get a response"""
+
+
+class AIGatewayBusy(AIGatewayError):
+    """No concurrency slot became free in time"""
+
+
+class AICircuitOpen(AIGatewayError):
+    """The upstream is failing; calls are rejected until the cooldown ends"""
+
+
+class AIStreamInterrupted(AIGatewayError):
+    """A response stream failed after chunks were already delivered"""
+
+
+class StubBackendError(ConnectionError):
+    """Simulated transient upstream failure of the stub backend"""
+
+
+class GeminiBackend:
+    """Gemini via google-generativeai's asyncio API"""
+    
+    def __init__(self):
+        self._models = {}
+    
+    def _model(self, model_name):
+        if model_name not in self._models:
+            self._models[model_name] = genai.GenerativeModel(model_name)
+        return self._models[model_name]
+    
+    async def generate(self, model_name, prompt):
+        response = await self._model(model_name).generate_content_async(prompt)
+        return response.text
+    
+    async def stream(self, model_name, prompt):
+        response = await self._model(model_name).generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            try:
+                text = chunk.text
+            except ValueError:
+                # Chunk without text parts (e.g. only safety ratings)
+                continue
+            if text:
+                yield text
+
+
+class StubBackend:
+    """
+    Local stand-in for Gemini: answers after a jittered delay and fails a
+    configurable share of calls with a retryable error.
+    """
+    
+    def __init__(self, latency=AI_STUB_LATENCY, failure_rate=AI_STUB_FAILURE_RATE):
+        self.latency = latency
+        self.failure_rate = failure_rate
+    
+    async def _respond(self, model_name, prompt):
+        await asyncio.sleep(random.uniform(0.5, 1.5) * self.latency)
+        if random.random() < self.failure_rate:
+            raise StubBackendError('Simulated upstream failure')
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()[:12]
+        return f"Stub response from {model_name} for prompt {digest}."
+    
+    async def generate(self, model_name, prompt):
+        return await self._respond(model_name, prompt)
+    
+    async def stream(self, model_name, prompt):
+        text = await self._respond(model_name, prompt)
+        for word in text.split(' '):
+            await asyncio.sleep(self.latency / 20)
+            yield word + ' '
+
+
+class CircuitBreaker:
+    """
+    Opens after ``threshold`` consecutive failures; after ``cooldown`` seconds
+    a single trial call is let through and closes it again on success.
+    """
+    
+    def __init__(self, threshold=AI_BREAKER_THRESHOLD, cooldown=AI_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.trips = 0
+    
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return 'half-open'
+        return 'open'
+    
+    def allow(self):
+        """Return 'call', 'trial' (the half-open probe) or None when rejected"""
+        state = self.state
+        if state == 'closed':
+            return 'call'
+        if state == 'half-open' and not self.trial_running:
+            self.trial_running = True
+            return 'trial'
+        return None
+    
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+    
+    def record_failure(self):
+        self.failures += 1
+        if self.trial_running or (self.opened_at is None and self.failures >= self.threshold):
+            self.trips += 1
+            self.opened_at = time.monotonic()
+        self.trial_running = False
+    
+    def cancel_trial(self):
+        """The probe ended without telling anything about the upstream"""
+        self.trial_running = False
+
+
+class AIGateway:
+    """Rate-limited, fault-tolerant access to the model backend"""
+    
+    def __init__(self, backend=None, max_concurrency=AI_MAX_CONCURRENCY, tenant_concurrency=AI_TENANT_CONCURRENCY,
+                 timeout=AI_REQUEST_TIMEOUT, max_retries=AI_MAX_RETRIES, backoff=AI_RETRY_BACKOFF, breaker=None):
+        self.backend = backend or (StubBackend() if AI_BACKEND == 'stub' else GeminiBackend())
+        self.max_concurrency = max_concurrency
+        self.tenant_concurrency = tenant_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker()
+        self.stats = {'requests': 0, 'retries': 0, 'failures': 0, 'rejected': 0}
+        
+        self._loop = None
+        self._lock = threading.Lock()
+        self._global_slots = None
+        self._tenant_slots = OrderedDict()
+    
+    # Event loop ------------------------------------------------------------
+    
+    def _get_loop(self):
+        """The gateway's event loop, started on first use (after any fork)"""
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name='ai-gateway', daemon=True).start()
+                self._loop = loop
+            return self._loop
+    
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._get_loop())
+    
+    # Runs on the gateway loop ---------------------------------------------
+    
+    def _tenant_semaphore(self, tenant):
+        semaphore = self._tenant_slots.get(tenant)
+        if semaphore is None:
+            semaphore = self._tenant_slots[tenant] = asyncio.Semaphore(self.tenant_concurrency)
+            # Forget idle tenants
+            while len(self._tenant_slots) > 1024:
+                oldest, oldest_semaphore = next(iter(self._tenant_slots.items()))
+                if oldest_semaphore.locked():
+                    break
+                del self._tenant_slots[oldest]
+        self._tenant_slots.move_to_end(tenant)
+        return semaphore
+    
+    async def _acquire(self, semaphore):
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats['rejected'] += 1
+            raise AIGatewayBusy('AI service is busy, please try again shortly')
+    
+    async def _with_slots(self, tenant, call):
+        if self._global_slots is None:
+            self._global_slots = asyncio.Semaphore(self.max_concurrency)
+        tenant_slots = self._tenant_semaphore(tenant)
+        
+        # Tenant first, so one tenant's queue cannot hold global slots
+        await self._acquire(tenant_slots)
+        try:
+            await self._acquire(self._global_slots)
+            try:
+                return await call()
+            finally:
+                self._global_slots.release()
+        finally:
+            tenant_slots.release()
+    
+    def _retry_delay(self, attempt):
+        # Full jitter: spreads retries of concurrent callers apart
+        return random.uniform(0, self.backoff * 2 ** attempt)
+    
+    async def _call(self, tenant, call):
+        """Run ``call`` in a slot with circuit breaker bookkeeping and jittered retries"""
+        self.stats['requests'] += 1
+        for attempt in range(self.max_retries + 1):
+            allowed = self.breaker.allow()
+            if allowed is None:
+                self.stats['rejected'] += 1
+                raise AICircuitOpen('AI service is temporarily unavailable')
+            try:
+                result = await self._with_slots(tenant, call)
+            except (AIGatewayBusy, asyncio.CancelledError):
+                if allowed == 'trial':
+                    self.breaker.cancel_trial()
+                raise
+            except AIStreamInterrupted:
+                self.breaker.record_failure()
+                self.stats['failures'] += 1
+                raise
+            except RETRYABLE_ERRORS as e:
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    self.stats['failures'] += 1
+                    raise AIGatewayError(f'AI request failed: {e}') from e
+                self.stats['retries'] += 1
+                await asyncio.sleep(self._retry_delay(attempt))
+            except Exception:
+                # Non-retryable errors (invalid request, blocked prompt) come from a healthy upstream
+                self.breaker.record_success()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+    
+    async def _generate(self, prompt, tenant, model_name):
+        return await self._call(
+            tenant,
+            lambda: asyncio.wait_for(self.backend.generate(model_name, prompt), self.timeout),
+        )
+    
+    async def _stream(self, prompt, tenant, model_name, emit):
+        """Produce stream chunks through ``emit``; retried only until the first chunk"""
+        async def relay():
+            chunks = self.backend.stream(model_name, prompt).__aiter__()
+            started = False
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), self.timeout)
+                except StopAsyncIteration:
+                    return
+                except RETRYABLE_ERRORS as e:
+                    if started:
+                        raise AIStreamInterrupted(f'AI stream was interrupted: {e}') from e
+                    raise
+                started = True
+                emit('chunk', chunk)
+        
+        try:
+            await self._call(tenant, relay)
+            emit('end', None)
+        except Exception as e:
+            emit('error', e)
+    
+    # Public API -------------------------------------------------------------
+    
+    def generate(self, prompt, tenant=None, model_name=GEMINI_MODEL):
+        """Blocking call for sync code; raises AIGatewayError"""
+        return self._submit(self._generate(prompt, tenant, model_name)).result()
+    
+    async def agenerate(self, prompt, tenant=None, model_name=GEMINI_MODEL):
+        """Awaitable call for async code; raises AIGatewayError"""
+        return await asyncio.wrap_future(self._submit(self._generate(prompt, tenant, model_name)))
+    
+    async def astream(self, prompt, tenant=None, model_name=GEMINI_MODEL):
+        """Async generator of response chunks for async code; raises AIGatewayError"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        
+        def emit(kind, value):
+            loop.call_soon_threadsafe(queue.put_nowait, (kind, value))
+        
+        future = self._submit(self._stream(prompt, tenant, model_name, emit))
+        try:
+            while True:
+                kind, value = await queue.get()
+                if kind == 'chunk':
+                    yield value
+                elif kind == 'error':
+                    raise value
+                else:
+                    return
+        finally:
+            future.cancel()
+
+
+gateway = AIGateway()
+
 
 class GeminiAssistant:
-    """Gemini AI Assistant for CRM"""
+    """
+    Gemini AI Assistant for CRM
+    
+    Failed model calls raise (AIGatewayError) instead of returning an error
+    text, so callers can refund the AI request they charged.
+    """
     
     def __init__(self, user):
         self.user = user
-        self.model = genai.GenerativeModel('gemini-2.5-flash-lite')
+        self.model_name = GEMINI_MODEL
     
     def get_crm_context(self):
         """Get relevant CRM data as context"""
@@ -39,32 +398,54 @@ Always respond in a professional yet friendly tone.
     
     def chat(self, message, conversation_history=None):
         """Send a message to Gemini and get response"""
-        try:
-            # Build conversation context
-            context = self.get_crm_context()
-            
-            # Build message history
-            if conversation_history:
-                messages = [{'role': msg.role, 'parts': [msg.content]} 
-                           for msg in conversation_history]
-            else:
-                messages = []
-            
-            # Add system context
-            full_prompt = f"{context}\n\nUser: {message}"
-            
-            # Generate response
-            response = self.model.generate_content(full_prompt)
-            
-            return response.text
+        # Build message history
+        if conversation_history:
+            messages = [{'role': msg.role, 'parts': [msg.content]} 
+                       for msg in conversation_history]
+        else:
+            messages = []
         
-        except Exception as e:
-            return f"{_('Error communicating with AI')}: {str(e)}"
+        # Add system context
+        full_prompt = self.build_chat_prompt(message)
+        
+        # Generate response
+        return self._generate(full_prompt)
     
-    def generate_email_draft(self, contact, purpose):
-        """Generate email draft for a contact"""
-        try:
-            prompt = f"""
+    def _generate(self, prompt):
+        """Model response for a prompt through the AI gateway; raises AIGatewayError"""
+        return gateway.generate(prompt, tenant=self.user.pk, model_name=self.model_name)
+    
+    def build_chat_prompt(self, message):
+        """Chat prompt with the CRM context (queries the database, call from sync code)"""
+        return f"{self.get_crm_context()}\n\nUser: {message}"
+    
+    async def chat_stream(self, prompt):
+        """
+        Stream the response to a chat prompt.
+        
+        Async generator yielding text chunks as the model produces them;
+        errors (AIGatewayError) are raised to the caller.
+        """
+        async for text in gateway.astream(prompt, tenant=self.user.pk, model_name=self.model_name):
+            yield text
+    
+    def get_cached_response(self, prompt, updated_at=None):
+        """Cached response to a prompt, or None"""
+        return cache.get(response_cache_key(self.model_name, prompt, updated_at))
+    
+    def generate_cached(self, prompt, updated_at=None):
+        """Response to a deterministic prompt, from the cache when possible; errors are raised"""
+        key = response_cache_key(self.model_name, prompt, updated_at)
+        text = cache.get(key)
+        if text is None:
+            text = self._generate(prompt)
+            if text:
+                cache.set(key, text, AI_RESPONSE_CACHE_TIMEOUT)
+        return text
+    
+    def email_draft_prompt(self, contact, purpose):
+        """Prompt for generate_email_draft()"""
+        return f"""
 Generate a professional email for the following:
 Contact: {contact.full_name}
 Company: {contact.company.name if contact.company else 'N/A'}
@@ -74,17 +455,15 @@ Purpose: {purpose}
 Write a professional, personalized email that is friendly yet business-appropriate.
 Include a subject line.
 """
-            
-            response = self.model.generate_content(prompt)
-            return response.text
-        
-        except Exception as e:
-            return f"{_('Error generating email')}: {str(e)}"
     
-    def analyze_deal(self, deal):
-        """Analyze a deal and provide insights"""
-        try:
-            prompt = f"""
+    def generate_email_draft(self, contact, purpose):
+        """Generate email draft for a contact"""
+        prompt = self.email_draft_prompt(contact, purpose)
+        return self.generate_cached(prompt, contact.updated_at)
+    
+    def deal_analysis_prompt(self, deal):
+        """Prompt for analyze_deal()"""
+        return f"""
 Analyze this sales deal and provide insights:
 
 Deal: {deal.name}
@@ -99,40 +478,33 @@ Provide:
 2. Recommendations to improve win probability
 3. Suggested next actions
 """
-            
-            response = self.model.generate_content(prompt)
-            return response.text
-        
-        except Exception as e:
-            return f"{_('Error analyzing deal')}: {str(e)}"
+    
+    def analyze_deal(self, deal):
+        """Analyze a deal and provide insights"""
+        prompt = self.deal_analysis_prompt(deal)
+        return self.generate_cached(prompt, deal.updated_at)
     
     def suggest_tasks(self, deal=None, contact=None):
         """Suggest tasks based on context"""
-        try:
-            if deal:
-                context = f"Deal: {deal.name}, Stage: {deal.stage.name if deal.stage else 'N/A'}"
-            elif contact:
-                context = f"Contact: {contact.full_name}, Company: {contact.company.name if contact.company else 'N/A'}"
-            else:
-                context = "General CRM management"
-            
-            prompt = f"""
+        if deal:
+            context = f"Deal: {deal.name}, Stage: {deal.stage.name if deal.stage else 'N/A'}"
+        elif contact:
+            context = f"Contact: {contact.full_name}, Company: {contact.company.name if contact.company else 'N/A'}"
+        else:
+            context = "General CRM management"
+        
+        prompt = f"""
 Based on this context: {context}
 
 Suggest 3-5 specific, actionable tasks to help move things forward.
 Format as a numbered list with clear action items.
 """
-            
-            response = self.model.generate_content(prompt)
-            return response.text
         
-        except Exception as e:
-            return f"{_('Error generating tasks')}: {str(e)}"
+        return self._generate(prompt)
     
     def generate_template_content(self, template_type, style='professional'):
         """Generate content for invoice/offer templates"""
-        try:
-            prompt = f"""
+        prompt = f"""
 Generate {style} content for a {template_type} template.
 
 Include:
@@ -142,17 +514,12 @@ Include:
 
 Make it appropriate for a Bulgarian business context, but write in English.
 """
-            
-            response = self.model.generate_content(prompt)
-            return response.text
         
-        except Exception as e:
-            return f"{_('Error generating template content')}: {str(e)}"
+        return self.generate_cached(prompt)
     
     def generate_complete_template(self, user_prompt, template_type='invoice'):
         """Generate complete HTML/CSS template based on user description"""
-        try:
-            available_variables = """
+        available_variables = """
 Available template variables to use:
 - {{invoice_number}} or {{offer_number}} - Document number
 - {{invoice_date}} or {{offer_date}} - Document date
@@ -182,8 +549,8 @@ Available template variables to use:
 - {{payment_terms}} - Payment terms
 - {{bank_details}} - Bank account details
 """
-            
-            prompt = f"""
+        
+        prompt = f"""
 You are an expert web designer specializing in creating professional invoice and offer templates.
 
 User wants a {template_type} template with this description:
@@ -208,27 +575,21 @@ The template should be production-ready and beautiful.
 
 Make it match the user's description while maintaining professional quality.
 """
-            
-            response = self.model.generate_content(prompt)
-            
-            # Clean up the response - remove markdown code blocks if present
-            html_content = response.text.strip()
-            if html_content.startswith('```html'):
-                html_content = html_content[7:]
-            elif html_content.startswith('```'):
-                html_content = html_content[3:]
-            if html_content.endswith('```'):
-                html_content = html_content[:-3]
-            
-            return html_content.strip()
         
-        except Exception as e:
-            return f"{_('Error generating template')}: {str(e)}"
+        # Clean up the response - remove markdown code blocks if present
+        html_content = self._generate(prompt).strip()
+        if html_content.startswith('```html'):
+            html_content = html_content[7:]
+        elif html_content.startswith('```'):
+            html_content = html_content[3:]
+        if html_content.endswith('```'):
+            html_content = html_content[:-3]
+        
+        return html_content.strip()
     
     def refine_template(self, current_html, user_feedback):
         """Refine an existing template based on user feedback"""
-        try:
-            prompt = f"""
+        prompt = f"""
 You are an expert web designer. The user has a template and wants to improve it.
 
 Current HTML template:
@@ -245,32 +606,26 @@ Modify the template according to the user's feedback while maintaining:
 
 Return ONLY the complete modified HTML. Do NOT include explanations or markdown formatting.
 """
-            
-            response = self.model.generate_content(prompt)
-            
-            # Clean up the response
-            html_content = response.text.strip()
-            if html_content.startswith('```html'):
-                html_content = html_content[7:]
-            elif html_content.startswith('```'):
-                html_content = html_content[3:]
-            if html_content.endswith('```'):
-                html_content = html_content[:-3]
-            
-            return html_content.strip()
         
-        except Exception as e:
-            return f"{_('Error refining template')}: {str(e)}"
+        # Clean up the response
+        html_content = self._generate(prompt).strip()
+        if html_content.startswith('```html'):
+            html_content = html_content[7:]
+        elif html_content.startswith('```'):
+            html_content = html_content[3:]
+        if html_content.endswith('```'):
+            html_content = html_content[:-3]
+        
+        return html_content.strip()
     
     def smart_search(self, query):
         """Perform smart search across CRM data"""
-        try:
-            # Get relevant data
-            contacts = Contact.objects.filter(owner=self.user)[:10]
-            companies = Company.objects.filter(owner=self.user)[:10]
-            deals = Deal.objects.filter(owner=self.user)[:10]
-            
-            context = f"""
+        # Get relevant data
+        contacts = Contact.objects.filter(owner=self.user)[:10]
+        companies = Company.objects.filter(owner=self.user)[:10]
+        deals = Deal.objects.filter(owner=self.user)[:10]
+        
+        context = f"""
 Search query: {query}
 
 Available data:
@@ -280,12 +635,8 @@ Deals: {[f"{d.name} - {d.value} {d.currency}" for d in deals]}
 
 Provide relevant results and insights based on the query.
 """
-            
-            response = self.model.generate_content(context)
-            return response.text
         
-        except Exception as e:
-            return f"{_('Error performing search')}: {str(e)}"
+        return self._generate(context)
     
     def generate_email_template(self, user_prompt, template_type='custom'):
         """Generate email template based on user description"""
@@ -364,10 +715,8 @@ Make the design beautiful, professional, and aligned with the user's description
 Ensure all JSON is properly escaped.
 """
             
-            response = self.model.generate_content(prompt)
-            
             # Parse the JSON response
-            response_text = response.text.strip()
+            response_text = self._generate(prompt).strip()
             
             # Remove markdown code blocks if present
             if response_text.startswith('```json'):
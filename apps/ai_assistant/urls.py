@@ -5,6 +5,7 @@ app_name = 'ai_assistant'
 
 urlpatterns = [
     path('chat/', views.ai_chat, name='chat'),
+    path('chat/<int:conversation_id>/stream/', views.ai_chat_stream, name='chat_stream'),
     path('chat/new/', views.new_conversation, name='new_conversation'),
     path('chat/<int:conversation_id>/delete/', views.delete_conversation, name='delete_conversation'),
     
@@ -2,11 +2,18 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils.translation import gettext as _
-from django.http import JsonResponse
+from django.http import JsonResponse, HttpResponseNotAllowed, StreamingHttpResponse
+from django.urls import reverse
+from asgiref.sync import sync_to_async
 from .models import AIConversation, AIMessage, AISuggestion
 from .services import GeminiAssistant
+from .templatetags.markdown_extras import markdown_format
 from apps.crm.models import Contact, Deal
+import asyncio
 import json
+import logging
+
+logger = logging.getLogger(__name__)
 
 
 @login_required
@@ -33,6 +40,11 @@ def ai_chat(request):
         user_message = request.POST.get('message', '').strip()
         
         if user_message:
+            # Charge the request up front; the check above may be stale
+            if not subscription.consume_ai_request():
+                messages.warning(request, _('You have reached your AI request limit for this month. Please upgrade your plan.'))
+                return redirect('subscriptions:plans')
+            
             # Create user message
             AIMessage.objects.create(
                 conversation=conversation,
@@ -44,7 +56,13 @@ def ai_chat(request):
             assistant = GeminiAssistant(request.user)
             history = conversation.messages.all()[:10]  # Last 10 messages for context
             
-            ai_response = assistant.chat(user_message, history)
+            try:
+                ai_response = assistant.chat(user_message, history)
+            except Exception:
+                logger.exception("AI chat failed for user %s", request.user.pk)
+                subscription.refund_ai_request()
+                messages.error(request, _('Error communicating with AI. Please try again.'))
+                return redirect(f'/ai/chat/?conversation={conversation.id}')
             
             # Create assistant message
             AIMessage.objects.create(
@@ -58,9 +76,6 @@ def ai_chat(request):
                 conversation.title = user_message[:50]
                 conversation.save()
             
-            # Increment AI usage
-            subscription.increment_ai_usage()
-            
             return redirect(f'/ai/chat/?conversation={conversation.id}')
     
     return render(request, 'ai_assistant/chat.html', {
@@ -70,6 +85,119 @@ def ai_chat(request):
     })
 
 
+def _start_chat_stream(request, conversation_id, user_message):
+    """
+    Synchronous part of ai_chat_stream: authenticate, charge the AI request,
+    store the user message and build the prompt.
+    
+    Returns (error response, None, None) or (None, conversation, prompt).
+    """
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': _('Authentication required')}, status=401), None, None
+    
+    conversation = AIConversation.objects.filter(id=conversation_id, user=request.user).first()
+    if conversation is None:
+        return JsonResponse({'error': _('Conversation not found')}, status=404), None, None
+    
+    if not user_message:
+        return JsonResponse({'error': _('Message is required')}, status=400), None, None
+    
+    if not request.user.subscription.consume_ai_request():
+        return JsonResponse({
+            'error': _('You have reached your AI request limit for this month. Please upgrade your plan.'),
+            'redirect': reverse('subscriptions:plans'),
+        }, status=403), None, None
+    
+    AIMessage.objects.create(
+        conversation=conversation,
+        role='user',
+        content=user_message
+    )
+    
+    prompt = GeminiAssistant(request.user).build_chat_prompt(user_message)
+    return None, conversation, prompt
+
+
+@sync_to_async
+def _save_chat_reply(conversation, content, user_message):
+    """Persist the assembled assistant message"""
+    message = AIMessage.objects.create(
+        conversation=conversation,
+        role='assistant',
+        content=content
+    )
+    
+    # Update conversation title if it's the first message
+    if conversation.messages.count() == 2:  # user + assistant
+        conversation.title = user_message[:50]
+        conversation.save()
+    
+    return message
+
+
+@sync_to_async
+def _refund_ai_request(user):
+    """Give back the AI request charged for a reply that failed"""
+    user.subscription.refund_ai_request()
+
+
+def _sse(event, data):
+    """Format a server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _chat_events(assistant, conversation, prompt, user_message):
+    """Relay Gemini's streamed tokens as SSE and store the reply when complete"""
+    parts = []
+    try:
+        async for text in assistant.chat_stream(prompt):
+            parts.append(text)
+            yield _sse('token', {'text': text})
+        content = ''.join(parts)
+    except asyncio.CancelledError:
+        # Client went away; keep what was generated so far
+        if parts:
+            await _save_chat_reply(conversation, ''.join(parts), user_message)
+        else:
+            await _refund_ai_request(assistant.user)
+        raise
+    except Exception as e:
+        # Nothing usable was delivered: refund, and store no error text as a reply
+        logger.warning("AI chat stream failed for user %s: %s", assistant.user.pk, e)
+        await _refund_ai_request(assistant.user)
+        yield _sse('error', {'error': f"{_('Error communicating with AI')}: {str(e)}"})
+        return
+    
+    message = await _save_chat_reply(conversation, content, user_message)
+    yield _sse('done', {'id': message.id, 'html': markdown_format(content)})
+
+
+async def ai_chat_stream(request, conversation_id):
+    """
+    Stream an AI chat reply as server-sent events.
+    
+    Async view: under ASGI the response is relayed from Gemini's streaming
+    API on the event loop, so no worker thread is held while the model
+    generates. Database work runs in sync_to_async blocks before and after.
+    """
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    
+    user_message = request.POST.get('message', '').strip()
+    error, conversation, prompt = await sync_to_async(_start_chat_stream)(request, conversation_id, user_message)
+    if error is not None:
+        return error
+    
+    assistant = GeminiAssistant(request.user)
+    response = StreamingHttpResponse(
+        _chat_events(assistant, conversation, prompt, user_message),
+        content_type='text/event-stream'
+    )
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # disable proxy buffering
+    return response
+
+
 @login_required
 def ai_suggestions(request):
     """View AI suggestions"""
@@ -93,7 +221,21 @@ def generate_email(request, contact_id):
         purpose = request.POST.get('purpose', _('Follow-up'))
         
         assistant = GeminiAssistant(request.user)
-        email_draft = assistant.generate_email_draft(contact, purpose)
+        
+        # Cached drafts cost neither a Gemini call nor an AI request
+        cached = assistant.get_cached_response(assistant.email_draft_prompt(contact, purpose), contact.updated_at)
+        if cached is not None:
+            return JsonResponse({'success': True, 'email': cached})
+        
+        if not subscription.consume_ai_request():
+            return JsonResponse({'error': _('AI request limit reached')}, status=403)
+        
+        try:
+            email_draft = assistant.generate_email_draft(contact, purpose)
+        except Exception:
+            logger.exception("AI email draft failed for user %s", request.user.pk)
+            subscription.refund_ai_request()
+            return JsonResponse({'error': _('Error generating email. Please try again.')}, status=502)
         
         # Create suggestion
         AISuggestion.objects.create(
@@ -104,8 +246,6 @@ def generate_email(request, contact_id):
             related_contact_id=contact.id
         )
         
-        subscription.increment_ai_usage()
-        
         return JsonResponse({'success': True, 'email': email_draft})
     
     return render(request, 'ai_assistant/generate_email.html', {'contact': contact})
@@ -114,15 +254,30 @@ def generate_email(request, contact_id):
 @login_required
 def analyze_deal_view(request, deal_id):
     """Analyze deal with AI"""
+    deal = get_object_or_404(Deal, id=deal_id, owner=request.user)
+    
+    assistant = GeminiAssistant(request.user)
+    
+    # Reloading an unchanged deal reuses the cached analysis without charging
+    analysis = assistant.get_cached_response(assistant.deal_analysis_prompt(deal), deal.updated_at)
+    if analysis is not None:
+        return render(request, 'ai_assistant/deal_analysis.html', {
+            'deal': deal,
+            'analysis': analysis,
+        })
+    
     subscription = request.user.subscription
-    if not subscription.can_use_ai():
+    if not subscription.consume_ai_request():
         messages.warning(request, _('You have reached your AI request limit for this month.'))
         return redirect('subscriptions:plans')
     
-    deal = get_object_or_404(Deal, id=deal_id, owner=request.user)
-    
-    assistant = GeminiAssistant(request.user)
-    analysis = assistant.analyze_deal(deal)
+    try:
+        analysis = assistant.analyze_deal(deal)
+    except Exception:
+        logger.exception("AI deal analysis failed for user %s", request.user.pk)
+        subscription.refund_ai_request()
+        messages.error(request, _('Error analyzing deal. Please try again.'))
+        return redirect('crm:deal_detail', pk=deal.pk)
     
     # Create suggestion
     AISuggestion.objects.create(
@@ -133,8 +288,6 @@ def analyze_deal_view(request, deal_id):
         related_deal_id=deal.id
     )
     
-    subscription.increment_ai_usage()
-    
     return render(request, 'ai_assistant/deal_analysis.html', {
         'deal': deal,
         'analysis': analysis,
@@ -145,13 +298,16 @@ def analyze_deal_view(request, deal_id):
 def suggest_tasks_view(request):
     """Get AI task suggestions"""
     subscription = request.user.subscription
-    if not subscription.can_use_ai():
+    if not subscription.consume_ai_request():
         return JsonResponse({'error': _('AI request limit reached')}, status=403)
     
     assistant = GeminiAssistant(request.user)
-    suggestions = assistant.suggest_tasks()
-    
-    subscription.increment_ai_usage()
+    try:
+        suggestions = assistant.suggest_tasks()
+    except Exception:
+        logger.exception("AI task suggestions failed for user %s", request.user.pk)
+        subscription.refund_ai_request()
+        return JsonResponse({'error': _('Error generating tasks. Please try again.')}, status=502)
     
     return JsonResponse({'success': True, 'suggestions': suggestions})
 
@@ -0,0 +1,17 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import BasePermission
+from apps.subscriptions.snapshot import get_subscription_snapshot
+
+
+class HasAPIAccess(BasePermission):
+    """Allow users with an active subscription whose plan includes api_access"""
+
+    message = _('Your plan does not include API access. Please upgrade your plan.')
+
+    def has_permission(self, request, view):
+        if not request.user or not request.user.is_authenticated:
+            return False
+        subscription = get_subscription_snapshot(request._request)
+        if subscription.status in ['expired', 'cancelled']:
+            return False
+        return subscription.can_use_feature('api_access')
@@ -0,0 +1,261 @@
+"""
+Serializers for the REST API.
+
+Related records are written as primary keys that must belong to the
+requesting user and are read back with a denormalized display name, so a
+list page needs one query (see the select_related maps in views.py).
+List payloads go through BulkListSerializer, which validates all foreign
+keys with one query per relation and writes with bulk_create/bulk_update.
+"""
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from rest_framework import serializers
+from apps.crm.models import Company, Contact, Deal, Pipeline, Stage, Task
+from apps.invoices.models import Invoice, InvoiceItem, Payment
+
+BULK_BATCH_SIZE = 500
+
+
+def requested_fields(request):
+    """Field names of a ``?fields=a,b`` sparse fieldset, or None for all fields"""
+    if request is None or request.method != 'GET':
+        return None
+    fields = request.query_params.get('fields')
+    if not fields:
+        return None
+    return {name.strip() for name in fields.split(',') if name.strip()} | {'id'}
+
+
+class OwnedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Primary key of a record owned by the requesting user"""
+
+    def __init__(self, owner_lookup='owner', **kwargs):
+        self.owner_lookup = owner_lookup
+        kwargs.setdefault('allow_null', True)
+        kwargs.setdefault('required', False)
+        super().__init__(**kwargs)
+
+    def get_queryset(self):
+        return super().get_queryset().filter(**{self.owner_lookup: self.context['request'].user})
+
+    def to_internal_value(self, data):
+        preloaded = self.context.get('related_cache', {}).get(self.field_name)
+        if preloaded is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        if pk not in preloaded:
+            self.fail('does_not_exist', pk_value=data)
+        return preloaded[pk]
+
+
+class BulkListSerializer(serializers.ListSerializer):
+    """List serializer that validates and writes a whole batch at once"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self._preload_related(data)
+        if not (isinstance(data, list) and isinstance(self.instance, list)):
+            return super().to_internal_value(data)
+
+        # Bulk update: validate each item against its own record, as a
+        # single update would, rather than against the whole instance list
+        instances = {instance.pk: instance for instance in self.instance}
+        ret = []
+        errors = []
+        try:
+            for item in data:
+                self.child.instance = instances.get(item.get('id')) if isinstance(item, dict) else None
+                try:
+                    validated = self.child.run_validation(item)
+                except serializers.ValidationError as exc:
+                    errors.append(exc.detail)
+                else:
+                    ret.append(validated)
+                    errors.append({})
+        finally:
+            self.child.instance = self.instance
+        if any(errors):
+            raise serializers.ValidationError(errors)
+        return ret
+
+    def _preload_related(self, data):
+        """Fetch every referenced related record with one query per field"""
+        cache = self.context.setdefault('related_cache', {})
+        for name, field in self.child.fields.items():
+            if field.read_only or not isinstance(field, OwnedPrimaryKeyRelatedField):
+                continue
+            pks = set()
+            for item in data:
+                value = item.get(name) if isinstance(item, dict) else None
+                if value is None or isinstance(value, bool):
+                    continue
+                try:
+                    pks.add(int(value))
+                except (TypeError, ValueError):
+                    continue
+            cache[name] = field.get_queryset().in_bulk(pks) if pks else {}
+
+    def create(self, validated_data):
+        model = self.child.Meta.model
+        return model.objects.bulk_create(
+            [model(**attrs) for attrs in validated_data],
+            batch_size=BULK_BATCH_SIZE,
+        )
+
+    def update(self, instances, validated_data):
+        model = self.child.Meta.model
+        now = timezone.now()
+        fields = set()
+        for instance, attrs in zip(instances, validated_data):
+            for name, value in attrs.items():
+                setattr(instance, name, value)
+                fields.add(name)
+            instance.updated_at = now
+        model.objects.bulk_update(instances, sorted(fields | {'updated_at'}), batch_size=BULK_BATCH_SIZE)
+        return instances
+
+
+class OwnedModelSerializer(serializers.ModelSerializer):
+    """
+    Base serializer for owner-scoped records.
+
+    Supports sparse fieldsets (``?fields=``) and makes the fields listed in
+    ``Meta.update_read_only_fields`` read-only once the record exists.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = requested_fields(self.context.get('request'))
+        if keep is not None:
+            for name in list(self.fields):
+                if name not in keep:
+                    self.fields.pop(name)
+        if self.instance is not None:
+            for name in getattr(self.Meta, 'update_read_only_fields', ()):
+                if name in self.fields:
+                    self.fields[name].read_only = True
+                    self.fields[name].required = False
+
+    class Meta:
+        list_serializer_class = BulkListSerializer
+        read_only_fields = ['id', 'created_at', 'updated_at']
+
+
+class CompanySerializer(OwnedModelSerializer):
+
+    class Meta(OwnedModelSerializer.Meta):
+        model = Company
+        fields = [
+            'id', 'name', 'website', 'industry', 'employees', 'annual_revenue',
+            'phone', 'email', 'address', 'city', 'country', 'postal_code',
+            'vat_number', 'notes', 'tags', 'created_at', 'updated_at',
+        ]
+
+
+class ContactSerializer(OwnedModelSerializer):
+    company = OwnedPrimaryKeyRelatedField(queryset=Company.objects.all())
+    company_name = serializers.CharField(source='company.name', read_only=True, allow_null=True)
+    full_name = serializers.CharField(read_only=True)
+
+    class Meta(OwnedModelSerializer.Meta):
+        model = Contact
+        fields = [
+            'id', 'company', 'company_name', 'first_name', 'last_name', 'full_name',
+            'position', 'email', 'phone', 'mobile', 'address', 'city', 'country',
+            'postal_code', 'birthday', 'notes', 'tags', 'linkedin', 'twitter',
+            'facebook', 'is_active', 'created_at', 'updated_at',
+        ]
+
+
+class DealSerializer(OwnedModelSerializer):
+    contact = OwnedPrimaryKeyRelatedField(queryset=Contact.objects.all())
+    company = OwnedPrimaryKeyRelatedField(queryset=Company.objects.all())
+    pipeline = OwnedPrimaryKeyRelatedField(queryset=Pipeline.objects.all())
+    stage = OwnedPrimaryKeyRelatedField(queryset=Stage.objects.all(), owner_lookup='pipeline__owner')
+    contact_name = serializers.CharField(source='contact.full_name', read_only=True, allow_null=True)
+    company_name = serializers.CharField(source='company.name', read_only=True, allow_null=True)
+    stage_name = serializers.CharField(source='stage.name', read_only=True, allow_null=True)
+
+    class Meta(OwnedModelSerializer.Meta):
+        model = Deal
+        fields = [
+            'id', 'contact', 'contact_name', 'company', 'company_name', 'name',
+            'description', 'value', 'currency', 'pipeline', 'stage', 'stage_name',
+            'status', 'probability', 'expected_close_date', 'actual_close_date',
+            'lost_reason', 'notes', 'tags', 'created_at', 'updated_at',
+        ]
+
+    def validate(self, attrs):
+        pipeline = attrs.get('pipeline')
+        if pipeline is None and isinstance(self.instance, Deal):
+            pipeline = self.instance.pipeline
+        stage = attrs.get('stage')
+        if stage is not None and pipeline is not None and stage.pipeline_id != pipeline.pk:
+            raise serializers.ValidationError({'stage': _('Stage does not belong to the selected pipeline.')})
+        return attrs
+
+
+class TaskSerializer(OwnedModelSerializer):
+    contact = OwnedPrimaryKeyRelatedField(queryset=Contact.objects.all())
+    company = OwnedPrimaryKeyRelatedField(queryset=Company.objects.all())
+    deal = OwnedPrimaryKeyRelatedField(queryset=Deal.objects.all())
+    contact_name = serializers.CharField(source='contact.full_name', read_only=True, allow_null=True)
+    company_name = serializers.CharField(source='company.name', read_only=True, allow_null=True)
+    deal_name = serializers.CharField(source='deal.name', read_only=True, allow_null=True)
+
+    class Meta(OwnedModelSerializer.Meta):
+        model = Task
+        fields = [
+            'id', 'assigned_to', 'contact', 'contact_name', 'company', 'company_name',
+            'deal', 'deal_name', 'title', 'description', 'task_type', 'priority',
+            'due_date', 'completed', 'completed_at', 'created_at', 'updated_at',
+        ]
+        read_only_fields = OwnedModelSerializer.Meta.read_only_fields + ['assigned_to']
+
+
+class InvoiceItemSerializer(serializers.ModelSerializer):
+
+    class Meta:
+        model = InvoiceItem
+        fields = ['id', 'description', 'quantity', 'unit_price', 'total', 'order']
+
+
+class InvoiceSerializer(OwnedModelSerializer):
+    contact = OwnedPrimaryKeyRelatedField(queryset=Contact.objects.all())
+    company = OwnedPrimaryKeyRelatedField(queryset=Company.objects.all())
+    items = InvoiceItemSerializer(many=True, read_only=True)
+
+    class Meta(OwnedModelSerializer.Meta):
+        model = Invoice
+        fields = [
+            'id', 'contact', 'company', 'invoice_number', 'invoice_date', 'due_date',
+            'client_name', 'client_email', 'client_address', 'client_vat_number',
+            'currency', 'subtotal', 'tax_rate', 'tax_amount', 'total_amount',
+            'paid_amount', 'status', 'payment_url', 'notes', 'terms', 'email_sent',
+            'email_sent_at', 'items', 'created_at', 'updated_at',
+        ]
+        read_only_fields = OwnedModelSerializer.Meta.read_only_fields + [
+            'subtotal', 'tax_amount', 'total_amount', 'paid_amount', 'email_sent', 'email_sent_at',
+        ]
+        # Items are managed in the web UI; totals follow them
+        update_read_only_fields = ['invoice_number']
+
+
+class PaymentSerializer(OwnedModelSerializer):
+    invoice = OwnedPrimaryKeyRelatedField(queryset=Invoice.objects.all())
+    invoice_number = serializers.CharField(source='invoice.invoice_number', read_only=True, allow_null=True)
+
+    class Meta(OwnedModelSerializer.Meta):
+        model = Payment
+        fields = [
+            'id', 'invoice', 'invoice_number', 'payment_date', 'amount', 'currency',
+            'payment_method', 'reference', 'notes', 'is_matched', 'created_at', 'updated_at',
+        ]
+        read_only_fields = OwnedModelSerializer.Meta.read_only_fields + ['is_matched']
+        # The amount was booked on the invoice when the payment was created
+        update_read_only_fields = ['invoice', 'amount', 'currency']
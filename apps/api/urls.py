@@ -0,0 +1,14 @@
+from rest_framework.routers import DefaultRouter
+from . import views
+
+app_name = 'api'
+
+router = DefaultRouter()
+router.register('companies', views.CompanyViewSet, basename='company')
+router.register('contacts', views.ContactViewSet, basename='contact')
+router.register('deals', views.DealViewSet, basename='deal')
+router.register('tasks', views.TaskViewSet, basename='task')
+router.register('invoices', views.InvoiceViewSet, basename='invoice')
+router.register('payments', views.PaymentViewSet, basename='payment')
+
+urlpatterns = router.urls
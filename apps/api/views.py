@@ -0,0 +1,306 @@
+"""
+REST API views.
+
+Every endpoint is scoped to the requesting user's records and requires the
+``api_access`` plan feature. Lists use keyset (cursor) pagination and
+support ``?fields=`` and ``?updated_since=``. GET responses carry a weak
+ETag derived from the row count and the newest ``updated_at`` of the
+filtered queryset (or of the single record) and of every related table
+whose names the response includes, so clients that poll with
+If-None-Match get a 304 from one aggregate query without any rows being
+loaded or serialized. Invoice items need no term of their own: every item
+write recalculates the invoice totals, which bumps the invoice.
+
+``/<resource>/bulk/`` creates (POST) or partially updates (PATCH) up to
+API_BULK_MAX_SIZE records in one transaction with bulk_create/bulk_update.
+Bulk writes skip model signals, so the views refresh search documents and
+cached stats themselves.
+"""
+import hashlib
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max
+from django.utils.dateparse import parse_datetime
+from django.utils.translation import gettext as _
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from rest_framework.versioning import URLPathVersioning
+from apps.crm.models import Company, Contact, Deal, Stage
+from apps.crm.search import index_queryset
+from apps.crm.stats import invalidate_dashboard_stats
+from apps.invoices.matching import apply_linked_payments, match_payments
+from apps.invoices.models import Payment
+from apps.subscriptions.snapshot import get_subscription_snapshot, invalidate_subscription_snapshot
+from .pagination import IdCursorPagination
+from .permissions import HasAPIAccess
+from .serializers import (
+    CompanySerializer, ContactSerializer, DealSerializer, InvoiceSerializer,
+    PaymentSerializer, TaskSerializer, requested_fields,
+)
+
+API_BULK_MAX_SIZE = 500
+
+
+class APIVersioning(URLPathVersioning):
+    default_version = 'v1'
+    allowed_versions = ['v1']
+
+
+class OwnedModelViewSet(viewsets.ModelViewSet):
+    """
+    CRUD, bulk writes and conditional GETs for one owner-scoped model.
+
+    ``related_fields`` maps serializer fields to the relation they read
+    (for select_related); relations whose fields are left out of a sparse
+    fieldset are not joined.
+    """
+    permission_classes = [IsAuthenticated, HasAPIAccess]
+    versioning_class = APIVersioning
+    pagination_class = IdCursorPagination
+
+    related_fields = {}
+    prefetch_fields = {}
+
+    def owned_queryset(self):
+        return self.serializer_class.Meta.model.objects.filter(owner=self.request.user)
+
+    def selected_relations(self):
+        """Relations whose denormalized fields are part of the response"""
+        fields = requested_fields(self.request)
+        return sorted({relation for name, relation in self.related_fields.items() if fields is None or name in fields})
+
+    def get_queryset(self):
+        queryset = self.owned_queryset()
+
+        fields = requested_fields(self.request)
+        select = self.selected_relations()
+        prefetch = {relation for name, relation in self.prefetch_fields.items() if fields is None or name in fields}
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*sorted(prefetch))
+
+        updated_since = self.request.query_params.get('updated_since')
+        if updated_since:
+            since = parse_datetime(updated_since)
+            if since is None:
+                raise ValidationError({'updated_since': _('Enter a valid ISO 8601 date/time.')})
+            queryset = queryset.filter(updated_at__gte=since)
+
+        return queryset
+
+    # Conditional GET
+
+    def _etag(self, *parts):
+        digest = hashlib.sha256('|'.join(str(part) for part in parts).encode()).hexdigest()[:32]
+        return f'W/"{digest}"'
+
+    def _not_modified(self, etag):
+        header = self.request.headers.get('If-None-Match', '')
+        return header.strip() == '*' or etag in (tag.strip() for tag in header.split(','))
+
+    def list_state(self, queryset):
+        """Values that change whenever the list response does, from one aggregate query"""
+        model = queryset.model
+        aggregates = {'count': Count('pk'), 'latest': Max('updated_at')}
+        for relation in self.selected_relations():
+            # The count catches links cleared by SET_NULL, which leave updated_at alone
+            aggregates[f'{relation}_count'] = Count(relation)
+            related_model = model._meta.get_field(relation).related_model
+            if any(field.name == 'updated_at' for field in related_model._meta.concrete_fields):
+                aggregates[f'{relation}_latest'] = Max(f'{relation}__updated_at')
+        state = queryset.order_by().aggregate(**aggregates)
+        return [state[key] for key in sorted(state)]
+
+    def instance_state(self, instance):
+        """Values that change whenever the detail response does"""
+        state = [instance.updated_at]
+        for relation in self.selected_relations():
+            related = getattr(instance, relation)
+            state.append(getattr(related, 'updated_at', related.pk) if related is not None else None)
+        return state
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        etag = self._etag(request.user.pk, request.get_full_path(), *self.list_state(queryset))
+        if self._not_modified(etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        response = super().list(request, *args, **kwargs)
+        response['ETag'] = etag
+        return response
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        etag = self._etag(request.user.pk, request.get_full_path(), *self.instance_state(instance))
+        if self._not_modified(etag):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+
+        response = Response(self.get_serializer(instance).data)
+        response['ETag'] = etag
+        return response
+
+    # Writes
+
+    def check_create_allowed(self, count):
+        """Raise PermissionDenied if ``count`` new records are not allowed"""
+
+    def perform_create(self, serializer):
+        self.check_create_allowed(1)
+        serializer.save(owner=self.request.user)
+
+    def after_bulk_write(self, objects, created, fields):
+        """
+        Do what the model signals would have done for ``objects``.
+
+        ``fields`` is the set of fields written by a bulk update.
+        """
+        invalidate_dashboard_stats(self.request.user.pk)
+
+    def _save_bulk(self, serializer, created, **kwargs):
+        try:
+            with transaction.atomic():
+                objects = serializer.save(**kwargs)
+        except IntegrityError:
+            raise ValidationError(_('The batch conflicts with existing records (duplicate unique values).'))
+        fields = set().union(*serializer.validated_data)
+        self.after_bulk_write(objects, created, fields)
+        return objects
+
+    @action(detail=False, methods=['post', 'patch'], url_path='bulk')
+    def bulk(self, request, *args, **kwargs):
+        """Create (POST) or partially update (PATCH) a list of records"""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError(_('Expected a non-empty list of objects.'))
+        if len(items) > API_BULK_MAX_SIZE:
+            raise ValidationError(_('At most %(max)d objects can be written at once.') % {'max': API_BULK_MAX_SIZE})
+
+        if request.method == 'POST':
+            serializer = self.get_serializer(data=items, many=True)
+            serializer.is_valid(raise_exception=True)
+            self.check_create_allowed(len(items))
+            objects = self._save_bulk(serializer, created=True, owner=request.user)
+            response_status = status.HTTP_201_CREATED
+        else:
+            ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+            if not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+                raise ValidationError(_('Every object needs an integer "id".'))
+            if len(set(ids)) != len(ids):
+                raise ValidationError(_('Each id can appear only once per batch.'))
+
+            instances = self.owned_queryset().in_bulk(ids)
+            missing = [pk for pk in ids if pk not in instances]
+            if missing:
+                raise ValidationError({'id': _('Not found: %(ids)s') % {'ids': ', '.join(map(str, missing))}})
+
+            serializer = self.get_serializer([instances[pk] for pk in ids], data=items, many=True, partial=True)
+            serializer.is_valid(raise_exception=True)
+            objects = self._save_bulk(serializer, created=False)
+            response_status = status.HTTP_200_OK
+
+        # Reload with the list queryset so related names cost one query
+        saved = self.get_queryset().filter(pk__in=[obj.pk for obj in objects]).order_by('pk')
+        return Response(self.get_serializer(saved, many=True).data, status=response_status)
+
+
+class CompanyViewSet(OwnedModelViewSet):
+    serializer_class = CompanySerializer
+
+    def after_bulk_write(self, objects, created, fields):
+        super().after_bulk_write(objects, created, fields)
+        ids = [obj.pk for obj in objects]
+        index_queryset(Company.objects.filter(pk__in=ids))
+        if not created:
+            index_queryset(Contact.objects.filter(company__in=ids))
+            index_queryset(Deal.objects.filter(company__in=ids))
+
+
+class ContactViewSet(OwnedModelViewSet):
+    serializer_class = ContactSerializer
+    related_fields = {'company_name': 'company'}
+
+    def check_create_allowed(self, count):
+        limit = get_subscription_snapshot(self.request._request).get_plan_config().get('contacts_limit', 0)
+        if limit == -1:  # unlimited
+            return
+        if Contact.objects.filter(owner=self.request.user).count() + count > limit:
+            raise PermissionDenied(_('You have reached the contacts limit of your plan. Please upgrade your plan.'))
+
+    def after_bulk_write(self, objects, created, fields):
+        super().after_bulk_write(objects, created, fields)
+        ids = [obj.pk for obj in objects]
+        index_queryset(Contact.objects.filter(pk__in=ids))
+        if created:
+            invalidate_subscription_snapshot(self.request.user.pk)
+        else:
+            index_queryset(Deal.objects.filter(contact__in=ids))
+
+
+class DealViewSet(OwnedModelViewSet):
+    serializer_class = DealSerializer
+    related_fields = {'contact_name': 'contact', 'company_name': 'company', 'stage_name': 'stage'}
+
+    def list_state(self, queryset):
+        state = super().list_state(queryset)
+        if 'stage' in self.selected_relations():
+            # Stages have no updated_at; the owner's few stage names stand in for it
+            stages = Stage.objects.filter(pipeline__owner=self.request.user).order_by('pk')
+            state.append(list(stages.values_list('pk', 'name')))
+        return state
+
+    def instance_state(self, instance):
+        state = super().instance_state(instance)
+        if 'stage' in self.selected_relations():
+            state.append(instance.stage.name if instance.stage_id else None)
+        return state
+
+    def after_bulk_write(self, objects, created, fields):
+        super().after_bulk_write(objects, created, fields)
+        index_queryset(Deal.objects.filter(pk__in=[obj.pk for obj in objects]))
+
+
+class TaskViewSet(OwnedModelViewSet):
+    serializer_class = TaskSerializer
+    related_fields = {'contact_name': 'contact', 'company_name': 'company', 'deal_name': 'deal'}
+
+
+class InvoiceViewSet(OwnedModelViewSet):
+    serializer_class = InvoiceSerializer
+    prefetch_fields = {'items': 'items'}
+
+    def perform_update(self, serializer):
+        invoice = serializer.save()
+        if 'tax_rate' in serializer.validated_data:
+            invoice.calculate_totals()
+
+    def after_bulk_write(self, objects, created, fields):
+        super().after_bulk_write(objects, created, fields)
+        if 'tax_rate' in fields and not created:
+            # New invoices have no items yet, so only updated ones need totals
+            for invoice in objects:
+                invoice.calculate_totals()
+
+
+class PaymentViewSet(OwnedModelViewSet):
+    serializer_class = PaymentSerializer
+    related_fields = {'invoice_number': 'invoice'}
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self._book([serializer.instance])
+
+    def after_bulk_write(self, objects, created, fields):
+        super().after_bulk_write(objects, created, fields)
+        if created:
+            self._book(objects)
+
+    def _book(self, payments):
+        """Book payments on their invoice, or try to match the unlinked ones"""
+        apply_linked_payments(payments)
+        unlinked = [payment.pk for payment in payments if not payment.invoice_id]
+        if unlinked:
+            match_payments(Payment.objects.filter(pk__in=unlinked))
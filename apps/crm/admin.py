@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Company, Contact, Pipeline, Stage, Deal, Task, Activity, CustomField
+from .models import Company, Contact, Pipeline, Stage, Deal, Task, Activity, CustomField, ImportJob, ExportJob
 
 
 @admin.register(Company)
@@ -62,3 +62,20 @@ class CustomFieldAdmin(admin.ModelAdmin):
     list_filter = ('entity_type', 'field_type', 'is_required')
     ordering = ('entity_type', 'order')
 
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = ('original_name', 'entity_type', 'status', 'processed_rows', 'created_count', 'error_count', 'owner', 'created_at')
+    list_filter = ('entity_type', 'status', 'created_at')
+    search_fields = ('original_name', 'owner__email')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
+    ordering = ('-created_at',)
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('export_type', 'status', 'row_count', 'owner', 'created_at', 'finished_at')
+    list_filter = ('export_type', 'status', 'created_at')
+    search_fields = ('owner__email',)
+    readonly_fields = ('created_at', 'finished_at')
+    ordering = ('-created_at',)
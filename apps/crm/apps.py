@@ -6,3 +6,5 @@ class CrmConfig(AppConfig):
     name = 'apps.crm'
     verbose_name = 'CRM'
 
+    def ready(self):
+        from . import signals  # noqa: F401
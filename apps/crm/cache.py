@@ -0,0 +1,80 @@
+"""
+Shared caching helpers.
+
+Cached values live under per-owner namespaces: every key embeds a version
+number stored alongside the data, and invalidating a namespace just bumps
+that version so all of the owner's old keys become unreachable at once and
+expire on their own. Aliases (see CACHES in config/settings.py):
+
+- ``default``: namespaced data such as dashboard snapshots
+- ``fragments``: rendered page fragments
+- ``ratelimit``: request counters for rate_limit()
+- ``sessions``: Django sessions (cached_db backend)
+"""
+import time
+
+from django.core.cache import caches
+
+FRAGMENTS = 'fragments'
+RATELIMIT = 'ratelimit'
+
+
+def _version_key(namespace, owner_id):
+    return f'ns:{namespace}:{owner_id if owner_id is not None else "global"}'
+
+
+def namespace_version(namespace, owner_id=None, alias='default'):
+    """Current version of an owner's (or the global) namespace"""
+    cache = caches[alias]
+    key = _version_key(namespace, owner_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from a timestamp so a lost version key never revives old entries
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_namespace(namespace, owner_id=None, alias='default'):
+    """Make every key of an owner's namespace unreachable"""
+    cache = caches[alias]
+    key = _version_key(namespace, owner_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def namespaced_key(namespace, *parts, owner_id=None, alias='default'):
+    """Cache key for ``parts`` inside the current version of a namespace"""
+    version = namespace_version(namespace, owner_id, alias)
+    owner = owner_id if owner_id is not None else 'global'
+    return ':'.join([namespace, str(owner), f'v{version}', *(str(part) for part in parts)])
+
+
+def get_or_compute(namespace, parts, compute, timeout, owner_id=None, alias='default'):
+    """Return the cached value for ``parts`` or store the result of ``compute()``"""
+    cache = caches[alias]
+    key = namespaced_key(namespace, *parts, owner_id=owner_id, alias=alias)
+    value = cache.get(key)
+    if value is None:
+        value = compute()
+        cache.set(key, value, timeout)
+    return value
+
+
+def rate_limit(key, limit, period):
+    """
+    Count a request against ``key``; return False once ``limit`` requests
+    were made within ``period`` seconds (fixed window, atomic on Redis).
+    """
+    cache = caches[RATELIMIT]
+    cache_key = f'rl:{key}'
+    cache.add(cache_key, 0, period)
+    try:
+        count = cache.incr(cache_key)
+    except ValueError:
+        # Window expired between add() and incr()
+        cache.set(cache_key, 1, period)
+        count = 1
+    return count <= limit
@@ -0,0 +1,235 @@
+"""
+Streaming CSV export of CRM and invoice data.
+
+Rows come from ``values_list(...).iterator(chunk_size=EXPORT_CHUNK_SIZE)``
+with the related names joined in the same query. No model instances are
+built, and PostgreSQL uses a server-side cursor, so memory use stays flat
+whatever the row count. Every EXPORT_CHUNK_SIZE rows are encoded into one
+block of CSV text:
+
+- Small exports are streamed straight to the client. Under ASGI, Django
+  would read a synchronous iterator fully into memory before sending it,
+  so there the blocks are pulled through sync_to_async one at a time.
+- Exports above EXPORT_STREAM_MAX_ROWS become an ExportJob that a Celery
+  task writes to storage, so long downloads do not tie up web workers or
+  run into proxy timeouts. Finished files are removed after
+  EXPORT_RETENTION_DAYS.
+"""
+import csv
+import datetime
+import re
+import tempfile
+from decimal import Decimal
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.files import File
+from django.db.models import CharField, Value
+from django.db.models.functions import Concat
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from apps.invoices.models import Invoice, Payment
+from .models import Company, Contact, Deal, Task
+
+EXPORT_CHUNK_SIZE = 2000
+
+EXPORT_STREAM_MAX_ROWS = 50000
+
+EXPORT_RETENTION_DAYS = 7
+
+# Cells Excel would evaluate as formulas; phone numbers stay as they are
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+_NUMBER_RE = re.compile(r'[+-]?[\d\s().-]+')
+
+
+def _full_name(prefix):
+    return Concat(f'{prefix}first_name', Value(' '), f'{prefix}last_name', output_field=CharField())
+
+
+class Export:
+    """One exportable dataset: its columns and the owner's queryset"""
+
+    def __init__(self, label, model, columns, annotations=None):
+        self.label = label
+        self.model = model
+        self.columns = columns
+        self.annotations = annotations or {}
+
+    def queryset(self, owner):
+        return self.model.objects.filter(owner=owner)
+
+    def rows(self, owner, chunk_size=EXPORT_CHUNK_SIZE):
+        queryset = self.queryset(owner)
+        if self.annotations:
+            queryset = queryset.annotate(**self.annotations)
+        lookups = [lookup for _header, lookup in self.columns]
+        return queryset.order_by('pk').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+    def headers(self):
+        return [str(header) for header, _lookup in self.columns]
+
+
+EXPORTS = {
+    'contacts': Export(gettext_lazy('Contacts'), Contact, [
+        (gettext_lazy('ID'), 'id'),
+        (gettext_lazy('First name'), 'first_name'),
+        (gettext_lazy('Last name'), 'last_name'),
+        (gettext_lazy('Position'), 'position'),
+        (gettext_lazy('Company'), 'company__name'),
+        (gettext_lazy('Email'), 'email'),
+        (gettext_lazy('Phone'), 'phone'),
+        (gettext_lazy('Mobile'), 'mobile'),
+        (gettext_lazy('Address'), 'address'),
+        (gettext_lazy('City'), 'city'),
+        (gettext_lazy('Country'), 'country'),
+        (gettext_lazy('Postal code'), 'postal_code'),
+        (gettext_lazy('Birthday'), 'birthday'),
+        (gettext_lazy('Tags'), 'tags'),
+        (gettext_lazy('Active'), 'is_active'),
+        (gettext_lazy('Created'), 'created_at'),
+    ]),
+    'companies': Export(gettext_lazy('Companies'), Company, [
+        (gettext_lazy('ID'), 'id'),
+        (gettext_lazy('Name'), 'name'),
+        (gettext_lazy('Website'), 'website'),
+        (gettext_lazy('Industry'), 'industry'),
+        (gettext_lazy('Employees'), 'employees'),
+        (gettext_lazy('Annual revenue'), 'annual_revenue'),
+        (gettext_lazy('Phone'), 'phone'),
+        (gettext_lazy('Email'), 'email'),
+        (gettext_lazy('Address'), 'address'),
+        (gettext_lazy('City'), 'city'),
+        (gettext_lazy('Country'), 'country'),
+        (gettext_lazy('Postal code'), 'postal_code'),
+        (gettext_lazy('VAT number'), 'vat_number'),
+        (gettext_lazy('Tags'), 'tags'),
+        (gettext_lazy('Created'), 'created_at'),
+    ]),
+    'deals': Export(gettext_lazy('Deals'), Deal, [
+        (gettext_lazy('ID'), 'id'),
+        (gettext_lazy('Name'), 'name'),
+        (gettext_lazy('Contact'), 'contact_name'),
+        (gettext_lazy('Company'), 'company__name'),
+        (gettext_lazy('Value'), 'value'),
+        (gettext_lazy('Currency'), 'currency'),
+        (gettext_lazy('Pipeline'), 'pipeline__name'),
+        (gettext_lazy('Stage'), 'stage__name'),
+        (gettext_lazy('Status'), 'status'),
+        (gettext_lazy('Probability %'), 'probability'),
+        (gettext_lazy('Expected close date'), 'expected_close_date'),
+        (gettext_lazy('Actual close date'), 'actual_close_date'),
+        (gettext_lazy('Tags'), 'tags'),
+        (gettext_lazy('Created'), 'created_at'),
+    ], annotations={'contact_name': _full_name('contact__')}),
+    'tasks': Export(gettext_lazy('Tasks'), Task, [
+        (gettext_lazy('ID'), 'id'),
+        (gettext_lazy('Title'), 'title'),
+        (gettext_lazy('Type'), 'task_type'),
+        (gettext_lazy('Priority'), 'priority'),
+        (gettext_lazy('Due date'), 'due_date'),
+        (gettext_lazy('Completed'), 'completed'),
+        (gettext_lazy('Completed at'), 'completed_at'),
+        (gettext_lazy('Contact'), 'contact_name'),
+        (gettext_lazy('Company'), 'company__name'),
+        (gettext_lazy('Deal'), 'deal__name'),
+        (gettext_lazy('Created'), 'created_at'),
+    ], annotations={'contact_name': _full_name('contact__')}),
+    'invoices': Export(gettext_lazy('Invoices'), Invoice, [
+        (gettext_lazy('ID'), 'id'),
+        (gettext_lazy('Invoice number'), 'invoice_number'),
+        (gettext_lazy('Invoice date'), 'invoice_date'),
+        (gettext_lazy('Due date'), 'due_date'),
+        (gettext_lazy('Client'), 'client_name'),
+        (gettext_lazy('Client email'), 'client_email'),
+        (gettext_lazy('Client VAT number'), 'client_vat_number'),
+        (gettext_lazy('Company'), 'company__name'),
+        (gettext_lazy('Currency'), 'currency'),
+        (gettext_lazy('Subtotal'), 'subtotal'),
+        (gettext_lazy('Tax rate %'), 'tax_rate'),
+        (gettext_lazy('Tax amount'), 'tax_amount'),
+        (gettext_lazy('Total'), 'total_amount'),
+        (gettext_lazy('Paid'), 'paid_amount'),
+        (gettext_lazy('Status'), 'status'),
+        (gettext_lazy('Created'), 'created_at'),
+    ]),
+    'payments': Export(gettext_lazy('Payments'), Payment, [
+        (gettext_lazy('ID'), 'id'),
+        (gettext_lazy('Payment date'), 'payment_date'),
+        (gettext_lazy('Amount'), 'amount'),
+        (gettext_lazy('Currency'), 'currency'),
+        (gettext_lazy('Payment method'), 'payment_method'),
+        (gettext_lazy('Invoice number'), 'invoice__invoice_number'),
+        (gettext_lazy('Reference'), 'reference'),
+        (gettext_lazy('Matched'), 'is_matched'),
+        (gettext_lazy('Created'), 'created_at'),
+    ]),
+}
+
+
+def _cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).strftime('%Y-%m-%d %H:%M:%S') if timezone.is_aware(value) else value.isoformat(' ')
+    if isinstance(value, (datetime.date, Decimal, int)):
+        return str(value)
+    value = str(value).strip()
+    if value.startswith(_FORMULA_PREFIXES) and not _NUMBER_RE.fullmatch(value):
+        return "'" + value
+    return value
+
+
+class _Line:
+    """File-like target that hands back what csv.writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def _counted_blocks(export_type, owner, chunk_size):
+    """Yield (row count, CSV text) per ``chunk_size`` rows, header first"""
+    export = EXPORTS[export_type]
+    writer = csv.writer(_Line())
+    # BOM so that Excel detects UTF-8
+    yield 0, '\ufeff' + writer.writerow(export.headers())
+
+    rows = export.rows(owner, chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        yield len(chunk), ''.join(writer.writerow([_cell(value) for value in row]) for row in chunk)
+
+
+def csv_blocks(export_type, owner, chunk_size=EXPORT_CHUNK_SIZE):
+    """Yield the export as CSV text, one block per ``chunk_size`` rows"""
+    for _count, block in _counted_blocks(export_type, owner, chunk_size):
+        yield block
+
+
+async def acsv_blocks(export_type, owner, chunk_size=EXPORT_CHUNK_SIZE):
+    """csv_blocks() for ASGI: each block is produced in the sync thread"""
+    blocks = csv_blocks(export_type, owner, chunk_size)
+    next_block = sync_to_async(lambda: next(blocks, None), thread_sensitive=True)
+    while True:
+        block = await next_block()
+        if block is None:
+            break
+        yield block
+
+
+def export_filename(export_type):
+    return f'{export_type}-{timezone.localdate():%Y-%m-%d}.csv'
+
+
+def write_export(job):
+    """Write a job's export to storage; returns the number of rows"""
+    row_count = 0
+    with tempfile.TemporaryFile() as tmp:
+        for count, block in _counted_blocks(job.export_type, job.owner, EXPORT_CHUNK_SIZE):
+            tmp.write(block.encode('utf-8'))
+            row_count += count
+        job.file.save(export_filename(job.export_type), File(tmp), save=False)
+    return row_count
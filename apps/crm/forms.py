@@ -177,3 +177,36 @@ class ActivityForm(forms.ModelForm):
             self.fields['company'].queryset = Company.objects.filter(owner=user)
             self.fields['deal'].queryset = Deal.objects.filter(owner=user)
 
+
+
+class ContactImportForm(ContactForm):
+    """ContactForm rules for one imported row; the company is resolved by name"""
+    
+    class Meta(ContactForm.Meta):
+        fields = [name for name in ContactForm.Meta.fields if name != 'company']
+
+
+class ImportUploadForm(forms.Form):
+    file = forms.FileField(
+        label=_('File'),
+        help_text=_('CSV (UTF-8, comma or semicolon separated) or Excel .xlsx with a header row'),
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+    )
+    create_companies = forms.BooleanField(
+        label=_('Create companies that do not exist yet'),
+        required=False,
+        initial=True,
+        widget=forms.CheckboxInput(attrs={'class': 'form-check-input'}),
+    )
+    
+    def clean_file(self):
+        from .importer import IMPORT_FILE_EXTENSIONS, IMPORT_MAX_UPLOAD_SIZE
+        
+        upload = self.cleaned_data['file']
+        if not upload.name.lower().endswith(tuple(IMPORT_FILE_EXTENSIONS)):
+            raise forms.ValidationError(_('Upload a .csv or .xlsx file.'))
+        if upload.size > IMPORT_MAX_UPLOAD_SIZE:
+            raise forms.ValidationError(
+                _('The file is too large (maximum %(size)d MB).') % {'size': IMPORT_MAX_UPLOAD_SIZE // (1024 * 1024)}
+            )
+        return upload
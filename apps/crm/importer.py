@@ -0,0 +1,402 @@
+"""
+Bulk import of contacts and companies from CSV/XLSX files.
+
+The uploaded file is read lazily (csv.reader over a text stream, openpyxl
+in read-only mode), so memory use does not grow with the file. Rows are
+validated with the same form rules as the web UI and written in
+bulk_create batches of IMPORT_BATCH_SIZE:
+
+- Contacts refer to companies by name. Names are resolved through an
+  in-memory map of the owner's companies that is loaded once; unknown
+  names are created (one bulk_create per batch) or reported.
+- The plan's contacts limit is checked once per batch with a single COUNT.
+- Each batch is written in its own transaction (a savepoint when called
+  inside one). If the batch insert fails, its rows are retried one by one
+  in nested savepoints so that only the offending rows are rejected.
+- Rejected rows are written to a CSV error report with the original
+  values plus an ``errors`` column, so the report can be fixed and
+  uploaded again.
+
+Bulk inserts skip model signals, so search documents, dashboard stats and
+the subscription snapshot are refreshed here.
+"""
+import codecs
+import csv
+import datetime
+import io
+import re
+import tempfile
+
+from django.conf import settings
+from django.core.files import File
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+from django.utils.translation import gettext as _
+from .forms import CompanyForm, ContactImportForm
+from .models import Company, Contact
+from .search import index_queryset
+from .stats import invalidate_dashboard_stats
+from apps.subscriptions.models import Subscription
+from apps.subscriptions.snapshot import invalidate_subscription_snapshot
+
+IMPORT_BATCH_SIZE = 500
+
+IMPORT_FILE_EXTENSIONS = ['.csv', '.xlsx']
+
+IMPORT_MAX_UPLOAD_SIZE = 50 * 1024 * 1024
+
+# Excel on Windows saves "CSV" in the ANSI code page; Cyrillic for our users
+CSV_FALLBACK_ENCODING = 'cp1251'
+
+CSV_SNIFF_SIZE = 64 * 1024
+
+HEADER_ALIASES = {
+    'first': 'first_name',
+    'firstname': 'first_name',
+    'given_name': 'first_name',
+    'last': 'last_name',
+    'lastname': 'last_name',
+    'surname': 'last_name',
+    'family_name': 'last_name',
+    'e_mail': 'email',
+    'email_address': 'email',
+    'title': 'position',
+    'job_title': 'position',
+    'company_name': 'company',
+    'organization': 'company',
+    'organisation': 'company',
+    'zip': 'postal_code',
+    'zip_code': 'postal_code',
+    'postcode': 'postal_code',
+    'vat': 'vat_number',
+    'url': 'website',
+    'active': 'is_active',
+}
+
+
+class ImportFileError(Exception):
+    """The uploaded file cannot be read as a table"""
+
+
+def normalize_header(header):
+    name = re.sub(r'[^a-z0-9]+', '_', str(header or '').strip().lower()).strip('_')
+    return HEADER_ALIASES.get(name, name)
+
+
+def _cell_text(value):
+    """Spreadsheet cell value as the text a form would receive"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat() if value.time() == datetime.time() else value.isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+class TableReader:
+    """Header and rows of an uploaded CSV or XLSX file, read lazily"""
+
+    def __init__(self, fileobj, filename):
+        self.fileobj = fileobj
+        self._workbook = None
+        if filename.lower().endswith('.xlsx'):
+            self._open_xlsx()
+        else:
+            self._open_csv()
+
+    def _open_csv(self):
+        # Estimate the row count from the line breaks (one cheap pass over the bytes)
+        sample = self.fileobj.read(CSV_SNIFF_SIZE)
+        self.total_rows = sample.count(b'\n')
+        for chunk in iter(lambda: self.fileobj.read(1024 * 1024), b''):
+            self.total_rows += chunk.count(b'\n')
+        self.fileobj.seek(0)
+
+        encoding = 'utf-8-sig'
+        try:
+            text = codecs.getincrementaldecoder('utf-8-sig')().decode(sample, final=False)
+        except UnicodeDecodeError:
+            encoding = CSV_FALLBACK_ENCODING
+            text = sample.decode(encoding, errors='replace')
+
+        try:
+            dialect = csv.Sniffer().sniff(text[:text.rfind('\n') + 1] or text, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+
+        stream = io.TextIOWrapper(self.fileobj, encoding=encoding, errors='replace', newline='')
+        self._rows = csv.reader(stream, dialect)
+        self.headers = next(self._rows, [])
+
+    def _open_xlsx(self):
+        import openpyxl
+
+        try:
+            self._workbook = openpyxl.load_workbook(self.fileobj, read_only=True, data_only=True)
+        except Exception as e:
+            raise ImportFileError(_('The file is not a valid Excel workbook: %(error)s') % {'error': e})
+        sheet = self._workbook.worksheets[0]
+        self.total_rows = sheet.max_row or None
+        self._rows = (
+            [_cell_text(value) for value in row]
+            for row in sheet.iter_rows(values_only=True)
+        )
+        self.headers = next(self._rows, [])
+
+    def __iter__(self):
+        return iter(self._rows)
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+
+
+class ErrorReport:
+    """CSV of rejected rows: row number, errors and the original values"""
+
+    def __init__(self, headers):
+        self.count = 0
+        self._file = tempfile.TemporaryFile()
+        self._text = io.TextIOWrapper(self._file, encoding='utf-8-sig', newline='')
+        self._writer = csv.writer(self._text)
+        self._writer.writerow([_('row'), _('errors')] + list(headers))
+
+    def add(self, row_number, cells, errors):
+        if hasattr(errors, 'items'):
+            messages = [
+                f"{'' if field == '__all__' else field + ': '}{' '.join(str(error) for error in field_errors)}"
+                for field, field_errors in errors.items()
+            ]
+        else:
+            messages = [str(errors)]
+        self._writer.writerow([row_number, '; '.join(messages)] + list(cells))
+        self.count += 1
+
+    def save_to(self, job):
+        if self.count:
+            self._text.flush()
+            job.error_report.save(f'import-{job.pk}-errors.csv', File(self._file), save=False)
+
+    def close(self):
+        self._text.close()
+
+
+class BaseImporter:
+    """Import the rows of a job's file into one model"""
+
+    model = None
+    form_class = None
+
+    def __init__(self, job):
+        self.job = job
+        self.owner = job.owner
+
+    def map_columns(self, headers):
+        """Form field name (or None) for every column"""
+        known = set(self.form_class.base_fields) | self.extra_columns()
+        columns = [normalize_header(header) for header in headers]
+        return [name if name in known else None for name in columns]
+
+    def extra_columns(self):
+        return set()
+
+    def row_data(self, columns, cells):
+        return {name: value for name, value in zip(columns, cells) if name}
+
+    def build(self, row_number, cells, data, report):
+        """Validated unsaved instance for a row, or None after reporting errors"""
+        form = self.form_class(data)
+        if not form.is_valid():
+            report.add(row_number, cells, form.errors)
+            return None
+        instance = form.instance
+        instance.owner = self.owner
+        return instance
+
+    def prepare_batch(self, records, report):
+        """Hook run on the valid rows of a batch before they are written"""
+        return records
+
+    def run(self):
+        job = self.job
+        with job.file.open('rb') as fileobj:
+            reader = TableReader(fileobj, job.original_name)
+            report = ErrorReport(reader.headers)
+            try:
+                columns = self.map_columns(reader.headers)
+                if not any(columns):
+                    raise ImportFileError(_('None of the column headers match a known field.'))
+
+                if reader.total_rows:
+                    job.total_rows = max(reader.total_rows - 1, 1)  # minus the header
+                job.save(update_fields=['total_rows'])
+
+                batch = []
+                for row_number, cells in enumerate(reader, start=2):
+                    if not any(cell.strip() for cell in cells):
+                        continue
+                    batch.append((row_number, cells))
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        self.import_batch(batch, columns, report)
+                        batch = []
+                        if job.limit_reached:
+                            break
+                if batch and not job.limit_reached:
+                    self.import_batch(batch, columns, report)
+
+                report.save_to(job)
+            finally:
+                report.close()
+                reader.close()
+
+        job.status = 'completed'
+        job.finished_at = timezone.now()
+        job.save()
+        self.finish()
+
+    def import_batch(self, batch, columns, report):
+        job = self.job
+        records = []
+        for row_number, cells in batch:
+            instance = self.build(row_number, cells, self.row_data(columns, cells), report)
+            if instance is not None:
+                records.append((row_number, cells, instance))
+
+        records = self.prepare_batch(records, report)
+        created = self.write(records, report)
+        if created:
+            index_queryset(self.model.objects.filter(pk__in=[instance.pk for instance in created]))
+
+        job.processed_rows += len(batch)
+        job.created_count += len(created)
+        job.error_count = report.count
+        job.save(update_fields=['processed_rows', 'created_count', 'error_count', 'limit_reached'])
+
+    def write(self, records, report):
+        """Insert a batch in one statement, falling back to row-by-row savepoints"""
+        instances = [instance for _row, _cells, instance in records]
+        if not instances:
+            return []
+        try:
+            with transaction.atomic():
+                return self.model.objects.bulk_create(instances)
+        except DatabaseError:
+            pass
+
+        created = []
+        with transaction.atomic():
+            for row_number, cells, instance in records:
+                instance.pk = None
+                try:
+                    with transaction.atomic():
+                        self.model.objects.bulk_create([instance])
+                except DatabaseError as e:
+                    report.add(row_number, cells, str(e))
+                else:
+                    created.append(instance)
+        return created
+
+    def finish(self):
+        invalidate_dashboard_stats(self.owner.pk)
+
+
+class CompanyImporter(BaseImporter):
+    model = Company
+    form_class = CompanyForm
+
+
+class ContactImporter(BaseImporter):
+    model = Contact
+    form_class = ContactImportForm
+
+    def __init__(self, job):
+        super().__init__(job)
+        self.companies = {
+            name.casefold(): pk
+            for pk, name in Company.objects.filter(owner=self.owner).values_list('pk', 'name').iterator()
+        }
+        self.company_name_length = Company._meta.get_field('name').max_length
+
+    def extra_columns(self):
+        return {'company'}
+
+    def row_data(self, columns, cells):
+        data = super().row_data(columns, cells)
+        # A missing checkbox means unchecked; an import without the column means active
+        if not data.get('is_active', '').strip():
+            data['is_active'] = 'true'
+        return data
+
+    def build(self, row_number, cells, data, report):
+        company_name = data.pop('company', '').strip()
+        if len(company_name) > self.company_name_length:
+            report.add(row_number, cells, {'company': [_('Company name is too long.')]})
+            return None
+        if company_name and company_name.casefold() not in self.companies and not self.job.create_companies:
+            report.add(row_number, cells, {'company': [_('Unknown company "%(name)s".') % {'name': company_name}]})
+            return None
+
+        instance = super().build(row_number, cells, data, report)
+        if instance is not None:
+            instance._import_company = company_name
+        return instance
+
+    def prepare_batch(self, records, report):
+        records = self.apply_contacts_limit(records, report)
+        self.create_companies(records)
+        for _row, _cells, instance in records:
+            if instance._import_company:
+                instance.company_id = self.companies[instance._import_company.casefold()]
+        return records
+
+    def apply_contacts_limit(self, records, report):
+        """Keep as many rows as the plan allows, checked once for the batch"""
+        subscription = Subscription.objects.filter(user=self.owner).first()
+        plan_config = settings.SUBSCRIPTION_PLANS.get(subscription.plan if subscription else 'free', {})
+        limit = plan_config.get('contacts_limit', 0)
+        if limit == -1:  # unlimited
+            return records
+
+        remaining = max(limit - Contact.objects.filter(owner=self.owner).count(), 0)
+        if len(records) <= remaining:
+            return records
+
+        for row_number, cells, _instance in records[remaining:]:
+            report.add(row_number, cells, _('Contact limit of your plan reached.'))
+        self.job.limit_reached = True
+        return records[:remaining]
+
+    def create_companies(self, records):
+        """Create the companies named in a batch that do not exist yet (one INSERT)"""
+        new_names = {}
+        for _row, _cells, instance in records:
+            name = instance._import_company
+            if name and name.casefold() not in self.companies:
+                new_names.setdefault(name.casefold(), name)
+        if not new_names:
+            return
+
+        companies = Company.objects.bulk_create(
+            [Company(owner=self.owner, name=name) for name in new_names.values()]
+        )
+        for company in companies:
+            self.companies[company.name.casefold()] = company.pk
+        index_queryset(Company.objects.filter(pk__in=[company.pk for company in companies]))
+
+    def finish(self):
+        super().finish()
+        invalidate_subscription_snapshot(self.owner.pk)
+
+
+IMPORTERS = {
+    'contact': ContactImporter,
+    'company': CompanyImporter,
+}
+
+
+def run_import(job):
+    """Import a job's file; the caller marks failures"""
+    IMPORTERS[job.entity_type](job).run()
@@ -0,0 +1,84 @@
+"""
+Django management command to verify that owner-scoped list queries use indexes.
+Runs EXPLAIN on every registered list query and fails on sequential scans.
+"""
+
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from apps.accounts.models import User
+from apps.crm.models import Company, Contact, Deal, Task, Activity
+from apps.invoices.models import Invoice, Offer, Payment
+
+
+# Mirrors the filters and orderings used by the list views and dashboard.
+LIST_QUERIES = [
+    ('contact_list', lambda user: Contact.objects.filter(owner=user)),
+    ('contact_list (company)', lambda user: Contact.objects.filter(owner=user, company_id=0)),
+    ('company_list', lambda user: Company.objects.filter(owner=user)),
+    ('deal_list', lambda user: Deal.objects.filter(owner=user, status='open')),
+    ('task_list', lambda user: Task.objects.filter(Q(owner=user) | Q(assigned_to=user), completed=False)),
+    ('dashboard upcoming_tasks', lambda user: Task.objects.filter(owner=user, completed=False).order_by('due_date')),
+    ('dashboard recent_activities', lambda user: Activity.objects.filter(owner=user)),
+    ('invoice_list', lambda user: Invoice.objects.filter(owner=user)),
+    ('invoice_list (status)', lambda user: Invoice.objects.filter(owner=user, status='sent')),
+    ('invoice matching', lambda user: Invoice.objects.filter(owner=user, currency='EUR', status__in=['sent', 'partially_paid', 'overdue'])),
+    ('overdue invoices', lambda user: Invoice.objects.filter(status__in=['sent', 'partially_paid'], due_date__lt=timezone.now().date())),
+    ('offer_list', lambda user: Offer.objects.filter(owner=user)),
+    ('offer_list (status)', lambda user: Offer.objects.filter(owner=user, status='sent')),
+    ('payment_list', lambda user: Payment.objects.filter(owner=user)),
+]
+
+# PostgreSQL reports "Seq Scan on <table>", SQLite reports "SCAN <table>"
+# (as opposed to "SEARCH <table> USING INDEX ...").
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (?:TABLE )?(\w+)\b(?! USING (?:COVERING )?INDEX)'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on owner-scoped list queries and fail if any uses a sequential scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='User ID to build the queries for (defaults to the first user)')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print the full plan for every query')
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f'Unsupported database backend: {connection.vendor}')
+
+        user = User.objects.filter(pk=options['user']).first() if options['user'] else User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('No user found to build the list queries for.')
+
+        failures = []
+
+        with transaction.atomic():
+            if connection.vendor == 'postgresql':
+                # Small tables are cheaper to scan, so the planner would pick a
+                # sequential scan regardless of the indexes. Disable it to see
+                # whether an index path exists at all.
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for name, build_query in LIST_QUERIES:
+                plan = build_query(user).explain()
+                scanned = pattern.findall(plan)
+                if scanned:
+                    failures.append(name)
+                    self.stdout.write(self.style.ERROR(f'✗ {name}: sequential scan on {", ".join(scanned)}'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'✓ {name}'))
+
+                if options['verbose_plans'] or scanned:
+                    self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'{len(failures)} list queries fall back to a sequential scan: {", ".join(failures)}')
+
+        self.stdout.write(self.style.SUCCESS(f'\nAll {len(LIST_QUERIES)} list queries use an index.'))
@@ -0,0 +1,26 @@
+"""
+Django management command to (re)build the CRM search documents.
+Use it once after deploying the search index and whenever documents drift.
+"""
+
+from django.core.management.base import BaseCommand
+from apps.crm.models import Company, Contact, Deal, SearchDocument
+from apps.crm.search import index_queryset
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search documents for contacts, companies and deals'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, help='Only rebuild documents owned by this user ID')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Rows written per batch')
+
+    def handle(self, *args, **options):
+        owner_filter = {'owner_id': options['user']} if options['user'] else {}
+
+        stale = SearchDocument.objects.filter(**owner_filter).delete()[0]
+        self.stdout.write(f'Removed {stale} existing documents')
+
+        for model in (Company, Contact, Deal):
+            count = index_queryset(model.objects.filter(**owner_filter), chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'✓ Indexed {count} {model._meta.verbose_name_plural}'))
@@ -0,0 +1,93 @@
+# Generated by Django 4.2.7 on 2026-10-18 11:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+POSTGRESQL_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "ALTER TABLE crm_searchdocument ADD COLUMN search_vector tsvector "
+    "GENERATED ALWAYS AS (setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(body, '')), 'B')) STORED",
+    "CREATE INDEX crm_searchdoc_vector_gin ON crm_searchdocument USING GIN (search_vector)",
+    "CREATE INDEX crm_searchdoc_body_trgm ON crm_searchdocument USING GIN (body gin_trgm_ops)",
+]
+
+POSTGRESQL_REVERSE = [
+    "DROP INDEX IF EXISTS crm_searchdoc_body_trgm",
+    "DROP INDEX IF EXISTS crm_searchdoc_vector_gin",
+    "ALTER TABLE crm_searchdocument DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    "CREATE VIRTUAL TABLE crm_searchdocument_fts USING fts5("
+    "title, body, content='crm_searchdocument', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER crm_searchdocument_ai AFTER INSERT ON crm_searchdocument BEGIN "
+    "INSERT INTO crm_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+    "CREATE TRIGGER crm_searchdocument_ad AFTER DELETE ON crm_searchdocument BEGIN "
+    "INSERT INTO crm_searchdocument_fts(crm_searchdocument_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); END",
+    "CREATE TRIGGER crm_searchdocument_au AFTER UPDATE ON crm_searchdocument BEGIN "
+    "INSERT INTO crm_searchdocument_fts(crm_searchdocument_fts, rowid, title, body) "
+    "VALUES ('delete', old.id, old.title, old.body); "
+    "INSERT INTO crm_searchdocument_fts(rowid, title, body) VALUES (new.id, new.title, new.body); END",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS crm_searchdocument_au",
+    "DROP TRIGGER IF EXISTS crm_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS crm_searchdocument_ai",
+    "DROP TABLE IF EXISTS crm_searchdocument_fts",
+]
+
+
+def _run(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRESQL_FORWARD)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_FORWARD)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _run(schema_editor, POSTGRESQL_REVERSE)
+    elif vendor == 'sqlite':
+        _run(schema_editor, SQLITE_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('crm', '0002_company_company_owner_created_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_type', models.CharField(choices=[('contact', 'Contact'), ('company', 'Company'), ('deal', 'Deal')], max_length=20, verbose_name='entity type')),
+                ('object_id', models.BigIntegerField(verbose_name='object ID')),
+                ('title', models.CharField(max_length=300, verbose_name='title')),
+                ('body', models.TextField(blank=True, verbose_name='body')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_documents', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'search document',
+                'verbose_name_plural': 'search documents',
+                'unique_together': {('entity_type', 'object_id')},
+                'indexes': [models.Index(fields=['owner', 'entity_type'], name='searchdoc_owner_entity_idx')],
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.7 on 2026-10-18 21:10
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('crm', '0003_searchdocument'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_type', models.CharField(choices=[('contact', 'Contacts'), ('company', 'Companies')], max_length=20, verbose_name='entity type')),
+                ('file', models.FileField(upload_to='imports/', verbose_name='file')),
+                ('original_name', models.CharField(max_length=255, verbose_name='original file name')),
+                ('create_companies', models.BooleanField(default=True, verbose_name='create missing companies')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='status')),
+                ('total_rows', models.IntegerField(blank=True, help_text='Estimated before the import starts', null=True, verbose_name='total rows')),
+                ('processed_rows', models.IntegerField(default=0, verbose_name='processed rows')),
+                ('created_count', models.IntegerField(default=0, verbose_name='created')),
+                ('error_count', models.IntegerField(default=0, verbose_name='errors')),
+                ('limit_reached', models.BooleanField(default=False, verbose_name='plan limit reached')),
+                ('error_report', models.FileField(blank=True, upload_to='imports/errors/', verbose_name='error report')),
+                ('last_error', models.TextField(blank=True, verbose_name='last error')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='started at')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='finished at')),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='import_jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'import job',
+                'verbose_name_plural': 'import jobs',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['owner', '-created_at'], name='importjob_owner_created_idx')],
+            },
+        ),
+    ]
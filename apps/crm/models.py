@@ -35,6 +35,9 @@ class Company(models.Model):
         verbose_name = _('company')
         verbose_name_plural = _('companies')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at'], name='company_owner_created_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -81,6 +84,10 @@ class Contact(models.Model):
         verbose_name = _('contact')
         verbose_name_plural = _('contacts')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at'], name='contact_owner_created_idx'),
+            models.Index(fields=['owner', 'company'], name='contact_owner_company_idx'),
+        ]
     
     def __str__(self):
         return f"{self.first_name} {self.last_name}"
@@ -172,6 +179,9 @@ class Deal(models.Model):
         verbose_name = _('deal')
         verbose_name_plural = _('deals')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', 'status', '-created_at'], name='deal_owner_status_created_idx'),
+        ]
     
     def __str__(self):
         return self.name
@@ -221,6 +231,10 @@ class Task(models.Model):
         verbose_name = _('task')
         verbose_name_plural = _('tasks')
         ordering = ['completed', '-due_date', '-created_at']
+        indexes = [
+            models.Index(fields=['owner', 'completed', 'due_date'], name='task_owner_completed_due_idx'),
+            models.Index(fields=['assigned_to', 'completed', 'due_date'], name='task_assignee_completed_idx'),
+        ]
     
     def __str__(self):
         return self.title
@@ -257,6 +271,9 @@ class Activity(models.Model):
         verbose_name = _('activity')
         verbose_name_plural = _('activities')
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at'], name='activity_owner_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.activity_type}: {self.title}"
@@ -301,3 +318,137 @@ class CustomField(models.Model):
     def __str__(self):
         return f"{self.entity_type}: {self.field_name}"
 
+
+
+class SearchDocument(models.Model):
+    """Denormalized per-owner search document for contacts, companies and deals"""
+    
+    ENTITY_CHOICES = [
+        ('contact', _('Contact')),
+        ('company', _('Company')),
+        ('deal', _('Deal')),
+    ]
+    
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='search_documents')
+    
+    entity_type = models.CharField(_('entity type'), max_length=20, choices=ENTITY_CHOICES)
+    object_id = models.BigIntegerField(_('object ID'))
+    
+    title = models.CharField(_('title'), max_length=300)
+    body = models.TextField(_('body'), blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = _('search document')
+        verbose_name_plural = _('search documents')
+        unique_together = ['entity_type', 'object_id']
+        indexes = [
+            models.Index(fields=['owner', 'entity_type'], name='searchdoc_owner_entity_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.entity_type}: {self.title}"
+
+
+class ImportJob(models.Model):
+    """Bulk import of contacts or companies from an uploaded CSV/XLSX file"""
+    
+    ENTITY_CHOICES = [
+        ('contact', _('Contacts')),
+        ('company', _('Companies')),
+    ]
+    
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+    ]
+    
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='import_jobs')
+    
+    entity_type = models.CharField(_('entity type'), max_length=20, choices=ENTITY_CHOICES)
+    file = models.FileField(_('file'), upload_to='imports/')
+    original_name = models.CharField(_('original file name'), max_length=255)
+    create_companies = models.BooleanField(_('create missing companies'), default=True)
+    
+    status = models.CharField(_('status'), max_length=20, choices=STATUS_CHOICES, default='pending')
+    total_rows = models.IntegerField(_('total rows'), null=True, blank=True, help_text=_('Estimated before the import starts'))
+    processed_rows = models.IntegerField(_('processed rows'), default=0)
+    created_count = models.IntegerField(_('created'), default=0)
+    error_count = models.IntegerField(_('errors'), default=0)
+    limit_reached = models.BooleanField(_('plan limit reached'), default=False)
+    error_report = models.FileField(_('error report'), upload_to='imports/errors/', blank=True)
+    last_error = models.TextField(_('last error'), blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(_('started at'), null=True, blank=True)
+    finished_at = models.DateTimeField(_('finished at'), null=True, blank=True)
+    
+    class Meta:
+        verbose_name = _('import job')
+        verbose_name_plural = _('import jobs')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at'], name='importjob_owner_created_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_entity_type_display()}: {self.original_name}"
+    
+    def get_absolute_url(self):
+        return reverse('crm:import_detail', kwargs={'pk': self.pk})
+    
+    @property
+    def is_finished(self):
+        return self.status in ['completed', 'failed']
+    
+    @property
+    def progress_percent(self):
+        if self.status == 'completed':
+            return 100
+        if not self.total_rows:
+            return 0
+        return min(99, int(self.processed_rows * 100 / self.total_rows))
+
+
+class ExportJob(models.Model):
+    """CSV export too large to stream within a request, written by a Celery task"""
+    
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('completed', _('Completed')),
+        ('failed', _('Failed')),
+    ]
+    
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='export_jobs')
+    
+    export_type = models.CharField(_('export type'), max_length=20)
+    status = models.CharField(_('status'), max_length=20, choices=STATUS_CHOICES, default='pending')
+    row_count = models.IntegerField(_('rows'), default=0)
+    file = models.FileField(_('file'), upload_to='exports/', blank=True)
+    last_error = models.TextField(_('last error'), blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(_('finished at'), null=True, blank=True)
+    
+    class Meta:
+        verbose_name = _('export job')
+        verbose_name_plural = _('export jobs')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-created_at'], name='exportjob_owner_created_idx'),
+            models.Index(fields=['status', 'finished_at'], name='exportjob_status_finished_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.export_type} ({self.created_at:%Y-%m-%d %H:%M})"
+    
+    def get_absolute_url(self):
+        return reverse('crm:export_detail', kwargs={'pk': self.pk})
+    
+    @property
+    def is_finished(self):
+        return self.status in ['completed', 'failed']
@@ -0,0 +1,227 @@
+"""
+Keyset (cursor) pagination for list views.
+
+Django's Paginator runs a COUNT(*) and an OFFSET scan on every page, which
+gets linearly slower on deep pages. CursorPaginator instead filters on the
+last row of the current page using the list ordering plus the primary key as
+a tie-breaker, so every page costs the same single indexed query.
+
+The classic numbered Paginator is still used when the request asks for it
+with ``?page=N`` or ``?count=exact``.
+"""
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db.models import F, Q
+
+CURSOR_SALT = 'crm.pagination.cursor'
+
+
+def _encode_value(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+class CursorPage:
+    """A single page of results, iterable like django.core.paginator.Page"""
+
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+        self.next_query = ''
+        self.previous_query = ''
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Paginate a queryset by keyset on its ordering fields.
+
+    Args:
+        queryset: Queryset to paginate
+        per_page: Number of rows per page
+        ordering: Ordering fields (``-`` prefix for descending); defaults to
+            the queryset's ordering. The primary key is always appended as a
+            tie-breaker. Nullable fields are sorted with NULLs last.
+    """
+
+    def __init__(self, queryset, per_page, ordering=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.model = queryset.model
+
+        ordering = list(ordering or queryset.query.order_by or self.model._meta.ordering)
+        self.ordering = []
+        for name in ordering:
+            descending = name.startswith('-')
+            name = name.lstrip('-')
+            if name == 'pk':
+                name = self.model._meta.pk.name
+            self.ordering.append((name, descending))
+
+        pk_name = self.model._meta.pk.name
+        if pk_name not in [name for name, _ in self.ordering]:
+            last_descending = self.ordering[-1][1] if self.ordering else True
+            self.ordering.append((pk_name, last_descending))
+
+    def _field(self, name):
+        return self.model._meta.get_field(name)
+
+    def _order_by(self, reverse=False):
+        expressions = []
+        for name, descending in self.ordering:
+            descending = descending != reverse
+            nulls = {}
+            if self._field(name).null:
+                # NULLs always sort after values in the forward direction
+                nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+            expressions.append(F(name).desc(**nulls) if descending else F(name).asc(**nulls))
+        return expressions
+
+    def _beyond(self, name, descending, value, reverse):
+        """Rows strictly after ``value`` on one field in the walking direction"""
+        nullable = self._field(name).null
+        forward_lookup = 'lt' if descending else 'gt'
+        backward_lookup = 'gt' if descending else 'lt'
+
+        if not reverse:
+            if value is None:
+                return Q(pk__in=[])
+            condition = Q(**{f'{name}__{forward_lookup}': value})
+            if nullable:
+                condition |= Q(**{f'{name}__isnull': True})
+            return condition
+
+        if value is None:
+            return Q(**{f'{name}__isnull': False})
+        return Q(**{f'{name}__{backward_lookup}': value})
+
+    def _equal(self, name, value):
+        if value is None:
+            return Q(**{f'{name}__isnull': True})
+        return Q(**{name: value})
+
+    def _keyset_filter(self, values, reverse):
+        condition = Q(pk__in=[])
+        prefix = Q()
+        for (name, descending), value in zip(self.ordering, values):
+            condition |= prefix & self._beyond(name, descending, value, reverse)
+            prefix &= self._equal(name, value)
+        return condition
+
+    def encode_cursor(self, obj, direction):
+        values = [_encode_value(getattr(obj, self._field(name).attname)) for name, _ in self.ordering]
+        return signing.dumps({'d': direction, 'v': values}, salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        """Return (direction, values) for a cursor, or None if it is invalid"""
+        try:
+            data = signing.loads(cursor, salt=CURSOR_SALT)
+            raw_values = data['v']
+            direction = data['d']
+            if direction not in ('n', 'p') or len(raw_values) != len(self.ordering):
+                return None
+            values = [
+                None if raw is None else self._field(name).to_python(raw)
+                for (name, _), raw in zip(self.ordering, raw_values)
+            ]
+        except Exception:
+            return None
+        return direction, values
+
+    def get_page(self, cursor=None):
+        """Return the page after (or before) ``cursor``; the first page if it is missing or invalid"""
+        decoded = self.decode_cursor(cursor) if cursor else None
+        reverse = decoded is not None and decoded[0] == 'p'
+
+        queryset = self.queryset
+        if decoded is not None:
+            queryset = queryset.filter(self._keyset_filter(decoded[1], reverse))
+        rows = list(queryset.order_by(*self._order_by(reverse))[:self.per_page + 1])
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        if not rows:
+            return CursorPage(rows, self)
+
+        if reverse:
+            has_next = True
+            has_previous = has_more
+        else:
+            has_next = has_more
+            has_previous = decoded is not None
+
+        return CursorPage(
+            rows,
+            self,
+            next_cursor=self.encode_cursor(rows[-1], 'n') if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], 'p') if has_previous else None,
+        )
+
+
+def _query_with(request, **params):
+    query = request.GET.copy()
+    for key in ('cursor', 'page'):
+        query.pop(key, None)
+    for key, value in params.items():
+        query[key] = value
+    return query.urlencode()
+
+
+def paginate(request, queryset, per_page=20, ordering=None):
+    """
+    Paginate a list view queryset.
+
+    Uses keyset pagination with ``?cursor=<token>`` by default and falls back
+    to the exact-count numbered Paginator for ``?page=N`` or ``?count=exact``.
+    The returned page exposes ``next_query``/``previous_query`` query strings
+    that keep the other GET parameters (search, filters) intact.
+
+    Querysets ordered by an annotation (such as the search rank) have no
+    model field to build a keyset on, so they are numbered as well.
+    """
+    ordered_by_annotation = any(
+        str(name).lstrip('-') in queryset.query.annotations for name in queryset.query.order_by
+    )
+    if ordered_by_annotation or request.GET.get('page') or request.GET.get('count') == 'exact':
+        page = Paginator(queryset, per_page).get_page(request.GET.get('page'))
+        page.is_cursor = False
+        page.next_query = _query_with(request, page=page.next_page_number()) if page.has_next() else ''
+        page.previous_query = _query_with(request, page=page.previous_page_number()) if page.has_previous() else ''
+        return page
+
+    page = CursorPaginator(queryset, per_page, ordering=ordering).get_page(request.GET.get('cursor'))
+    if page.has_next():
+        page.next_query = _query_with(request, cursor=page.next_cursor)
+    if page.has_previous():
+        page.previous_query = _query_with(request, cursor=page.previous_cursor)
+    return page
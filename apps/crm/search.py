@@ -0,0 +1,202 @@
+"""
+Full-text search over contacts, companies and deals.
+
+Every record is mirrored into a denormalized, per-owner SearchDocument that is
+kept up to date by signals (see apps/crm/signals.py). The documents are
+indexed with backend-specific structures created in migration 0003:
+
+- PostgreSQL: a weighted tsvector column with a GIN index for ranked word
+  prefix matches, plus a pg_trgm GIN index on the body so that partial
+  matches inside words (e.g. "mail" in "gmail") still use an index.
+- SQLite (development): an FTS5 external-content table synced by triggers.
+
+Other backends fall back to icontains over the search documents.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.urls import reverse
+from .models import Company, Contact, Deal, SearchDocument
+
+MAX_QUERY_TOKENS = 8
+
+SEARCH_CHUNK_SIZE = 500
+
+
+def _join(*parts):
+    return ' '.join(str(part) for part in parts if part)
+
+
+def build_document(instance):
+    """Return (entity_type, title, body) for a Contact, Company or Deal"""
+    if isinstance(instance, Contact):
+        company_name = instance.company.name if instance.company_id else ''
+        return 'contact', instance.full_name, _join(
+            instance.first_name, instance.last_name, instance.email, instance.phone,
+            instance.mobile, instance.position, company_name, instance.city,
+            instance.country, instance.tags,
+        )
+    if isinstance(instance, Company):
+        return 'company', instance.name, _join(
+            instance.name, instance.email, instance.industry, instance.website,
+            instance.phone, instance.vat_number, instance.city, instance.country,
+            instance.tags,
+        )
+    if isinstance(instance, Deal):
+        contact_name = instance.contact.full_name if instance.contact_id else ''
+        company_name = instance.company.name if instance.company_id else ''
+        return 'deal', instance.name, _join(
+            instance.name, contact_name, company_name, instance.tags, instance.description,
+        )
+    raise TypeError(f'Cannot index {type(instance).__name__} instances')
+
+
+def index_object(instance):
+    """Create or refresh the search document for a single record"""
+    entity_type, title, body = build_document(instance)
+    SearchDocument.objects.update_or_create(
+        entity_type=entity_type,
+        object_id=instance.pk,
+        defaults={'owner_id': instance.owner_id, 'title': title[:300], 'body': body},
+    )
+
+
+def index_queryset(queryset, chunk_size=SEARCH_CHUNK_SIZE):
+    """Create or refresh the search documents for every record in a queryset"""
+    model = queryset.model
+    if model is Contact:
+        queryset = queryset.select_related('company')
+    elif model is Deal:
+        queryset = queryset.select_related('contact', 'company')
+
+    indexed = 0
+    batch = []
+    for instance in queryset.iterator(chunk_size=chunk_size):
+        entity_type, title, body = build_document(instance)
+        batch.append(SearchDocument(
+            owner_id=instance.owner_id,
+            entity_type=entity_type,
+            object_id=instance.pk,
+            title=title[:300],
+            body=body,
+        ))
+        if len(batch) >= chunk_size:
+            indexed += _upsert(batch)
+            batch = []
+    if batch:
+        indexed += _upsert(batch)
+    return indexed
+
+
+def _upsert(documents):
+    SearchDocument.objects.bulk_create(
+        documents,
+        update_conflicts=True,
+        unique_fields=['entity_type', 'object_id'],
+        update_fields=['owner', 'title', 'body', 'updated_at'],
+    )
+    return len(documents)
+
+
+def remove_object(instance):
+    """Delete the search document for a record"""
+    entity_type = {Contact: 'contact', Company: 'company', Deal: 'deal'}[type(instance)]
+    SearchDocument.objects.filter(entity_type=entity_type, object_id=instance.pk).delete()
+
+
+def _tokens(query):
+    return re.findall(r'\w+', query.lower())[:MAX_QUERY_TOKENS]
+
+
+def _like_pattern(query):
+    escaped = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+def _search_documents(user, query, entity_types=None):
+    """
+    Return the matching SearchDocument queryset annotated with ``rank``.
+
+    Column names in the raw SQL are left unqualified so the queryset can be
+    used as a subquery, where Django aliases the table.
+    """
+    documents = SearchDocument.objects.filter(owner=user)
+    if entity_types:
+        documents = documents.filter(entity_type__in=entity_types)
+
+    query = query.strip()
+    tokens = _tokens(query)
+
+    if tokens and connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        return documents.filter(RawSQL(
+            "(search_vector @@ to_tsquery('simple', %s) OR body ILIKE %s)",
+            [tsquery, _like_pattern(query)],
+            output_field=BooleanField(),
+        )).annotate(rank=RawSQL(
+            "ts_rank(search_vector, to_tsquery('simple', %s)) + similarity(body, %s)",
+            [tsquery, query],
+            output_field=FloatField(),
+        ))
+
+    if tokens and connection.vendor == 'sqlite':
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        return documents.filter(RawSQL(
+            "id IN (SELECT rowid FROM crm_searchdocument_fts WHERE crm_searchdocument_fts MATCH %s)",
+            [match],
+            output_field=BooleanField(),
+        )).annotate(rank=RawSQL(
+            "(SELECT -bm25(crm_searchdocument_fts, 10.0, 1.0) FROM crm_searchdocument_fts "
+            "WHERE crm_searchdocument_fts MATCH %s AND rowid = id)",
+            [match],
+            output_field=FloatField(),
+        ))
+
+    return documents.filter(
+        Q(title__icontains=query) | Q(body__icontains=query)
+    ).annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+def filter_by_search(queryset, user, query, entity_type):
+    """
+    Restrict a list view queryset to search matches, best matches first.
+
+    The rank is annotated as ``search_rank``; ties keep the newest records first.
+    """
+    documents = _search_documents(user, query, [entity_type])
+    rank = documents.filter(object_id=OuterRef('pk')).values('rank')[:1]
+    return queryset.filter(pk__in=documents.values('object_id')).annotate(
+        search_rank=Subquery(rank, output_field=FloatField()),
+    ).order_by('-search_rank', '-created_at')
+
+
+def search(user, query, entity_types=None, limit=20):
+    """
+    Ranked search across a user's contacts, companies and deals.
+
+    Returns a list of dicts with ``type``, ``id``, ``title``, ``url`` and
+    ``rank`` keys, best matches first.
+    """
+    if not query or not query.strip():
+        return []
+
+    documents = _search_documents(user, query, entity_types).order_by('-rank', '-updated_at')[:limit]
+
+    url_names = {
+        'contact': 'crm:contact_detail',
+        'company': 'crm:company_detail',
+        'deal': 'crm:deal_detail',
+    }
+
+    return [
+        {
+            'type': document.entity_type,
+            'id': document.object_id,
+            'title': document.title,
+            'url': reverse(url_names[document.entity_type], kwargs={'pk': document.object_id}),
+            'rank': document.rank,
+        }
+        for document in documents
+    ]
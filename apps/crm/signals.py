@@ -0,0 +1,73 @@
+"""
+Signal handlers for CRM models.
+"""
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+from .models import Company, Contact, Deal, Task
+from .search import index_object, index_queryset, remove_object
+from .stats import invalidate_dashboard_stats
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+@receiver(post_save, sender=Contact)
+@receiver(post_delete, sender=Contact)
+@receiver(post_save, sender=Deal)
+@receiver(post_delete, sender=Deal)
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def invalidate_owner_dashboard_stats(sender, instance, **kwargs):
+    """Invalidate the dashboard stats snapshot of the record owner"""
+    invalidate_dashboard_stats(instance.owner_id)
+
+
+@receiver(post_save, sender=Company)
+def index_company(sender, instance, created, **kwargs):
+    """Index the company and refresh documents that embed its name"""
+    index_object(instance)
+    if not created:
+        index_queryset(Contact.objects.filter(company=instance))
+        index_queryset(Deal.objects.filter(company=instance))
+
+
+@receiver(post_save, sender=Contact)
+def index_contact(sender, instance, created, **kwargs):
+    """Index the contact and refresh deals that embed its name"""
+    index_object(instance)
+    if not created:
+        index_queryset(Deal.objects.filter(contact=instance))
+
+
+@receiver(post_save, sender=Deal)
+def index_deal(sender, instance, **kwargs):
+    """Index the deal"""
+    index_object(instance)
+
+
+@receiver(pre_delete, sender=Company)
+@receiver(pre_delete, sender=Contact)
+def collect_dependent_documents(sender, instance, **kwargs):
+    """Remember which records embed this one before the FKs are nulled"""
+    if sender is Company:
+        instance._search_dependents = (
+            list(Contact.objects.filter(company=instance).values_list('pk', flat=True)),
+            list(Deal.objects.filter(company=instance).values_list('pk', flat=True)),
+        )
+    else:
+        instance._search_dependents = (
+            [],
+            list(Deal.objects.filter(contact=instance).values_list('pk', flat=True)),
+        )
+
+
+@receiver(post_delete, sender=Company)
+@receiver(post_delete, sender=Contact)
+@receiver(post_delete, sender=Deal)
+def remove_document(sender, instance, **kwargs):
+    """Drop the search document and refresh records that embedded this one"""
+    remove_object(instance)
+    contact_ids, deal_ids = getattr(instance, '_search_dependents', ([], []))
+    if contact_ids:
+        index_queryset(Contact.objects.filter(pk__in=contact_ids))
+    if deal_ids:
+        index_queryset(Deal.objects.filter(pk__in=deal_ids))
@@ -0,0 +1,74 @@
+"""
+Dashboard statistics for the CRM.
+
+All counters are computed with one conditional-aggregation query per model
+and stored as a per-user snapshot in the owner's "dashboard" cache namespace.
+The namespace is invalidated from the CRM model signals (see
+apps/crm/signals.py).
+"""
+from django.db.models import Q, Count, Sum, Avg
+from django.utils import timezone
+from .cache import get_or_compute, invalidate_namespace
+from .models import Company, Contact, Deal, Task
+
+# Overdue task counts depend on the current time, so even without writes the
+# snapshot must expire eventually.
+DASHBOARD_STATS_TIMEOUT = 300
+
+DASHBOARD_NAMESPACE = 'dashboard'
+
+
+def compute_dashboard_stats(user):
+    """Compute all dashboard counters for a user straight from the database"""
+    now = timezone.now()
+
+    total_contacts = Contact.objects.filter(owner=user).count()
+    total_companies = Company.objects.filter(owner=user).count()
+
+    deal_stats = Deal.objects.filter(owner=user).aggregate(
+        open_count=Count('id', filter=Q(status='open')),
+        open_value=Sum('value', filter=Q(status='open')),
+        won_value=Sum('value', filter=Q(status='won')),
+        won_average=Avg('value', filter=Q(status='won')),
+    )
+
+    task_stats = Task.objects.filter(owner=user).aggregate(
+        completed_count=Count('id', filter=Q(completed=True)),
+        overdue_count=Count('id', filter=Q(completed=False, due_date__lt=now)),
+    )
+
+    deals_by_stage = list(
+        Deal.objects.filter(owner=user, status='open')
+        .values('stage__name')
+        .annotate(count=Count('id'), total=Sum('value'))
+        .order_by('stage__name')
+    )
+
+    return {
+        'total_contacts': total_contacts,
+        'total_companies': total_companies,
+        'total_deals': deal_stats['open_count'],
+        'total_deal_value': deal_stats['open_value'] or 0,
+        'total_revenue': deal_stats['won_value'] or 0,
+        'average_deal_size': deal_stats['won_average'] or 0,
+        'total_completed_tasks': task_stats['completed_count'],
+        'overdue_tasks': task_stats['overdue_count'],
+        'deals_by_stage': deals_by_stage,
+    }
+
+
+def get_dashboard_stats(user):
+    """Return the cached stats snapshot for a user, computing it on a miss"""
+    return get_or_compute(
+        DASHBOARD_NAMESPACE,
+        ['stats'],
+        lambda: compute_dashboard_stats(user),
+        DASHBOARD_STATS_TIMEOUT,
+        owner_id=user.pk,
+    )
+
+
+def invalidate_dashboard_stats(user_id):
+    """Drop the cached stats snapshot for a user"""
+    if user_id:
+        invalidate_namespace(DASHBOARD_NAMESPACE, user_id)
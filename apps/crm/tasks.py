@@ -0,0 +1,73 @@
+from celery import shared_task
+from django.utils import timezone
+from datetime import timedelta
+from .exporter import EXPORT_RETENTION_DAYS, write_export
+from .importer import ImportFileError, run_import
+from .models import ExportJob, ImportJob
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+@shared_task
+def run_import_job(job_id):
+    """Run a pending contact/company import"""
+    # Claim the job so a duplicate delivery does not import the file twice
+    claimed = ImportJob.objects.filter(pk=job_id, status='pending').update(
+        status='running',
+        started_at=timezone.now(),
+    )
+    if not claimed:
+        return f"Import job {job_id} is not pending"
+    
+    job = ImportJob.objects.select_related('owner').get(pk=job_id)
+    try:
+        run_import(job)
+    except Exception as e:
+        if not isinstance(e, ImportFileError):
+            logger.exception(f"Import job {job_id} failed")
+        job.status = 'failed'
+        job.last_error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'last_error', 'finished_at'])
+        return f"Import job {job_id} failed: {e}"
+    
+    return f"Imported {job.created_count} of {job.processed_rows} rows ({job.error_count} errors)"
+
+
+@shared_task
+def run_export_job(job_id):
+    """Write a large CSV export to storage"""
+    claimed = ExportJob.objects.filter(pk=job_id, status='pending').update(status='running')
+    if not claimed:
+        return f"Export job {job_id} is not pending"
+    
+    job = ExportJob.objects.select_related('owner').get(pk=job_id)
+    try:
+        job.row_count = write_export(job)
+    except Exception as e:
+        logger.exception(f"Export job {job_id} failed")
+        job.status = 'failed'
+        job.last_error = str(e)
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'last_error', 'finished_at'])
+        return f"Export job {job_id} failed: {e}"
+    
+    job.status = 'completed'
+    job.finished_at = timezone.now()
+    job.save(update_fields=['status', 'row_count', 'file', 'finished_at'])
+    return f"Exported {job.row_count} {job.export_type}"
+
+
+@shared_task
+def purge_old_exports():
+    """Delete export files older than EXPORT_RETENTION_DAYS"""
+    cutoff = timezone.now() - timedelta(days=EXPORT_RETENTION_DAYS)
+    purged = 0
+    for job in ExportJob.objects.filter(finished_at__lt=cutoff).iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        purged += 1
+    
+    return f"Purged {purged} export jobs"
@@ -7,9 +7,13 @@ urlpatterns = [
     # Dashboard
     path('', views.dashboard, name='dashboard'),
     
+    # Search
+    path('search/', views.global_search, name='search'),
+    
     # Contacts
     path('contacts/', views.contact_list, name='contact_list'),
     path('contacts/create/', views.contact_create, name='contact_create'),
+    path('contacts/import/', views.import_create, {'entity_type': 'contact'}, name='contact_import'),
     path('contacts/<int:pk>/', views.contact_detail, name='contact_detail'),
     path('contacts/<int:pk>/edit/', views.contact_update, name='contact_update'),
     path('contacts/<int:pk>/delete/', views.contact_delete, name='contact_delete'),
@@ -17,6 +21,7 @@ urlpatterns = [
     # Companies
     path('companies/', views.company_list, name='company_list'),
     path('companies/create/', views.company_create, name='company_create'),
+    path('companies/import/', views.import_create, {'entity_type': 'company'}, name='company_import'),
     path('companies/<int:pk>/', views.company_detail, name='company_detail'),
     path('companies/<int:pk>/edit/', views.company_update, name='company_update'),
     path('companies/<int:pk>/delete/', views.company_delete, name='company_delete'),
@@ -37,5 +42,15 @@ urlpatterns = [
     # Pipelines
     path('pipelines/', views.pipeline_list, name='pipeline_list'),
     path('pipelines/create/', views.pipeline_create, name='pipeline_create'),
+    
+    # Imports
+    path('imports/<int:pk>/', views.import_detail, name='import_detail'),
+    path('imports/<int:pk>/progress/', views.import_progress, name='import_progress'),
+    path('imports/<int:pk>/errors/', views.import_errors, name='import_errors'),
+    
+    # Exports
+    path('export/<slug:export_type>/', views.export_csv, name='export'),
+    path('exports/<int:pk>/', views.export_detail, name='export_detail'),
+    path('exports/<int:pk>/download/', views.export_download, name='export_download'),
 ]
 
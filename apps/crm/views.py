@@ -1,12 +1,20 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils.translation import gettext as _
-from django.db.models import Q, Count, Sum, Avg
+from django.db import transaction
+from django.db.models import Q
 from django.utils import timezone
-from django.core.paginator import Paginator
-from .models import Company, Contact, Deal, Task, Pipeline, Stage, Activity
-from .forms import CompanyForm, ContactForm, DealForm, TaskForm, PipelineForm, StageForm, ActivityForm
+from .models import Company, Contact, Deal, Task, Pipeline, Stage, Activity, ImportJob, ExportJob
+from .forms import CompanyForm, ContactForm, DealForm, TaskForm, PipelineForm, StageForm, ActivityForm, ContactImportForm, ImportUploadForm
+from .stats import get_dashboard_stats
+from .pagination import paginate
+from .search import filter_by_search, search
+from .exporter import EXPORTS, EXPORT_STREAM_MAX_ROWS, acsv_blocks, csv_blocks, export_filename
+from .tasks import run_export_job, run_import_job
 
 
 @login_required
@@ -14,11 +22,8 @@ def dashboard(request):
     """Main CRM dashboard"""
     user = request.user
     
-    # Statistics
-    total_contacts = Contact.objects.filter(owner=user).count()
-    total_companies = Company.objects.filter(owner=user).count()
-    total_deals = Deal.objects.filter(owner=user, status='open').count()
-    total_deal_value = Deal.objects.filter(owner=user, status='open').aggregate(Sum('value'))['value__sum'] or 0
+    # Statistics (cached per-user snapshot, see apps/crm/stats.py)
+    stats = get_dashboard_stats(user)
     
     # Recent items
     recent_contacts = Contact.objects.filter(owner=user)[:5]
@@ -26,37 +31,29 @@ def dashboard(request):
     upcoming_tasks = Task.objects.filter(owner=user, completed=False).order_by('due_date')[:5]
     recent_activities = Activity.objects.filter(owner=user)[:10]
     
-    # Deals by stage
-    deals_by_stage = Deal.objects.filter(owner=user, status='open').values('stage__name').annotate(count=Count('id'), total=Sum('value'))
-    
-    # Additional statistics
-    total_completed_tasks = Task.objects.filter(owner=user, completed=True).count()
-    total_revenue = Deal.objects.filter(owner=user, status='won').aggregate(Sum('value'))['value__sum'] or 0
-    average_deal_size = Deal.objects.filter(owner=user, status='won').aggregate(Avg('value'))['value__avg'] or 0
-    overdue_tasks = Task.objects.filter(owner=user, completed=False, due_date__lt=timezone.now()).count()
-
     context = {
-        'total_contacts': total_contacts,
-        'total_companies': total_companies,
-        'total_deals': total_deals,
-        'total_deal_value': total_deal_value,
         'recent_contacts': recent_contacts,
         'recent_deals': recent_deals,
         'upcoming_tasks': upcoming_tasks,
         'recent_activities': recent_activities,
-        'deals_by_stage': deals_by_stage,
     }
-    
-    context.update({
-        'total_completed_tasks': total_completed_tasks,
-        'total_revenue': total_revenue,
-        'average_deal_size': average_deal_size,
-        'overdue_tasks': overdue_tasks,
-    })
+    context.update(stats)
     
     return render(request, 'crm/dashboard.html', context)
 
 
+@login_required
+def global_search(request):
+    """Ranked search across contacts, companies and deals (omnibox)"""
+    query = request.GET.get('q', '')
+    entity_type = request.GET.get('type')
+    entity_types = [entity_type] if entity_type in ('contact', 'company', 'deal') else None
+    
+    results = search(request.user, query, entity_types=entity_types, limit=20)
+    
+    return JsonResponse({'query': query, 'results': results})
+
+
 # Contact Views
 @login_required
 def contact_list(request):
@@ -66,12 +63,7 @@ def contact_list(request):
     # Search
     search_query = request.GET.get('search', '')
     if search_query:
-        contacts = contacts.filter(
-            Q(first_name__icontains=search_query) |
-            Q(last_name__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(phone__icontains=search_query)
-        )
+        contacts = filter_by_search(contacts, request.user, search_query, 'contact')
     
     # Filter by company
     company_id = request.GET.get('company')
@@ -79,9 +71,7 @@ def contact_list(request):
         contacts = contacts.filter(company_id=company_id)
     
     # Pagination
-    paginator = Paginator(contacts, 20)
-    page_number = request.GET.get('page')
-    contacts_page = paginator.get_page(page_number)
+    contacts_page = paginate(request, contacts)
     
     return render(request, 'crm/contact_list.html', {'contacts': contacts_page, 'search_query': search_query})
 
@@ -157,16 +147,10 @@ def company_list(request):
     # Search
     search_query = request.GET.get('search', '')
     if search_query:
-        companies = companies.filter(
-            Q(name__icontains=search_query) |
-            Q(email__icontains=search_query) |
-            Q(industry__icontains=search_query)
-        )
+        companies = filter_by_search(companies, request.user, search_query, 'company')
     
     # Pagination
-    paginator = Paginator(companies, 20)
-    page_number = request.GET.get('page')
-    companies_page = paginator.get_page(page_number)
+    companies_page = paginate(request, companies)
     
     return render(request, 'crm/company_list.html', {'companies': companies_page, 'search_query': search_query})
 
@@ -247,12 +231,10 @@ def deal_list(request):
     # Search
     search_query = request.GET.get('search', '')
     if search_query:
-        deals = deals.filter(Q(name__icontains=search_query))
+        deals = filter_by_search(deals, request.user, search_query, 'deal')
     
     # Pagination
-    paginator = Paginator(deals, 20)
-    page_number = request.GET.get('page')
-    deals_page = paginator.get_page(page_number)
+    deals_page = paginate(request, deals)
     
     return render(request, 'crm/deal_list.html', {'deals': deals_page, 'status': status, 'search_query': search_query})
 
@@ -366,9 +348,7 @@ def task_list(request):
         tasks = tasks.filter(completed=False)
     
     # Pagination
-    paginator = Paginator(tasks, 20)
-    page_number = request.GET.get('page')
-    tasks_page = paginator.get_page(page_number)
+    tasks_page = paginate(request, tasks)
     
     return render(request, 'crm/task_list.html', {'tasks': tasks_page, 'completed': completed})
 
@@ -448,3 +428,141 @@ def pipeline_create(request):
     
     return render(request, 'crm/pipeline_form.html', {'form': form, 'action': 'create'})
 
+
+# Import Views
+IMPORT_LIST_URLS = {
+    'contact': 'crm:contact_list',
+    'company': 'crm:company_list',
+}
+
+
+def _import_columns(entity_type):
+    form_class = ContactImportForm if entity_type == 'contact' else CompanyForm
+    columns = list(form_class.base_fields)
+    if entity_type == 'contact':
+        columns.insert(3, 'company')
+    return columns
+
+
+@login_required
+def import_create(request, entity_type):
+    """Upload a CSV/XLSX file of contacts or companies and queue its import"""
+    if request.method == 'POST':
+        form = ImportUploadForm(request.POST, request.FILES)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            job = ImportJob.objects.create(
+                owner=request.user,
+                entity_type=entity_type,
+                file=upload,
+                original_name=upload.name[:255],
+                create_companies=form.cleaned_data['create_companies'],
+            )
+            transaction.on_commit(lambda: run_import_job.delay(job.pk))
+            messages.success(request, _('Import started. You can leave this page; it keeps running in the background.'))
+            return redirect('crm:import_detail', pk=job.pk)
+    else:
+        form = ImportUploadForm()
+    
+    return render(request, 'crm/import_form.html', {
+        'form': form,
+        'entity_type': entity_type,
+        'list_url': IMPORT_LIST_URLS[entity_type],
+        'columns': _import_columns(entity_type),
+        'recent_jobs': ImportJob.objects.filter(owner=request.user, entity_type=entity_type)[:5],
+    })
+
+
+@login_required
+def import_detail(request, pk):
+    """Import progress page"""
+    job = get_object_or_404(ImportJob, pk=pk, owner=request.user)
+    return render(request, 'crm/import_detail.html', {
+        'job': job,
+        'list_url': IMPORT_LIST_URLS[job.entity_type],
+    })
+
+
+@login_required
+def import_progress(request, pk):
+    """Import progress as JSON, polled by the progress page"""
+    job = get_object_or_404(ImportJob, pk=pk, owner=request.user)
+    return JsonResponse({
+        'status': job.status,
+        'status_display': str(job.get_status_display()),
+        'finished': job.is_finished,
+        'total_rows': job.total_rows,
+        'processed_rows': job.processed_rows,
+        'created': job.created_count,
+        'errors': job.error_count,
+        'percent': job.progress_percent,
+        'limit_reached': job.limit_reached,
+        'error_report_url': reverse('crm:import_errors', kwargs={'pk': job.pk}) if job.error_report else None,
+        'last_error': job.last_error,
+    })
+
+
+@login_required
+def import_errors(request, pk):
+    """Download the CSV report of rejected rows"""
+    job = get_object_or_404(ImportJob, pk=pk, owner=request.user)
+    if not job.error_report:
+        raise Http404
+    return FileResponse(
+        job.error_report.open('rb'),
+        as_attachment=True,
+        filename=f'import-errors-{job.pk}.csv',
+        content_type='text/csv',
+    )
+
+
+# Export Views
+@login_required
+def export_csv(request, export_type):
+    """Download contacts, companies, deals, tasks, invoices or payments as CSV"""
+    export = EXPORTS.get(export_type)
+    if export is None:
+        raise Http404
+    
+    # Large exports are written by a worker instead of holding a web worker
+    row_count = export.queryset(request.user).count()
+    if row_count > EXPORT_STREAM_MAX_ROWS:
+        job = ExportJob.objects.create(owner=request.user, export_type=export_type)
+        transaction.on_commit(lambda: run_export_job.delay(job.pk))
+        messages.info(request, _('The export has %(count)d rows and is being prepared in the background.') % {'count': row_count})
+        return redirect('crm:export_detail', pk=job.pk)
+    
+    # Under ASGI Django buffers synchronous iterators completely, so hand it
+    # an async one there
+    if isinstance(request, ASGIRequest):
+        content = acsv_blocks(export_type, request.user)
+    else:
+        content = csv_blocks(export_type, request.user)
+    
+    response = StreamingHttpResponse(content, content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{export_filename(export_type)}"'
+    return response
+
+
+@login_required
+def export_detail(request, pk):
+    """Status page of a background export"""
+    job = get_object_or_404(ExportJob, pk=pk, owner=request.user)
+    return render(request, 'crm/export_detail.html', {
+        'job': job,
+        'label': EXPORTS[job.export_type].label if job.export_type in EXPORTS else job.export_type,
+    })
+
+
+@login_required
+def export_download(request, pk):
+    """Download the file of a finished background export"""
+    job = get_object_or_404(ExportJob, pk=pk, owner=request.user, status='completed')
+    if not job.file:
+        raise Http404
+    return FileResponse(
+        job.file.open('rb'),
+        as_attachment=True,
+        filename=export_filename(job.export_type),
+        content_type='text/csv',
+    )
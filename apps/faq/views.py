@@ -5,6 +5,8 @@ from .models import FAQCategory, FAQItem
 import markdown
 import os
 from django.conf import settings
+from django.core.cache import caches
+from apps.crm.cache import FRAGMENTS
 
 
 def faq_home(request):
@@ -86,7 +88,30 @@ def faq_detail(request, pk):
         question = item.question
         answer = item.answer
     
-    # Convert markdown to HTML
+    # Markdown rendering is cached per item version and language
+    answer_html, guide_html = caches[FRAGMENTS].get_or_set(
+        f'faq:detail:{item.pk}:{item.updated_at.timestamp()}:{lang}',
+        lambda: _render_item(item, answer),
+        60 * 60,
+    )
+    
+    # Get related questions from same category
+    related_items = FAQItem.objects.filter(
+        category=item.category,
+        is_active=True
+    ).exclude(pk=item.pk)[:5]
+    
+    return render(request, 'faq/faq_detail.html', {
+        'item': item,
+        'question': question,
+        'answer_html': answer_html,
+        'guide_html': guide_html,
+        'related_items': related_items
+    })
+
+
+def _render_item(item, answer):
+    """Convert an answer and the item's guide file from markdown to HTML"""
     answer_html = markdown.markdown(
         answer,
         extensions=['extra', 'codehilite', 'fenced_code', 'tables']
@@ -108,19 +133,7 @@ def faq_detail(request, pk):
                     extensions=['extra', 'codehilite', 'fenced_code', 'tables']
                 )
     
-    # Get related questions from same category
-    related_items = FAQItem.objects.filter(
-        category=item.category,
-        is_active=True
-    ).exclude(pk=item.pk)[:5]
-    
-    return render(request, 'faq/faq_detail.html', {
-        'item': item,
-        'question': question,
-        'answer_html': answer_html,
-        'guide_html': guide_html,
-        'related_items': related_items
-    })
+    return answer_html, guide_html
 
 
 def faq_search(request):
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Invoice, InvoiceItem, Offer, OfferItem, Payment
+from .models import Invoice, InvoiceItem, Offer, OfferItem, Payment, EmailDelivery
+from .line_items import save_line_items
 
 
 class InvoiceItemInline(admin.TabularInline):
@@ -14,6 +15,12 @@ class InvoiceAdmin(admin.ModelAdmin):
     search_fields = ('invoice_number', 'client_name', 'client_email')
     ordering = ('-invoice_date', '-invoice_number')
     inlines = [InvoiceItemInline]
+    
+    def save_formset(self, request, form, formset, change):
+        if formset.model is InvoiceItem:
+            save_line_items(formset)
+        else:
+            super().save_formset(request, form, formset, change)
 
 
 class OfferItemInline(admin.TabularInline):
@@ -28,6 +35,12 @@ class OfferAdmin(admin.ModelAdmin):
     search_fields = ('offer_number', 'client_name', 'client_email')
     ordering = ('-offer_date', '-offer_number')
     inlines = [OfferItemInline]
+    
+    def save_formset(self, request, form, formset, change):
+        if formset.model is OfferItem:
+            save_line_items(formset)
+        else:
+            super().save_formset(request, form, formset, change)
 
 
 @admin.register(Payment)
@@ -37,3 +50,12 @@ class PaymentAdmin(admin.ModelAdmin):
     search_fields = ('reference', 'stripe_payment_intent_id', 'stripe_charge_id')
     ordering = ('-payment_date', '-created_at')
 
+
+
+@admin.register(EmailDelivery)
+class EmailDeliveryAdmin(admin.ModelAdmin):
+    list_display = ('to_email', 'invoice', 'offer', 'status', 'attempts', 'sent_at', 'created_at', 'owner')
+    list_filter = ('status', 'created_at')
+    search_fields = ('to_email', 'last_error')
+    ordering = ('-created_at',)
+    raw_id_fields = ('invoice', 'offer')
@@ -0,0 +1,171 @@
+"""
+Outbound invoice/offer email queue.
+
+Views record an EmailDelivery and return immediately; the actual Resend call
+happens in the deliver_document_email Celery task, which retries failed sends
+with exponential backoff and keeps the delivery status up to date so the UI
+can poll it.
+
+Mass sending (month-end billing runs) goes through send_documents_bulk, which
+renders emails chunk by chunk and submits each chunk with one call to Resend's
+batch endpoint instead of one HTTP request per document.
+"""
+import random
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import EmailDelivery, Invoice
+from .resend_client import RESEND_BATCH_SIZE
+
+EMAIL_MAX_RETRIES = 5
+
+# Seconds before the first retry; doubles with every further attempt
+EMAIL_RETRY_BACKOFF = 30
+
+EMAIL_RETRY_BACKOFF_MAX = 60 * 60
+
+
+def retry_countdown(attempts):
+    """Exponential backoff with jitter for the given number of failed attempts"""
+    countdown = min(EMAIL_RETRY_BACKOFF * 2 ** (attempts - 1), EMAIL_RETRY_BACKOFF_MAX)
+    return countdown + random.uniform(0, countdown / 10)
+
+
+def _new_delivery(document, email_template_id=None, **kwargs):
+    is_invoice = isinstance(document, Invoice)
+    return EmailDelivery(
+        owner_id=document.owner_id,
+        invoice=document if is_invoice else None,
+        offer=None if is_invoice else document,
+        to_email=document.client_email,
+        email_template_id=email_template_id,
+        **kwargs
+    )
+
+
+def queue_document_email(document, email_template_id=None):
+    """
+    Queue an invoice or offer email for asynchronous delivery.
+
+    The Celery task is only published once the surrounding transaction
+    commits, so the worker always sees the delivery row.
+    """
+    from .tasks import deliver_document_email
+
+    if not document.client_email:
+        raise ValueError('Client email is required to send the document')
+
+    delivery = _new_delivery(document, email_template_id)
+    delivery.save()
+
+    transaction.on_commit(lambda: deliver_document_email.delay(delivery.pk))
+
+    return delivery
+
+
+def send_documents_bulk(owner, documents, email_template_id=None):
+    """
+    Email many invoices or offers of one owner through Resend's batch endpoint.
+
+    Documents are rendered and sent RESEND_BATCH_SIZE at a time; the Resend
+    client spaces the batch requests to stay within the per-key rate limit.
+    Every recipient gets an EmailDelivery row with its own result.
+
+    Args:
+        owner: User whose Resend account and templates are used
+        documents: Invoice or Offer queryset (restricted to ``owner``)
+        email_template_id: Optional EmailTemplate ID
+
+    Returns:
+        Dictionary of send statistics
+    """
+    from apps.templates.models import EmailTemplate
+    from .email_service import ResendEmailService
+
+    email_template = None
+    if email_template_id:
+        email_template = EmailTemplate.objects.get(id=email_template_id, owner=owner)
+
+    service = ResendEmailService(owner)
+    documents = documents.filter(owner=owner).select_related('company').order_by('pk')
+
+    stats = {
+        'documents': 0,
+        'sent': 0,
+        'failed': 0,
+        'skipped': 0,
+    }
+
+    chunk = []
+    for document in documents.iterator(chunk_size=RESEND_BATCH_SIZE):
+        stats['documents'] += 1
+        if not document.client_email:
+            stats['skipped'] += 1
+            continue
+        chunk.append(document)
+        if len(chunk) >= RESEND_BATCH_SIZE:
+            _send_chunk(service, chunk, email_template, stats)
+            chunk = []
+    if chunk:
+        _send_chunk(service, chunk, email_template, stats)
+
+    if email_template and stats['sent']:
+        EmailTemplate.objects.filter(pk=email_template.pk).update(
+            times_sent=F('times_sent') + stats['sent'],
+            last_used_at=timezone.now(),
+        )
+
+    return stats
+
+
+def _send_chunk(service, documents, email_template, stats):
+    """Render, batch-send and record one chunk of documents"""
+    email_template_id = email_template.pk if email_template else None
+    deliveries = []
+    pending = []
+
+    for document in documents:
+        delivery = _new_delivery(document, email_template_id, status='sending', attempts=1)
+        try:
+            params = service.build_document_email(document, email_template=email_template)
+        except Exception as e:
+            delivery.status = 'failed'
+            delivery.last_error = f'Error rendering template: {e}'
+        else:
+            pending.append((delivery, document, params))
+        deliveries.append(delivery)
+
+    # Record the attempt before calling Resend so a crash never loses track of it
+    EmailDelivery.objects.bulk_create(deliveries)
+
+    results = service.send_batch([params for _delivery, _document, params in pending])
+
+    now = timezone.now()
+    sent_documents = []
+    for (delivery, document, _params), result in zip(pending, results):
+        if result.get('success'):
+            delivery.status = 'sent'
+            delivery.sent_at = now
+            delivery.message_id = result.get('id') or ''
+            document.email_sent = True
+            document.email_sent_at = now
+            if document.status == 'draft':
+                document.status = 'sent'
+            document.updated_at = now
+            sent_documents.append(document)
+        else:
+            delivery.status = 'failed'
+            delivery.last_error = result.get('error', '')
+
+    for delivery in deliveries:
+        delivery.updated_at = now
+
+    EmailDelivery.objects.bulk_update(deliveries, ['status', 'last_error', 'message_id', 'sent_at', 'updated_at'])
+    if sent_documents:
+        type(sent_documents[0]).objects.bulk_update(
+            sent_documents, ['email_sent', 'email_sent_at', 'status', 'updated_at']
+        )
+
+    stats['sent'] += len(sent_documents)
+    stats['failed'] += len(deliveries) - len(sent_documents)
@@ -1,15 +1,17 @@
 """
 Resend Email Service for sending invoices, offers, and custom email templates
 """
-import resend
 from django.conf import settings
 from django.template.loader import render_to_string
 from django.utils.translation import gettext as _
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import logging
+import base64
 import ssl
 import os
 
+from .resend_client import RESEND_BATCH_SIZE, get_client
+
 logger = logging.getLogger(__name__)
 
 # Configure SSL for Resend API
@@ -25,6 +27,9 @@ import urllib3
 if settings.DEBUG:
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# Attach the stored PDF to single invoice/offer emails (the batch endpoint does not support attachments)
+EMAIL_ATTACH_PDF = getattr(settings, 'EMAIL_ATTACH_PDF', True)
+
 
 class ResendEmailService:
     """Service for sending emails via Resend API"""
@@ -37,13 +42,15 @@ class ResendEmailService:
             user: User instance with resend_api_key configured
         """
         self.user = user
+        # Per-key pooled client; never touch the global resend.api_key,
+        # which would leak between tenants sending concurrently
         if user.has_resend_configured():
-            resend.api_key = user.resend_api_key
+            self.client = get_client(user.resend_api_key)
             self.from_email = user.resend_from_email
             self.from_name = user.resend_from_name or user.get_full_name() or user.username
         else:
             # Fallback to settings if user hasn't configured Resend
-            resend.api_key = settings.RESEND_API_KEY
+            self.client = get_client(settings.RESEND_API_KEY)
             self.from_email = settings.RESEND_FROM_EMAIL
             self.from_name = settings.RESEND_FROM_NAME
     
@@ -78,30 +85,57 @@ class ResendEmailService:
         Returns:
             Response from Resend API
         """
+        params = self._build_params(
+            to_email=to_email,
+            subject=subject,
+            html_content=html_content,
+            plain_text=plain_text,
+            reply_to=reply_to,
+            attachments=attachments,
+            tags=tags,
+        )
+        return self._deliver(params)
+    
+    def _build_params(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        plain_text: Optional[str] = None,
+        reply_to: Optional[str] = None,
+        attachments: Optional[list] = None,
+        tags: Optional[Dict[str, str]] = None
+    ) -> Dict[str, Any]:
+        """Build the Resend API payload for one email"""
+        params = {
+            "from": self.from_email,
+            "to": to_email,
+            "subject": subject,
+            "html": html_content,
+        }
+        
+        # Add optional parameters
+        if plain_text:
+            params["text"] = plain_text
+        
+        if reply_to:
+            params["reply_to"] = reply_to
+        
+        if attachments:
+            params["attachments"] = attachments
+        
+        if tags:
+            params["tags"] = tags
+        
+        return params
+    
+    def _deliver(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """Send a prepared Resend payload"""
+        to_email = params["to"]
         try:
-            params = {
-                "from": self.from_email,
-                "to": to_email,
-                "subject": subject,
-                "html": html_content,
-            }
-            
-            # Add optional parameters
-            if plain_text:
-                params["text"] = plain_text
-            
-            if reply_to:
-                params["reply_to"] = reply_to
-            
-            if attachments:
-                params["attachments"] = attachments
-            
-            if tags:
-                params["tags"] = tags
-            
             # Send email via Resend with SSL configuration
             try:
-                response = resend.Emails.send(params)
+                response = self.client.send(params)
             except Exception as ssl_error:
                 # If SSL fails and we're in debug mode, try with a workaround
                 if settings.DEBUG and "SSL" in str(ssl_error):
@@ -109,8 +143,8 @@ class ResendEmailService:
                     # In development, you can use Django's email backend as fallback
                     from django.core.mail import EmailMessage
                     email = EmailMessage(
-                        subject=subject,
-                        body=html_content,
+                        subject=params["subject"],
+                        body=params["html"],
                         from_email=settings.DEFAULT_FROM_EMAIL,
                         to=[to_email],
                     )
@@ -125,17 +159,47 @@ class ResendEmailService:
             return {"success": True, "id": response.get("id"), "response": response}
             
         except Exception as e:
-            error_msg = str(e)
-            logger.error(f"Error sending email via Resend: {error_msg}")
-            
-            # Provide helpful error message
-            if "SSL" in error_msg or "certificate" in error_msg.lower():
-                error_msg = (
-                    "SSL Certificate Error: Please run '/Applications/Python 3.12/Install Certificates.command' "
-                    "or install certifi: pip install --trusted-host pypi.org --trusted-host files.pythonhosted.org certifi"
-                )
+            return {"success": False, "error": self._error_message(e)}
+    
+    def _error_message(self, error: Exception) -> str:
+        error_msg = str(error)
+        logger.error(f"Error sending email via Resend: {error_msg}")
+        
+        # Provide helpful error message
+        if "SSL" in error_msg or "certificate" in error_msg.lower():
+            error_msg = (
+                "SSL Certificate Error: Please run '/Applications/Python 3.12/Install Certificates.command' "
+                "or install certifi: pip install --trusted-host pypi.org --trusted-host files.pythonhosted.org certifi"
+            )
+        
+        return error_msg
+    
+    def send_batch(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Send many prepared payloads through Resend's batch endpoint
+        
+        Args:
+            messages: Payloads from build_document_email()
+        
+        Returns:
+            One result dictionary per message, in the same order
+        """
+        results = []
+        for start in range(0, len(messages), RESEND_BATCH_SIZE):
+            chunk = messages[start:start + RESEND_BATCH_SIZE]
+            try:
+                ids = self.client.send_batch(chunk)
+            except Exception as e:
+                # Resend validates the whole batch, so a failure applies to every message in it
+                error_msg = self._error_message(e)
+                results.extend({"success": False, "error": error_msg} for _message in chunk)
+                continue
             
-            return {"success": False, "error": error_msg}
+            logger.info(f"Batch of {len(chunk)} emails sent via Resend")
+            for index in range(len(chunk)):
+                results.append({"success": True, "id": ids[index] if index < len(ids) else None})
+        
+        return results
     
     def _sanitize_tag_value(self, value: str) -> str:
         """
@@ -160,12 +224,47 @@ class ResendEmailService:
             email_template_id: Optional custom email template ID
         
         Returns:
-            Response dictionary with success status
+            Response dictionary with success status; ``permanent`` is set
+            on failures that a retry cannot fix
         """
-        from django.urls import reverse
-        
         if not invoice.client_email:
-            return {"success": False, "error": _("Client email is required")}
+            return {"success": False, "error": _("Client email is required"), "permanent": True}
+        
+        email_template = None
+        if email_template_id:
+            from apps.templates.models import EmailTemplate
+            try:
+                email_template = EmailTemplate.objects.get(id=email_template_id, owner=self.user)
+            except EmailTemplate.DoesNotExist:
+                logger.error(f"Email template with ID {email_template_id} not found for user {self.user.username}")
+                return {"success": False, "error": _("Email template not found"), "permanent": True}
+        
+        try:
+            params = self.build_invoice_email(invoice, request, email_template=email_template, attach_pdf=EMAIL_ATTACH_PDF)
+        except Exception as e:
+            logger.error(f"Error rendering email template {email_template_id}: {str(e)}")
+            return {"success": False, "error": _("Error rendering template: ") + str(e), "permanent": True}
+        
+        if email_template:
+            # Track template usage
+            email_template.increment_usage()
+        
+        return self._deliver(params)
+    
+    def build_invoice_email(self, invoice, request=None, email_template=None, attach_pdf=False) -> Dict[str, Any]:
+        """
+        Render the Resend payload for an invoice email without sending it
+        
+        Args:
+            invoice: Invoice instance
+            request: Django request object for building absolute URLs
+            email_template: Optional EmailTemplate instance
+            attach_pdf: Attach the invoice PDF
+        
+        Returns:
+            Resend API payload
+        """
+        from django.urls import reverse
         
         # Build PDF URL
         if request:
@@ -197,20 +296,9 @@ class ResendEmailService:
         }
         
         # Use custom template if provided
-        if email_template_id:
-            try:
-                from apps.templates.models import EmailTemplate
-                email_template = EmailTemplate.objects.get(id=email_template_id, owner=self.user)
-                logger.info(f"Using custom email template: {email_template.name} (ID: {email_template_id})")
-                subject, html_content, plain_text = email_template.render(context)
-                # Track template usage
-                email_template.increment_usage()
-            except EmailTemplate.DoesNotExist:
-                logger.error(f"Email template with ID {email_template_id} not found for user {self.user.username}")
-                return {"success": False, "error": _("Email template not found")}
-            except Exception as e:
-                logger.error(f"Error rendering email template {email_template_id}: {str(e)}")
-                return {"success": False, "error": _("Error rendering template: ") + str(e)}
+        if email_template:
+            logger.info(f"Using custom email template: {email_template.name} (ID: {email_template.pk})")
+            subject, html_content, plain_text = email_template.render(context)
         else:
             # Use default template
             logger.info(f"Using default invoice email template")
@@ -237,21 +325,20 @@ class ResendEmailService:
 {self.from_name}
             """
         
-        # Send email with sanitized tags
-        result = self.send_email(
+        # Payload with sanitized tags
+        return self._build_params(
             to_email=invoice.client_email,
             subject=subject,
             html_content=html_content,
             plain_text=plain_text,
             reply_to=self.user.email if self.user.email else None,
+            attachments=self._pdf_attachments(invoice) if attach_pdf else None,
             tags={
                 "type": "invoice",
                 "invoice_id": str(invoice.id),
                 "invoice_number": self._sanitize_tag_value(invoice.invoice_number),
             }
         )
-        
-        return result
     
     def send_offer_email(self, offer, request=None, email_template_id=None) -> Dict[str, Any]:
         """
@@ -263,12 +350,47 @@ class ResendEmailService:
             email_template_id: Optional custom email template ID
         
         Returns:
-            Response dictionary with success status
+            Response dictionary with success status; ``permanent`` is set
+            on failures that a retry cannot fix
         """
-        from django.urls import reverse
-        
         if not offer.client_email:
-            return {"success": False, "error": _("Client email is required")}
+            return {"success": False, "error": _("Client email is required"), "permanent": True}
+        
+        email_template = None
+        if email_template_id:
+            from apps.templates.models import EmailTemplate
+            try:
+                email_template = EmailTemplate.objects.get(id=email_template_id, owner=self.user)
+            except EmailTemplate.DoesNotExist:
+                logger.error(f"Email template with ID {email_template_id} not found for user {self.user.username}")
+                return {"success": False, "error": _("Email template not found"), "permanent": True}
+        
+        try:
+            params = self.build_offer_email(offer, request, email_template=email_template, attach_pdf=EMAIL_ATTACH_PDF)
+        except Exception as e:
+            logger.error(f"Error rendering email template {email_template_id}: {str(e)}")
+            return {"success": False, "error": _("Error rendering template: ") + str(e), "permanent": True}
+        
+        if email_template:
+            # Track template usage
+            email_template.increment_usage()
+        
+        return self._deliver(params)
+    
+    def build_offer_email(self, offer, request=None, email_template=None, attach_pdf=False) -> Dict[str, Any]:
+        """
+        Render the Resend payload for an offer email without sending it
+        
+        Args:
+            offer: Offer instance
+            request: Django request object for building absolute URLs
+            email_template: Optional EmailTemplate instance
+            attach_pdf: Attach the offer PDF
+        
+        Returns:
+            Resend API payload
+        """
+        from django.urls import reverse
         
         # Build PDF URL
         if request:
@@ -299,20 +421,9 @@ class ResendEmailService:
         }
         
         # Use custom template if provided
-        if email_template_id:
-            try:
-                from apps.templates.models import EmailTemplate
-                email_template = EmailTemplate.objects.get(id=email_template_id, owner=self.user)
-                logger.info(f"Using custom email template: {email_template.name} (ID: {email_template_id})")
-                subject, html_content, plain_text = email_template.render(context)
-                # Track template usage
-                email_template.increment_usage()
-            except EmailTemplate.DoesNotExist:
-                logger.error(f"Email template with ID {email_template_id} not found for user {self.user.username}")
-                return {"success": False, "error": _("Email template not found")}
-            except Exception as e:
-                logger.error(f"Error rendering email template {email_template_id}: {str(e)}")
-                return {"success": False, "error": _("Error rendering template: ") + str(e)}
+        if email_template:
+            logger.info(f"Using custom email template: {email_template.name} (ID: {email_template.pk})")
+            subject, html_content, plain_text = email_template.render(context)
         else:
             # Use default template
             logger.info(f"Using default offer email template")
@@ -339,21 +450,42 @@ class ResendEmailService:
 {self.from_name}
             """
         
-        # Send email with sanitized tags
-        result = self.send_email(
+        # Payload with sanitized tags
+        return self._build_params(
             to_email=offer.client_email,
             subject=subject,
             html_content=html_content,
             plain_text=plain_text,
             reply_to=self.user.email if self.user.email else None,
+            attachments=self._pdf_attachments(offer) if attach_pdf else None,
             tags={
                 "type": "offer",
                 "offer_id": str(offer.id),
                 "offer_number": self._sanitize_tag_value(offer.offer_number),
             }
         )
+    
+    def _pdf_attachments(self, document) -> Optional[list]:
+        """Resend attachment for the document PDF (served from the PDF store when unchanged)"""
+        from .pdf import get_document_pdf, pdf_filename
+        
+        try:
+            pdf, _fingerprint = get_document_pdf(document)
+        except Exception as e:
+            # The email still links to the PDF, so a rendering problem should not block sending
+            logger.error(f"Could not render PDF attachment for {document}: {str(e)}")
+            return None
         
-        return result
+        return [{
+            "filename": pdf_filename(document),
+            "content": base64.b64encode(pdf).decode('ascii'),
+        }]
+    
+    def build_document_email(self, document, request=None, email_template=None) -> Dict[str, Any]:
+        """Render the Resend payload for an Invoice or Offer"""
+        if document._meta.model_name == 'invoice':
+            return self.build_invoice_email(document, request, email_template=email_template)
+        return self.build_offer_email(document, request, email_template=email_template)
     
     def send_custom_email(
         self,
@@ -376,12 +508,12 @@ class ResendEmailService:
         Returns:
             Response dictionary with success status
         """
-        from django.template import Template, Context
+        from django.template import Context
+        from apps.templates.cache import compiled_source
         
         try:
-            # Render the template with context
-            template = Template(template_html)
-            html_content = template.render(Context(context or {}))
+            # Render the template with context (compiled once per distinct source)
+            html_content = compiled_source(template_html).render(Context(context or {}))
             
             # Send email
             result = self.send_email(
@@ -0,0 +1,132 @@
+"""
+Bulk export of invoice and offer PDFs to a ZIP archive.
+
+PDFs are produced by a process pool (reportlab rendering is CPU bound and
+holds the GIL) and written into the archive as they complete, so only a
+bounded window of PDFs is in memory at any time. Documents whose PDF is
+already in the content-addressed store (see apps/invoices/pdf.py) are read
+back instead of being re-rendered, and newly rendered ones are stored for
+later downloads.
+"""
+import logging
+import multiprocessing
+import os
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+EXPORT_WORKERS = getattr(settings, 'EXPORT_WORKERS', os.cpu_count() or 2)
+
+# Render jobs in flight per worker; bounds the number of PDFs held in memory
+EXPORT_QUEUE_DEPTH = 4
+
+DATE_FIELDS = {
+    'invoice': 'invoice_date',
+    'offer': 'offer_date',
+}
+
+
+def _document_model(document_type):
+    from .models import Invoice, Offer
+
+    return Invoice if document_type == 'invoice' else Offer
+
+
+def _init_worker():
+    """Process pool initializer: make Django usable in spawned workers"""
+    import django
+
+    django.setup()
+
+
+def _render_document(document_type, pk):
+    """Return (archive name, pdf bytes, render seconds) for one document"""
+    from .pdf import get_document_pdf, pdf_filename
+
+    document = _document_model(document_type).objects.select_related('owner', 'template').get(pk=pk)
+
+    started = time.perf_counter()
+    pdf, _fingerprint = get_document_pdf(document)
+    elapsed = time.perf_counter() - started
+
+    return f'{document_type}s/{pdf_filename(document)}', pdf, elapsed
+
+
+def _percentile(values, percentile):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def export_documents(owner, output, date_from=None, date_to=None, document_types=('invoice', 'offer'),
+                     workers=EXPORT_WORKERS):
+    """
+    Write the PDFs of an owner's invoices/offers in a date range to a ZIP.
+
+    Args:
+        owner: User whose documents are exported
+        output: Path or writable binary file object for the archive
+        date_from: Optional first invoice/offer date (inclusive)
+        date_to: Optional last invoice/offer date (inclusive)
+        document_types: Any of 'invoice', 'offer'
+        workers: Render processes; 0 or 1 renders in the current process
+
+    Returns:
+        Dictionary of export statistics
+    """
+    jobs = []
+    for document_type in document_types:
+        date_field = DATE_FIELDS[document_type]
+        documents = _document_model(document_type).objects.filter(owner=owner)
+        if date_from:
+            documents = documents.filter(**{f'{date_field}__gte': date_from})
+        if date_to:
+            documents = documents.filter(**{f'{date_field}__lte': date_to})
+        jobs += [(document_type, pk) for pk in documents.order_by(date_field, 'pk').values_list('pk', flat=True)]
+
+    if workers > 1 and multiprocessing.current_process().daemon:
+        # e.g. inside a Celery prefork worker, which may not start child processes
+        logger.warning('Document export running in a daemonic process; rendering without a process pool')
+        workers = 1
+
+    render_times = []
+    started = time.perf_counter()
+
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        def write(result):
+            name, pdf, elapsed = result
+            archive.writestr(name, pdf)
+            render_times.append(elapsed)
+
+        if workers <= 1:
+            for job in jobs:
+                write(_render_document(*job))
+        else:
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+                pending = set()
+                for job in jobs:
+                    if len(pending) >= workers * EXPORT_QUEUE_DEPTH:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            write(future.result())
+                    pending.add(pool.submit(_render_document, *job))
+                for future in wait(pending).done:
+                    write(future.result())
+
+    seconds = time.perf_counter() - started
+    return {
+        'documents': len(render_times),
+        'seconds': round(seconds, 2),
+        'docs_per_sec': round(len(render_times) / seconds, 2) if seconds else 0.0,
+        'p95_render_ms': round(_percentile(render_times, 95) * 1000, 1),
+        'workers': max(workers, 1),
+    }
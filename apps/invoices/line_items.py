@@ -0,0 +1,95 @@
+"""
+Batched persistence of invoice and offer line items.
+
+Saving items one by one through InvoiceItem.save()/OfferItem.save() recalculates
+and re-saves the parent document after every row, which costs O(n²) queries
+for an n-line formset. The helpers here write all rows with bulk_create /
+bulk_update / a single DELETE and then recalculate the document totals once
+with a database-side Sum.
+"""
+from django.db import transaction
+
+
+def _line_total(item):
+    return item.quantity * item.unit_price
+
+
+@transaction.atomic
+def save_line_items(formset):
+    """
+    Persist a validated inline formset of InvoiceItem/OfferItem forms in bulk.
+
+    Sets ``new_objects``, ``changed_objects`` and ``deleted_objects`` on the
+    formset like BaseModelFormSet.save() does, so the admin change messages
+    keep working, then recalculates the parent document totals once.
+
+    Returns the list of created and updated items.
+    """
+    document = formset.instance
+    fk_name = formset.fk.name
+    model = formset.model
+
+    to_create = []
+    to_update = []
+    to_delete = []
+    formset.new_objects = []
+    formset.changed_objects = []
+    formset.deleted_objects = []
+
+    for form in formset.forms:
+        if not form.has_changed() and form.instance.pk is None:
+            continue
+
+        if formset.can_delete and formset._should_delete_form(form):
+            if form.instance.pk is not None:
+                to_delete.append(form.instance)
+            continue
+
+        item = form.save(commit=False)
+        setattr(item, fk_name, document)
+        item.total = _line_total(item)
+
+        if item.pk is None:
+            to_create.append(item)
+        elif form.has_changed():
+            to_update.append(item)
+            formset.changed_objects.append((item, form.changed_data))
+
+    if to_delete:
+        model.objects.filter(pk__in=[item.pk for item in to_delete]).delete()
+        formset.deleted_objects = to_delete
+
+    if to_create:
+        model.objects.bulk_create(to_create)
+        formset.new_objects = to_create
+
+    if to_update:
+        model.objects.bulk_update(to_update, ['description', 'quantity', 'unit_price', 'total', 'order'])
+
+    document.calculate_totals()
+
+    return to_create + to_update
+
+
+@transaction.atomic
+def copy_line_items(source, target):
+    """Copy all line items of ``source`` onto ``target`` (e.g. offer → invoice) in bulk"""
+    item_model = target.items.model
+    fk_name = target.items.field.name
+
+    items = [
+        item_model(**{
+            fk_name: target,
+            'description': item.description,
+            'quantity': item.quantity,
+            'unit_price': item.unit_price,
+            'total': item.total,
+            'order': item.order,
+        })
+        for item in source.items.all()
+    ]
+    item_model.objects.bulk_create(items)
+
+    target.calculate_totals()
+
+    return items
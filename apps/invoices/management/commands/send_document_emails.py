@@ -0,0 +1,63 @@
+"""
+Django management command to email many invoices or offers at once.
+Intended for month-end billing runs; emails go out through Resend's batch endpoint.
+"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from apps.invoices.delivery import send_documents_bulk
+from apps.invoices.models import Invoice, Offer
+from apps.invoices.tasks import send_bulk_document_emails
+from apps.templates.models import EmailTemplate
+
+
+class Command(BaseCommand):
+    help = 'Send invoice or offer emails in bulk via the Resend batch API'
+
+    def add_arguments(self, parser):
+        parser.add_argument('username', help='Owner of the documents (their Resend account is used)')
+        parser.add_argument('--type', choices=['invoice', 'offer'], default='invoice', help='Document type')
+        parser.add_argument('--status', action='append', help='Only documents with this status (repeatable)')
+        parser.add_argument('--ids', type=int, nargs='+', help='Only these document IDs')
+        parser.add_argument('--unsent', action='store_true', help='Skip documents that were already emailed')
+        parser.add_argument('--template', type=int, help='Email template ID (default template otherwise)')
+        parser.add_argument('--dry-run', action='store_true', help='Only show how many documents would be emailed')
+        parser.add_argument('--async', action='store_true', dest='run_async', help='Queue the run on Celery')
+
+    def handle(self, *args, **options):
+        User = get_user_model()
+        try:
+            owner = User.objects.get(username=options['username'])
+        except User.DoesNotExist:
+            raise CommandError(f'User "{options["username"]}" does not exist')
+
+        if options['template'] and not EmailTemplate.objects.filter(pk=options['template'], owner=owner).exists():
+            raise CommandError(f'Email template {options["template"]} does not exist for this user')
+
+        model = Invoice if options['type'] == 'invoice' else Offer
+        documents = model.objects.filter(owner=owner)
+        if options['status']:
+            documents = documents.filter(status__in=options['status'])
+        if options['ids']:
+            documents = documents.filter(pk__in=options['ids'])
+        if options['unsent']:
+            documents = documents.filter(email_sent=False)
+
+        count = documents.count()
+        label = model._meta.verbose_name_plural
+        if options['dry_run']:
+            self.stdout.write(f'{count} {label} would be emailed')
+            return
+
+        if options['run_async']:
+            document_ids = list(documents.values_list('pk', flat=True))
+            send_bulk_document_emails.delay(owner.pk, options['type'], document_ids, options['template'])
+            self.stdout.write(self.style.SUCCESS(f'✓ Queued {count} {label}'))
+            return
+
+        self.stdout.write(f'Emailing {count} {label}...')
+        stats = send_documents_bulk(owner, documents, options['template'])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"✓ Sent {stats['sent']} emails ({stats['failed']} failed, {stats['skipped']} without client email)"
+        ))
@@ -0,0 +1,178 @@
+"""
+Set-based payment-to-invoice matching.
+
+Unmatched payments are grouped by owner and matched to open invoices of the
+same owner and currency whose balance due (total_amount - paid_amount) equals
+the payment amount, using an in-memory hash map per owner instead of one
+query per (payment, invoice) pair.
+
+Conflicts are resolved deterministically: payments are processed oldest
+first (payment_date, created_at, id) and each one takes the open invoice
+with the earliest due date (then invoice_date, id). An invoice is matched
+at most once per run. All updates for an owner are applied in one
+transaction with bulk_update, after re-checking the locked rows.
+"""
+from collections import defaultdict, deque
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import Invoice, Payment
+
+OPEN_INVOICE_STATUSES = ['sent', 'partially_paid', 'overdue']
+
+
+def _unmatched_payments():
+    return Payment.objects.filter(is_matched=False, invoice__isnull=True)
+
+
+def _plan_owner_matches(payments, owner_id):
+    """Return [(payment, invoice)] pairs for one owner's unmatched payments"""
+    currencies = {payment.currency for payment in payments}
+    amounts = {payment.amount for payment in payments}
+
+    invoices = (
+        Invoice.objects.filter(
+            owner_id=owner_id,
+            currency__in=currencies,
+            status__in=OPEN_INVOICE_STATUSES,
+        )
+        .annotate(balance=F('total_amount') - F('paid_amount'))
+        .filter(balance__in=amounts)
+        .only('id', 'owner_id', 'currency', 'total_amount', 'paid_amount', 'status', 'due_date', 'invoice_date')
+        .order_by('due_date', 'invoice_date', 'id')
+    )
+
+    candidates = defaultdict(deque)
+    for invoice in invoices:
+        candidates[(invoice.currency, invoice.balance)].append(invoice)
+
+    pairs = []
+    for payment in payments:
+        queue = candidates.get((payment.currency, payment.amount))
+        if queue:
+            pairs.append((payment, queue.popleft()))
+    return pairs
+
+
+@transaction.atomic
+def _apply_matches(pairs):
+    """Lock, re-validate and write the planned matches; return (matched, conflicts)"""
+    payment_ids = [payment.pk for payment, _ in pairs]
+    invoice_ids = [invoice.pk for _, invoice in pairs]
+
+    locked_payments = {
+        payment.pk: payment
+        for payment in _unmatched_payments().select_for_update().filter(pk__in=payment_ids)
+    }
+    locked_invoices = {
+        invoice.pk: invoice
+        for invoice in Invoice.objects.select_for_update().filter(pk__in=invoice_ids, status__in=OPEN_INVOICE_STATUSES)
+    }
+
+    now = timezone.now()
+    payments_to_update = []
+    invoices_to_update = []
+    conflicts = 0
+
+    for planned_payment, planned_invoice in pairs:
+        payment = locked_payments.get(planned_payment.pk)
+        invoice = locked_invoices.get(planned_invoice.pk)
+
+        # Someone else matched or changed these rows since we planned
+        if payment is None or invoice is None or invoice.balance_due != payment.amount:
+            conflicts += 1
+            continue
+
+        payment.invoice = invoice
+        payment.is_matched = True
+        payment.updated_at = now
+        payments_to_update.append(payment)
+
+        invoice.paid_amount += payment.amount
+        invoice.status = 'paid' if invoice.is_paid else 'partially_paid'
+        invoice.updated_at = now
+        invoices_to_update.append(invoice)
+
+    Payment.objects.bulk_update(payments_to_update, ['invoice', 'is_matched', 'updated_at'])
+    Invoice.objects.bulk_update(invoices_to_update, ['paid_amount', 'status', 'updated_at'])
+
+    return len(payments_to_update), conflicts
+
+
+def match_payments(payments=None):
+    """
+    Match unmatched payments to open invoices.
+
+    Args:
+        payments: Optional Payment queryset to restrict the run to; defaults
+            to every unmatched payment.
+
+    Returns:
+        Dictionary of match statistics
+    """
+    queryset = _unmatched_payments()
+    if payments is not None:
+        queryset = queryset.filter(pk__in=payments.values('pk'))
+
+    stats = {
+        'payments': 0,
+        'owners': 0,
+        'matched': 0,
+        'conflicts': 0,
+        'unmatched': 0,
+    }
+
+    owner_ids = list(queryset.order_by().values_list('owner_id', flat=True).distinct())
+
+    for owner_id in owner_ids:
+        owner_payments = list(
+            queryset.filter(owner_id=owner_id)
+            .only('id', 'owner_id', 'currency', 'amount', 'payment_date', 'created_at')
+            .order_by('payment_date', 'created_at', 'id')
+        )
+        stats['owners'] += 1
+        stats['payments'] += len(owner_payments)
+
+        pairs = _plan_owner_matches(owner_payments, owner_id)
+        if pairs:
+            matched, conflicts = _apply_matches(pairs)
+            stats['matched'] += matched
+            stats['conflicts'] += conflicts
+
+    stats['unmatched'] = stats['payments'] - stats['matched']
+    return stats
+
+
+def apply_linked_payments(payments):
+    """
+    Book newly created payments that name their invoice.
+
+    Adds each payment to its invoice's paid amount and moves the invoice to
+    paid / partially paid, like payment_create does for a single payment,
+    but with one locked read and one bulk_update per batch.
+
+    Returns:
+        Number of invoices updated
+    """
+    amounts = defaultdict(int)
+    payment_ids = []
+    for payment in payments:
+        if payment.invoice_id:
+            amounts[payment.invoice_id] += payment.amount
+            payment_ids.append(payment.pk)
+
+    if not amounts:
+        return 0
+
+    now = timezone.now()
+    with transaction.atomic():
+        invoices = list(Invoice.objects.select_for_update().filter(pk__in=list(amounts)))
+        for invoice in invoices:
+            invoice.paid_amount += amounts[invoice.pk]
+            invoice.status = 'paid' if invoice.is_paid else 'partially_paid'
+            invoice.updated_at = now
+        Invoice.objects.bulk_update(invoices, ['paid_amount', 'status', 'updated_at'])
+        Payment.objects.filter(pk__in=payment_ids).update(is_matched=True, updated_at=now)
+
+    return len(invoices)
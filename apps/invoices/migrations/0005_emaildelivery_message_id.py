@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0004_emaildelivery'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emaildelivery',
+            name='message_id',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Resend message ID'),
+        ),
+    ]
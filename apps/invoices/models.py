@@ -3,10 +3,6 @@ from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.urls import reverse
 from apps.crm.models import Contact, Company
-import qrcode
-from io import BytesIO
-from django.core.files import File
-from PIL import Image
 
 
 class Invoice(models.Model):
@@ -66,6 +62,12 @@ class Invoice(models.Model):
         verbose_name = _('invoice')
         verbose_name_plural = _('invoices')
         ordering = ['-invoice_date', '-invoice_number']
+        indexes = [
+            models.Index(fields=['owner', 'status', '-invoice_date'], name='invoice_owner_status_date_idx'),
+            models.Index(fields=['owner', '-invoice_date'], name='invoice_owner_date_idx'),
+            models.Index(fields=['owner', 'currency', 'status'], name='invoice_owner_curr_status_idx'),
+            models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+        ]
     
     def __str__(self):
         return f"{self.invoice_number} - {self.client_name}"
@@ -74,33 +76,19 @@ class Invoice(models.Model):
         return reverse('invoices:invoice_detail', kwargs={'pk': self.pk})
     
     def calculate_totals(self):
-        """Calculate invoice totals"""
-        self.subtotal = sum(item.total for item in self.items.all())
+        """Calculate invoice totals with a single database-side Sum over the items"""
+        self.subtotal = self.items.aggregate(subtotal=models.Sum('total'))['subtotal'] or 0
         self.tax_amount = self.subtotal * (self.tax_rate / 100)
         self.total_amount = self.subtotal + self.tax_amount
-        self.save()
+        self.save(update_fields=['subtotal', 'tax_amount', 'total_amount', 'updated_at'])
     
     def generate_qr_code(self):
-        """Generate QR code for payment"""
+        """Point the invoice at the (shared, content-addressed) QR code of its payment URL"""
+        from apps.invoices.qr import ensure_qr_code
+        
         if self.payment_url:
-            qr = qrcode.QRCode(
-                version=1,
-                error_correction=qrcode.constants.ERROR_CORRECT_L,
-                box_size=10,
-                border=4,
-            )
-            qr.add_data(self.payment_url)
-            qr.make(fit=True)
-            
-            img = qr.make_image(fill_color="black", back_color="white")
-            
-            buffer = BytesIO()
-            img.save(buffer, format='PNG')
-            buffer.seek(0)
-            
-            filename = f'qr_code_{self.invoice_number}.png'
-            self.qr_code.save(filename, File(buffer), save=False)
-            self.save()
+            self.qr_code.name = ensure_qr_code(self.payment_url)
+            self.save(update_fields=['qr_code', 'updated_at'])
     
     @property
     def balance_due(self):
@@ -125,7 +113,11 @@ class Invoice(models.Model):
         result = email_service.send_invoice_email(self, request, email_template_id=email_template_id)
         
         if not result.get('success'):
-            raise Exception(result.get('error', _('Failed to send email')))
+            error = result.get('error', _('Failed to send email'))
+            if result.get('permanent'):
+                # Missing template or rendering error - retrying will not help
+                raise ValueError(error)
+            raise Exception(error)
         
         # Update email tracking
         self.email_sent = True
@@ -157,11 +149,13 @@ class InvoiceItem(models.Model):
         verbose_name_plural = _('invoice items')
         ordering = ['invoice', 'order']
     
-    def save(self, *args, **kwargs):
+    def save(self, *args, recalculate_totals=True, **kwargs):
         self.total = self.quantity * self.unit_price
         super().save(*args, **kwargs)
-        # Update invoice totals
-        self.invoice.calculate_totals()
+        # Update invoice totals (batched writers pass recalculate_totals=False
+        # and recalculate once, see apps/invoices/line_items.py)
+        if recalculate_totals:
+            self.invoice.calculate_totals()
     
     def __str__(self):
         return f"{self.invoice.invoice_number} - {self.description}"
@@ -226,6 +220,10 @@ class Offer(models.Model):
         verbose_name = _('offer')
         verbose_name_plural = _('offers')
         ordering = ['-offer_date', '-offer_number']
+        indexes = [
+            models.Index(fields=['owner', 'status', '-offer_date'], name='offer_owner_status_date_idx'),
+            models.Index(fields=['owner', '-offer_date'], name='offer_owner_date_idx'),
+        ]
     
     def __str__(self):
         return f"{self.offer_number} - {self.client_name}"
@@ -234,11 +232,11 @@ class Offer(models.Model):
         return reverse('invoices:offer_detail', kwargs={'pk': self.pk})
     
     def calculate_totals(self):
-        """Calculate offer totals"""
-        self.subtotal = sum(item.total for item in self.items.all())
+        """Calculate offer totals with a single database-side Sum over the items"""
+        self.subtotal = self.items.aggregate(subtotal=models.Sum('total'))['subtotal'] or 0
         self.tax_amount = self.subtotal * (self.tax_rate / 100)
         self.total_amount = self.subtotal + self.tax_amount
-        self.save()
+        self.save(update_fields=['subtotal', 'tax_amount', 'total_amount', 'updated_at'])
     
     def send_email(self, request=None, email_template_id=None):
         """Send offer email to client using Resend"""
@@ -255,7 +253,11 @@ class Offer(models.Model):
         result = email_service.send_offer_email(self, request, email_template_id=email_template_id)
         
         if not result.get('success'):
-            raise Exception(result.get('error', _('Failed to send email')))
+            error = result.get('error', _('Failed to send email'))
+            if result.get('permanent'):
+                # Missing template or rendering error - retrying will not help
+                raise ValueError(error)
+            raise Exception(error)
         
         # Update email tracking
         self.email_sent = True
@@ -287,11 +289,13 @@ class OfferItem(models.Model):
         verbose_name_plural = _('offer items')
         ordering = ['offer', 'order']
     
-    def save(self, *args, **kwargs):
+    def save(self, *args, recalculate_totals=True, **kwargs):
         self.total = self.quantity * self.unit_price
         super().save(*args, **kwargs)
-        # Update offer totals
-        self.offer.calculate_totals()
+        # Update offer totals (batched writers pass recalculate_totals=False
+        # and recalculate once, see apps/invoices/line_items.py)
+        if recalculate_totals:
+            self.offer.calculate_totals()
     
     def __str__(self):
         return f"{self.offer.offer_number} - {self.description}"
@@ -333,6 +337,10 @@ class Payment(models.Model):
         verbose_name = _('payment')
         verbose_name_plural = _('payments')
         ordering = ['-payment_date', '-created_at']
+        indexes = [
+            models.Index(fields=['owner', '-payment_date'], name='payment_owner_date_idx'),
+            models.Index(fields=['owner', 'currency', 'is_matched'], name='payment_owner_curr_matched_idx'),
+        ]
     
     def __str__(self):
         return f"Payment {self.amount} {self.currency} - {self.payment_date}"
@@ -342,26 +350,54 @@ class Payment(models.Model):
         if self.invoice or self.is_matched:
             return
         
-        # Try to find matching invoice by amount and currency
-        potential_invoices = Invoice.objects.filter(
-            owner=self.owner,
-            currency=self.currency,
-            status__in=['sent', 'partially_paid', 'overdue']
-        )
-        
-        # Look for exact amount match
-        for invoice in potential_invoices:
-            if invoice.balance_due == self.amount:
-                self.invoice = invoice
-                self.is_matched = True
-                self.save()
-                
-                # Update invoice
-                invoice.paid_amount += self.amount
-                if invoice.is_paid:
-                    invoice.status = 'paid'
-                else:
-                    invoice.status = 'partially_paid'
-                invoice.save()
-                break
+        # Match by amount and currency in the database (see apps/invoices/matching.py)
+        from apps.invoices.matching import match_payments
+        match_payments(Payment.objects.filter(pk=self.pk))
+        self.refresh_from_db(fields=['invoice', 'is_matched', 'updated_at'])
+
 
+class EmailDelivery(models.Model):
+    """Queued outbound invoice/offer email, sent by a Celery task"""
+    
+    STATUS_CHOICES = [
+        ('queued', _('Queued')),
+        ('sending', _('Sending')),
+        ('sent', _('Sent')),
+        ('failed', _('Failed')),
+    ]
+    
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='email_deliveries')
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, null=True, blank=True, related_name='email_deliveries')
+    offer = models.ForeignKey(Offer, on_delete=models.CASCADE, null=True, blank=True, related_name='email_deliveries')
+    
+    to_email = models.EmailField(_('recipient'))
+    email_template_id = models.IntegerField(_('email template ID'), null=True, blank=True)
+    
+    status = models.CharField(_('status'), max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.IntegerField(_('attempts'), default=0)
+    last_error = models.TextField(_('last error'), blank=True)
+    message_id = models.CharField(_('Resend message ID'), max_length=100, blank=True)
+    next_attempt_at = models.DateTimeField(_('next attempt at'), null=True, blank=True)
+    sent_at = models.DateTimeField(_('sent at'), null=True, blank=True)
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = _('email delivery')
+        verbose_name_plural = _('email deliveries')
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['owner', 'status'], name='emaildelivery_owner_status_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.to_email} - {self.get_status_display()}"
+    
+    @property
+    def document(self):
+        return self.invoice or self.offer
+    
+    @property
+    def is_pending(self):
+        return self.status in ('queued', 'sending')
@@ -0,0 +1,432 @@
+"""
+PDF rendering for invoices and offers.
+
+Documents are drawn with reportlab, styled by the document's DocumentTemplate
+(or the owner's default one): colours, font family, logo, header/footer text.
+
+Rendered files are stored content-addressed under PDF_STORAGE_PREFIX, named by
+a hash of everything that ends up on the page (document fields, line items,
+sender details and the template's updated_at). Repeat downloads and email
+attachments read the stored file; any edit changes the hash and the next
+request renders a fresh PDF, replacing the document's previous one.
+
+Text is set in the DejaVu TrueType fonts from PDF_FONT_DIR, since reportlab's
+built-in Type1 fonts have no Cyrillic glyphs.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils.html import strip_tags
+from django.utils.translation import gettext as _
+from .qr import stored_qr_png
+
+logger = logging.getLogger(__name__)
+
+# Bump when the layout below changes so previously stored PDFs are not reused
+PDF_RENDERER_VERSION = 2
+
+PDF_STORAGE_PREFIX = 'pdfs'
+
+DEFAULT_PRIMARY_COLOR = '#007bff'
+DEFAULT_SECONDARY_COLOR = '#6c757d'
+
+HEX_COLOR_RE = re.compile(r'^#[0-9a-fA-F]{6}$')
+
+DOCUMENT_FIELDS = {
+    'invoice': [
+        'invoice_number', 'invoice_date', 'due_date', 'client_name', 'client_email',
+        'client_address', 'client_vat_number', 'currency', 'subtotal', 'tax_rate',
+        'tax_amount', 'total_amount', 'paid_amount', 'status', 'notes', 'terms',
+    ],
+    'offer': [
+        'offer_number', 'offer_date', 'valid_until', 'client_name', 'client_email',
+        'client_address', 'currency', 'subtotal', 'tax_rate', 'tax_amount',
+        'total_amount', 'status', 'notes', 'terms',
+    ],
+}
+
+SENDER_FIELDS = ['company_name', 'address', 'city', 'postal_code', 'country', 'vat_number']
+
+# (regular, bold) TrueType files per font family, looked up in PDF_FONT_DIR
+PDF_FONT_FILES = {
+    'DejaVuSans': ('DejaVuSans.ttf', 'DejaVuSans-Bold.ttf'),
+    'DejaVuSerif': ('DejaVuSerif.ttf', 'DejaVuSerif-Bold.ttf'),
+    'DejaVuSansMono': ('DejaVuSansMono.ttf', 'DejaVuSansMono-Bold.ttf'),
+}
+
+_registered_fonts = None
+_font_lock = threading.Lock()
+
+
+def get_document_template(document):
+    """The DocumentTemplate styling a document: its own, else the owner's default"""
+    from apps.templates.models import DocumentTemplate
+
+    if document.template_id:
+        return document.template
+    return DocumentTemplate.objects.filter(
+        owner_id=document.owner_id,
+        template_type=document._meta.model_name,
+        is_default=True,
+    ).first()
+
+
+def document_fingerprint(document, template=None, items=None):
+    """Hash of every input that affects the rendered PDF"""
+    model_name = document._meta.model_name
+    if items is None:
+        items = list(document.items.all())
+
+    payload = {
+        'version': PDF_RENDERER_VERSION,
+        'type': model_name,
+        'id': document.pk,
+        'fields': {field: getattr(document, field) for field in DOCUMENT_FIELDS[model_name]},
+        'items': [
+            [item.description, item.quantity, item.unit_price, item.total, item.order]
+            for item in items
+        ],
+        'sender': {field: getattr(document.owner, field) for field in SENDER_FIELDS},
+        'template': [template.pk, template.updated_at] if template else None,
+        'qr_code': document.qr_code.name if model_name == 'invoice' and document.qr_code else None,
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def _document_pdf_dir(document):
+    return f'{PDF_STORAGE_PREFIX}/{document._meta.model_name}/{document.owner_id}/{document.pk}'
+
+
+def _purge_superseded_pdfs(directory, keep):
+    """Delete the stored PDFs of a document other than ``keep``"""
+    try:
+        _dirs, files = default_storage.listdir(directory)
+    except (FileNotFoundError, NotImplementedError):
+        return
+    for name in files:
+        if name != keep:
+            default_storage.delete(f'{directory}/{name}')
+
+
+def delete_document_pdfs(document):
+    """Delete every stored PDF of a document, e.g. before it is deleted"""
+    _purge_superseded_pdfs(_document_pdf_dir(document), keep=None)
+
+
+def get_document_pdf(document):
+    """
+    Return ``(pdf_bytes, fingerprint)`` for an invoice or offer.
+
+    Served from storage when a PDF with the same fingerprint exists,
+    otherwise rendered and stored in place of the document's older PDFs.
+    """
+    template = get_document_template(document)
+    items = list(document.items.all())
+    fingerprint = document_fingerprint(document, template, items)
+    directory = _document_pdf_dir(document)
+    filename = f'{fingerprint}.pdf'
+    path = f'{directory}/{filename}'
+
+    if default_storage.exists(path):
+        with default_storage.open(path, 'rb') as stored:
+            return stored.read(), fingerprint
+
+    pdf = render_document_pdf(document, template, items)
+    # A concurrent request may have stored the same PDF while this one rendered;
+    # saving again would only add a suffixed copy
+    if not default_storage.exists(path):
+        saved = default_storage.save(path, ContentFile(pdf))
+        if saved != path:
+            default_storage.delete(saved)
+    _purge_superseded_pdfs(directory, filename)
+    return pdf, fingerprint
+
+
+def pdf_filename(document):
+    if document._meta.model_name == 'invoice':
+        return f'invoice_{document.invoice_number}.pdf'
+    return f'offer_{document.offer_number}.pdf'
+
+
+def _color(value, default):
+    from reportlab.lib import colors
+
+    return colors.HexColor(value if value and HEX_COLOR_RE.match(value) else default)
+
+
+def _register_fonts():
+    """Register the available DejaVu families with reportlab once per process"""
+    global _registered_fonts
+
+    with _font_lock:
+        if _registered_fonts is not None:
+            return _registered_fonts
+
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFError, TTFont
+
+        font_dir = getattr(settings, 'PDF_FONT_DIR', '')
+        registered = set()
+        for family, (regular_file, bold_file) in PDF_FONT_FILES.items():
+            regular_path = os.path.join(font_dir, regular_file)
+            bold_path = os.path.join(font_dir, bold_file)
+            if not (os.path.isfile(regular_path) and os.path.isfile(bold_path)):
+                continue
+            try:
+                pdfmetrics.registerFont(TTFont(family, regular_path))
+                pdfmetrics.registerFont(TTFont(f'{family}-Bold', bold_path))
+            except TTFError:
+                logger.exception("Could not load PDF font %s from %s", family, font_dir)
+                continue
+            # <b> in Paragraph markup resolves through the family
+            pdfmetrics.registerFontFamily(
+                family, normal=family, bold=f'{family}-Bold',
+                italic=family, boldItalic=f'{family}-Bold',
+            )
+            registered.add(family)
+
+        if 'DejaVuSans' not in registered:
+            logger.error(
+                "DejaVuSans.ttf and DejaVuSans-Bold.ttf not found in PDF_FONT_DIR=%r; "
+                "PDFs fall back to Type1 fonts without Cyrillic glyphs", font_dir,
+            )
+        _registered_fonts = registered
+        return registered
+
+
+def _font_names(font_family):
+    """Map a CSS font-family to a registered Unicode (regular, bold) font pair"""
+    family = (font_family or '').lower()
+    if 'courier' in family or 'mono' in family:
+        candidates = ['DejaVuSansMono', 'DejaVuSans']
+    elif 'times' in family or ('serif' in family and 'sans' not in family):
+        candidates = ['DejaVuSerif', 'DejaVuSans']
+    else:
+        candidates = ['DejaVuSans']
+
+    registered = _register_fonts()
+    for name in candidates:
+        if name in registered:
+            return name, f'{name}-Bold'
+    return 'Helvetica', 'Helvetica-Bold'
+
+
+def _paragraph_text(value):
+    """Escape user text for a reportlab Paragraph, keeping line breaks"""
+    from xml.sax.saxutils import escape
+
+    return escape(str(value)).replace('\n', '<br/>')
+
+
+def _read_file(field):
+    """Contents of a FieldFile, or None if it cannot be read"""
+    try:
+        with field.open('rb') as source:
+            return source.read()
+    except (OSError, ValueError):
+        return None
+
+
+def _image(data, max_width, max_height):
+    """Flowable for image bytes scaled to fit, or None without data"""
+    from reportlab.lib.utils import ImageReader
+    from reportlab.platypus import Image
+
+    if not data:
+        return None
+
+    width, height = ImageReader(BytesIO(data)).getSize()
+    scale = min(max_width / width, max_height / height, 1)
+    return Image(BytesIO(data), width=width * scale, height=height * scale)
+
+
+def render_document_pdf(document, template=None, items=None):
+    """Render an invoice or offer to PDF bytes"""
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_RIGHT
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import mm
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+    is_invoice = document._meta.model_name == 'invoice'
+    if items is None:
+        items = list(document.items.all())
+
+    primary = _color(template.primary_color if template else None, DEFAULT_PRIMARY_COLOR)
+    secondary = _color(template.secondary_color if template else None, DEFAULT_SECONDARY_COLOR)
+    font, bold_font = _font_names(template.font_family if template else None)
+
+    styles = getSampleStyleSheet()
+    normal = ParagraphStyle('DocNormal', parent=styles['Normal'], fontName=font, fontSize=9, leading=12)
+    right = ParagraphStyle('DocRight', parent=normal, alignment=TA_RIGHT)
+    muted = ParagraphStyle('DocMuted', parent=normal, textColor=secondary, fontSize=8, leading=10)
+    title = ParagraphStyle('DocTitle', parent=styles['Title'], fontName=bold_font, textColor=primary, alignment=0)
+
+    buffer = BytesIO()
+    pdf = SimpleDocTemplate(
+        buffer,
+        pagesize=A4,
+        leftMargin=18 * mm,
+        rightMargin=18 * mm,
+        topMargin=16 * mm,
+        bottomMargin=16 * mm,
+        title=pdf_filename(document)[:-4],
+    )
+    width = pdf.width
+    story = []
+
+    # Header: title and number, logo on the right
+    heading = [
+        Paragraph(_('INVOICE') if is_invoice else _('OFFER'), title),
+        Paragraph(_paragraph_text(document.invoice_number if is_invoice else document.offer_number), normal),
+    ]
+    logo = _image(_read_file(template.logo), 50 * mm, 25 * mm) if template and template.logo else None
+    header = Table([[heading, logo or '']], colWidths=[width * 0.6, width * 0.4])
+    header.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('ALIGN', (1, 0), (1, 0), 'RIGHT'),
+        ('LINEBELOW', (0, 0), (-1, 0), 2, primary),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+    ]))
+    story += [header, Spacer(1, 6 * mm)]
+
+    if template and template.header_content:
+        story += [Paragraph(_paragraph_text(strip_tags(template.header_content)), normal), Spacer(1, 4 * mm)]
+
+    # Parties and dates
+    owner = document.owner
+    sender = [f'<b>{_("From")}:</b>', owner.company_name or owner.get_full_name() or owner.username]
+    if owner.address:
+        sender.append(owner.address)
+    if owner.city:
+        sender.append(', '.join(part for part in [owner.postal_code, owner.city, owner.country] if part))
+    if owner.vat_number:
+        sender.append(f'{_("VAT")}: {owner.vat_number}')
+
+    recipient = [f'<b>{_("Bill To") if is_invoice else _("To")}:</b>', document.client_name]
+    if document.client_address:
+        recipient.append(document.client_address)
+    if is_invoice and document.client_vat_number:
+        recipient.append(f'{_("VAT")}: {document.client_vat_number}')
+    if document.client_email:
+        recipient.append(document.client_email)
+
+    if is_invoice:
+        dates = [
+            f'<b>{_("Invoice Date")}:</b> {document.invoice_date:%d/%m/%Y}',
+            f'<b>{_("Due Date")}:</b> {document.due_date:%d/%m/%Y}',
+        ]
+    else:
+        dates = [
+            f'<b>{_("Offer Date")}:</b> {document.offer_date:%d/%m/%Y}',
+            f'<b>{_("Valid Until")}:</b> {document.valid_until:%d/%m/%Y}',
+        ]
+
+    def lines(values):
+        # Labels are trusted markup; user values are escaped
+        return '<br/>'.join(values[:1] + [_paragraph_text(value) for value in values[1:]])
+
+    parties = Table(
+        [[Paragraph(lines(sender), normal), Paragraph('<br/>'.join(dates), right)],
+         [Paragraph(lines(recipient), normal), '']],
+        colWidths=[width * 0.6, width * 0.4],
+    )
+    parties.setStyle(TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('TOPPADDING', (0, 1), (-1, 1), 10),
+    ]))
+    story += [parties, Spacer(1, 8 * mm)]
+
+    # Line items and totals
+    currency = document.currency
+    rows = [[_('Description'), _('Qty'), _('Unit Price'), _('Total')]]
+    for item in items:
+        rows.append([
+            Paragraph(_paragraph_text(item.description), normal),
+            f'{item.quantity}',
+            f'{currency} {item.unit_price:.2f}',
+            f'{currency} {item.total:.2f}',
+        ])
+    item_count = len(rows)
+
+    totals = [
+        (_('Subtotal'), document.subtotal),
+        (_('Tax ({rate}%)').format(rate=document.tax_rate), document.tax_amount),
+        (_('TOTAL'), document.total_amount),
+    ]
+    if is_invoice:
+        totals += [(_('Paid'), document.paid_amount), (_('BALANCE DUE'), document.balance_due)]
+    for label, amount in totals:
+        rows.append(['', '', f'{label}:', f'{currency} {amount:.2f}'])
+
+    table = Table(rows, colWidths=[width * 0.49, width * 0.11, width * 0.2, width * 0.2], repeatRows=1)
+    table_style = [
+        ('FONTNAME', (0, 0), (-1, -1), font),
+        ('FONTSIZE', (0, 0), (-1, -1), 9),
+        ('FONTNAME', (0, 0), (-1, 0), bold_font),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.white),
+        ('BACKGROUND', (0, 0), (-1, 0), primary),
+        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+        ('LINEBELOW', (0, 1), (-1, item_count - 1), 0.25, colors.HexColor('#dee2e6')),
+        ('TOPPADDING', (0, item_count), (-1, item_count), 8),
+    ]
+    # Emphasise the grand total (and balance due on invoices)
+    emphasised = [item_count + 2] + ([item_count + 4] if is_invoice else [])
+    for row in emphasised:
+        table_style += [
+            ('FONTNAME', (2, row), (3, row), bold_font),
+            ('LINEABOVE', (2, row), (3, row), 1, primary),
+        ]
+    table.setStyle(TableStyle(table_style))
+    story += [table, Spacer(1, 8 * mm)]
+
+    if is_invoice and document.qr_code:
+        # Shared QR images are usually already in the in-process PNG cache
+        try:
+            qr_png = stored_qr_png(document.qr_code.name)
+        except OSError:
+            qr_png = None
+        qr_code = _image(qr_png, 35 * mm, 35 * mm)
+        if qr_code:
+            qr_table = Table([[Paragraph(f'<b>{_("Scan to Pay")}:</b>', normal), qr_code]],
+                             colWidths=[width - 40 * mm, 40 * mm])
+            qr_table.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'MIDDLE')]))
+            story += [qr_table, Spacer(1, 6 * mm)]
+
+    if document.notes:
+        story += [
+            Paragraph(f'<b>{_("Notes")}:</b>', normal),
+            Paragraph(_paragraph_text(document.notes), normal),
+            Spacer(1, 6 * mm),
+        ]
+
+    if document.terms:
+        story += [
+            Paragraph(f'<b>{_("Terms & Conditions")}:</b>', muted),
+            Paragraph(_paragraph_text(document.terms), muted),
+        ]
+
+    footer_text = strip_tags(template.footer_content) if template and template.footer_content else ''
+
+    def draw_footer(canvas, doc):
+        canvas.saveState()
+        canvas.setFont(font, 7)
+        canvas.setFillColor(secondary)
+        if footer_text:
+            canvas.drawString(doc.leftMargin, 10 * mm, footer_text.replace('\n', ' ')[:180])
+        canvas.drawRightString(doc.leftMargin + doc.width, 10 * mm, str(doc.page))
+        canvas.restoreState()
+
+    pdf.build(story, onFirstPage=draw_footer, onLaterPages=draw_footer)
+    return buffer.getvalue()
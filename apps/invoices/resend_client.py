@@ -0,0 +1,177 @@
+"""
+Thread-safe, pooled Resend API clients.
+
+The resend SDK reads its API key from the module-global ``resend.api_key``,
+so two tenants sending at the same time from a threaded gunicorn or Celery
+worker can end up using each other's key. Instead, every API key gets its own
+ResendClient holding a keep-alive requests.Session, and clients are shared
+through a small LRU registry so repeated sends reuse TLS connections.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+RESEND_API_URL = 'https://api.resend.com'
+
+# Number of API keys (tenants) whose clients are kept alive
+RESEND_CLIENT_CACHE_SIZE = getattr(settings, 'RESEND_CLIENT_CACHE_SIZE', 64)
+
+# Clients unused for longer than this are closed on the next lookup
+RESEND_CLIENT_IDLE_TIMEOUT = getattr(settings, 'RESEND_CLIENT_IDLE_TIMEOUT', 10 * 60)
+
+# Concurrent connections kept per client (roughly the worker thread count)
+RESEND_POOL_MAXSIZE = getattr(settings, 'RESEND_POOL_MAXSIZE', 10)
+
+RESEND_TIMEOUT = getattr(settings, 'RESEND_TIMEOUT', (5, 30))
+
+# Requests per second allowed per API key (Resend's default team limit is 2/s)
+RESEND_RATE_LIMIT = getattr(settings, 'RESEND_RATE_LIMIT', 2)
+
+# Maximum emails per POST /emails/batch call
+RESEND_BATCH_SIZE = 100
+
+RESEND_MAX_RATE_LIMIT_RETRIES = 3
+
+
+class ResendError(Exception):
+    """Error response from the Resend API"""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ResendClient:
+    """Resend API client bound to one API key with a pooled HTTP session"""
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.session = requests.Session()
+        self.session.headers.update({
+            'Authorization': f'Bearer {api_key}',
+            'Content-Type': 'application/json',
+        })
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=RESEND_POOL_MAXSIZE)
+        self.session.mount('https://', adapter)
+        self.last_used = time.monotonic()
+        self._rate_lock = threading.Lock()
+        self._next_request_at = 0.0
+
+    def _throttle(self):
+        """Space requests on this key evenly so all threads together stay under RESEND_RATE_LIMIT"""
+        if not RESEND_RATE_LIMIT:
+            return
+        with self._rate_lock:
+            now = time.monotonic()
+            wait = self._next_request_at - now
+            self._next_request_at = max(now, self._next_request_at) + 1.0 / RESEND_RATE_LIMIT
+        if wait > 0:
+            time.sleep(wait)
+
+    def request(self, method, path, payload=None):
+        self.last_used = time.monotonic()
+
+        for attempt in range(RESEND_MAX_RATE_LIMIT_RETRIES + 1):
+            self._throttle()
+            response = self.session.request(method, f'{RESEND_API_URL}{path}', json=payload, timeout=RESEND_TIMEOUT)
+            if response.status_code != 429 or attempt == RESEND_MAX_RATE_LIMIT_RETRIES:
+                break
+            # Rate limited anyway (e.g. another process shares the key); back off as instructed
+            try:
+                retry_after = float(response.headers.get('Retry-After', 1))
+            except ValueError:
+                retry_after = 1
+            time.sleep(retry_after)
+
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+
+        if response.status_code >= 400:
+            message = data.get('message') or response.text or response.reason
+            raise ResendError(message, status_code=response.status_code)
+
+        return data
+
+    def send(self, params):
+        """Send a single email; ``params`` uses the resend.Emails.send format"""
+        return self.request('POST', '/emails', params)
+
+    def send_batch(self, params_list):
+        """
+        Send up to RESEND_BATCH_SIZE emails in one request.
+
+        Returns the list of created email ids, in the order of ``params_list``.
+        """
+        if len(params_list) > RESEND_BATCH_SIZE:
+            raise ValueError(f'Resend accepts at most {RESEND_BATCH_SIZE} emails per batch')
+        response = self.request('POST', '/emails/batch', params_list)
+        return [item.get('id') for item in response.get('data', [])]
+
+    def close(self):
+        self.session.close()
+
+
+class ResendClientRegistry:
+    """LRU cache of ResendClient instances keyed by API key, safe to share across threads"""
+
+    def __init__(self, maxsize=RESEND_CLIENT_CACHE_SIZE, idle_timeout=RESEND_CLIENT_IDLE_TIMEOUT):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, api_key):
+        """Return the shared client for ``api_key``, creating it if needed"""
+        evicted = []
+        with self._lock:
+            client = self._clients.get(api_key)
+            if client is not None:
+                self._clients.move_to_end(api_key)
+            else:
+                client = ResendClient(api_key)
+                self._clients[api_key] = client
+            client.last_used = time.monotonic()
+
+            evicted.extend(self._evict())
+
+        # Close sessions outside the lock; in-flight requests on them still complete
+        for stale in evicted:
+            stale.close()
+
+        return client
+
+    def _evict(self):
+        """Drop idle clients and trim to maxsize (least recently used first)"""
+        now = time.monotonic()
+        evicted = []
+        while self._clients:
+            key, oldest = next(iter(self._clients.items()))
+            if len(self._clients) > self.maxsize or now - oldest.last_used > self.idle_timeout:
+                evicted.append(self._clients.pop(key))
+            else:
+                break
+        return evicted
+
+    def clear(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+        for client in clients:
+            client.close()
+
+    def __len__(self):
+        return len(self._clients)
+
+
+registry = ResendClientRegistry()
+
+
+def get_client(api_key):
+    """Shared, pooled Resend client for an API key"""
+    return registry.get(api_key)
@@ -1,52 +1,220 @@
+import sqlite3
+
 from celery import shared_task
+from django.db import connection, transaction
+from django.db.models import F
 from django.utils import timezone
 from datetime import timedelta
-from .models import Invoice, Payment
+from .models import Invoice, Offer, EmailDelivery
+from .delivery import EMAIL_MAX_RETRIES, queue_document_email, retry_countdown, send_documents_bulk
+from .matching import match_payments
+from .qr import generate_qr_codes
+import logging
+
+logger = logging.getLogger(__name__)
+
+REMINDER_CHUNK_SIZE = 200
 
 
 @shared_task
 def match_payments_with_invoices():
     """Automatically match unmatched payments with invoices"""
-    unmatched_payments = Payment.objects.filter(is_matched=False, invoice__isnull=True)
+    stats = match_payments()
     
-    matched_count = 0
-    for payment in unmatched_payments:
-        payment.match_to_invoice()
-        if payment.is_matched:
-            matched_count += 1
-    
-    return f"Matched {matched_count} payments"
+    return (
+        f"Matched {stats['matched']} of {stats['payments']} payments "
+        f"across {stats['owners']} owners ({stats['conflicts']} conflicts, {stats['unmatched']} unmatched)"
+    )
 
 
 @shared_task
 def send_payment_reminders():
-    """Send payment reminders for overdue invoices"""
+    """Mark overdue invoices and fan reminder sending out in chunks"""
     today = timezone.now().date()
     
-    # Mark overdue invoices
-    overdue_invoices = Invoice.objects.filter(
-        status__in=['sent', 'partially_paid'],
-        due_date__lt=today
+    # Single set-based UPDATE ... RETURNING, no per-invoice saves or signals
+    overdue_ids = mark_overdue_invoices(today)
+    
+    for start in range(0, len(overdue_ids), REMINDER_CHUNK_SIZE):
+        send_overdue_reminders.delay(overdue_ids[start:start + REMINDER_CHUNK_SIZE])
+    
+    return f"Updated {len(overdue_ids)} overdue invoices"
+
+
+def _supports_update_returning():
+    """
+    Whether the database supports UPDATE ... RETURNING.
+    
+    connection.features.can_return_columns_from_insert only covers INSERT
+    and is also true on MariaDB, which has no UPDATE ... RETURNING.
+    """
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 35)
+    return False
+
+
+def mark_overdue_invoices(today):
+    """
+    Flip sent/partially paid invoices past their due date to 'overdue'.
+    
+    Returns:
+        List of the affected invoice ids
+    """
+    statuses = ['sent', 'partially_paid']
+    now = timezone.now()
+    
+    if _supports_update_returning():
+        table = connection.ops.quote_name(Invoice._meta.db_table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"UPDATE {table} SET status = %s, updated_at = %s "
+                f"WHERE status IN (%s, %s) AND due_date < %s RETURNING id",
+                [
+                    'overdue',
+                    connection.ops.adapt_datetimefield_value(now),
+                    *statuses,
+                    connection.ops.adapt_datefield_value(today),
+                ],
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    with transaction.atomic():
+        overdue = Invoice.objects.select_for_update().filter(status__in=statuses, due_date__lt=today)
+        overdue_ids = list(overdue.values_list('id', flat=True))
+        Invoice.objects.filter(id__in=overdue_ids).update(status='overdue', updated_at=now)
+    return overdue_ids
+
+
+@shared_task
+def send_overdue_reminders(invoice_ids):
+    """Queue payment reminders for a chunk of overdue invoices"""
+    from apps.templates.models import EmailTemplate
+    
+    invoices = list(
+        Invoice.objects.filter(id__in=invoice_ids, status='overdue', owner__payment_reminders_enabled=True)
+        .exclude(client_email='')
+    )
+    
+    # Owners who opted in are reminded with their default active reminder template
+    reminder_templates = dict(
+        EmailTemplate.objects.filter(
+            owner_id__in={invoice.owner_id for invoice in invoices},
+            template_type='reminder',
+            is_default=True,
+            is_active=True,
+        ).values_list('owner_id', 'id')
     )
     
-    for invoice in overdue_invoices:
-        invoice.status = 'overdue'
-        invoice.save()
+    queued = 0
+    for invoice in invoices:
+        template_id = reminder_templates.get(invoice.owner_id)
+        if not template_id:
+            continue
+        # EmailDelivery row plus deliver_document_email with its retries
+        queue_document_email(invoice, email_template_id=template_id)
+        queued += 1
     
-    return f"Updated {overdue_invoices.count()} overdue invoices"
+    return f"Queued {queued} payment reminders"
 
 
 @shared_task
 def generate_invoice_qr_codes():
     """Generate QR codes for invoices that have payment URLs but no QR code"""
-    invoices_without_qr = Invoice.objects.filter(
-        payment_url__isnull=False
-    ).exclude(payment_url='').filter(qr_code='')
+    stats = generate_qr_codes(Invoice.objects.all())
+    
+    return f"Linked {stats['invoices']} invoices to QR codes ({stats['images']} new images)"
+
+
+@shared_task(bind=True, max_retries=EMAIL_MAX_RETRIES)
+def deliver_document_email(self, delivery_id):
+    """Send a queued invoice/offer email, retrying with exponential backoff"""
+    delivery = EmailDelivery.objects.select_related(
+        'invoice__owner', 'invoice__company', 'offer__owner', 'offer__company'
+    ).filter(pk=delivery_id).first()
+    
+    if delivery is None or delivery.status == 'sent':
+        return f"Delivery {delivery_id} skipped"
+    
+    deliveries = EmailDelivery.objects.filter(pk=delivery.pk)
+    document = delivery.document
+    if document is None:
+        deliveries.update(status='failed', last_error='Document no longer exists', updated_at=timezone.now())
+        return f"Delivery {delivery_id} failed: document deleted"
+    
+    deliveries.update(status='sending', attempts=F('attempts') + 1, next_attempt_at=None, updated_at=timezone.now())
+    attempts = delivery.attempts + 1
+    
+    try:
+        document.send_email(email_template_id=delivery.email_template_id)
+    except ValueError as e:
+        # Missing recipient, template or rendering error - retrying will not help
+        deliveries.update(status='failed', last_error=str(e), updated_at=timezone.now())
+        return f"Delivery {delivery_id} failed: {e}"
+    except Exception as e:
+        if attempts > self.max_retries:
+            deliveries.update(status='failed', last_error=str(e), updated_at=timezone.now())
+            logger.error(f"Email delivery {delivery_id} failed after {attempts} attempts: {e}")
+            return f"Delivery {delivery_id} failed: {e}"
+        
+        countdown = retry_countdown(attempts)
+        deliveries.update(
+            status='queued',
+            last_error=str(e),
+            next_attempt_at=timezone.now() + timedelta(seconds=countdown),
+            updated_at=timezone.now(),
+        )
+        logger.warning(f"Email delivery {delivery_id} attempt {attempts} failed, retrying in {countdown:.0f}s: {e}")
+        raise self.retry(exc=e, countdown=countdown)
+    
+    deliveries.update(status='sent', last_error='', sent_at=timezone.now(), updated_at=timezone.now())
+    return f"Delivery {delivery_id} sent to {delivery.to_email}"
+
+
+@shared_task
+def send_bulk_document_emails(owner_id, document_type, document_ids, email_template_id=None):
+    """Send many invoice/offer emails of one owner through Resend's batch endpoint"""
+    from django.contrib.auth import get_user_model
+    
+    owner = get_user_model().objects.get(pk=owner_id)
+    model = Invoice if document_type == 'invoice' else Offer
     
-    count = 0
-    for invoice in invoices_without_qr:
-        invoice.generate_qr_code()
-        count += 1
+    stats = send_documents_bulk(owner, model.objects.filter(pk__in=document_ids), email_template_id)
     
-    return f"Generated {count} QR codes"
+    return (
+        f"Sent {stats['sent']} of {stats['documents']} {document_type} emails "
+        f"({stats['failed']} failed, {stats['skipped']} without client email)"
+    )
+
 
+@shared_task
+def export_documents_archive(owner_id, date_from=None, date_to=None, document_types=('invoice', 'offer'), workers=None):
+    """Export an owner's invoice/offer PDFs for a period to a ZIP in default storage"""
+    import tempfile
+    from django.contrib.auth import get_user_model
+    from django.core.files import File
+    from django.core.files.storage import default_storage
+    from .export import EXPORT_WORKERS, export_documents
+    
+    owner = get_user_model().objects.get(pk=owner_id)
+    
+    # Build the archive on local disk, then hand it to the storage backend
+    with tempfile.TemporaryFile() as archive:
+        stats = export_documents(
+            owner,
+            archive,
+            date_from=date_from,
+            date_to=date_to,
+            document_types=document_types,
+            workers=workers or EXPORT_WORKERS,
+        )
+        archive.seek(0)
+        
+        name = f"exports/{owner_id}/documents_{date_from or 'start'}_{date_to or 'today'}_{timezone.now():%Y%m%d%H%M%S}.zip"
+        path = default_storage.save(name, File(archive))
+    
+    return (
+        f"Exported {stats['documents']} documents to {path} in {stats['seconds']}s "
+        f"({stats['docs_per_sec']} docs/sec, p95 render {stats['p95_render_ms']} ms)"
+    )
@@ -7,6 +7,7 @@ urlpatterns = [
     # Invoices
     path('', views.invoice_list, name='invoice_list'),
     path('create/', views.invoice_create, name='invoice_create'),
+    path('send-emails/', views.invoice_bulk_send_email, name='invoice_bulk_send_email'),
     path('<int:pk>/', views.invoice_detail, name='invoice_detail'),
     path('<int:pk>/edit/', views.invoice_update, name='invoice_update'),
     path('<int:pk>/delete/', views.invoice_delete, name='invoice_delete'),
@@ -16,14 +17,19 @@ urlpatterns = [
     # Offers
     path('offers/', views.offer_list, name='offer_list'),
     path('offers/create/', views.offer_create, name='offer_create'),
+    path('offers/send-emails/', views.offer_bulk_send_email, name='offer_bulk_send_email'),
     path('offers/<int:pk>/', views.offer_detail, name='offer_detail'),
     path('offers/<int:pk>/edit/', views.offer_update, name='offer_update'),
     path('offers/<int:pk>/delete/', views.offer_delete, name='offer_delete'),
+    path('offers/<int:pk>/pdf/', views.offer_pdf, name='offer_pdf'),
     path('offers/<int:pk>/convert/', views.offer_convert_to_invoice, name='offer_convert'),
     path('offers/<int:pk>/send-email/', views.offer_send_email, name='offer_send_email'),
     
     # Payments
     path('payments/', views.payment_list, name='payment_list'),
     path('payments/create/', views.payment_create, name='payment_create'),
+    
+    # Email deliveries
+    path('deliveries/<int:pk>/status/', views.email_delivery_status, name='email_delivery_status'),
 ]
 
@@ -2,11 +2,16 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils.translation import gettext as _
-from django.core.paginator import Paginator
-from django.http import HttpResponse
-from django.template.loader import render_to_string
-from .models import Invoice, InvoiceItem, Offer, OfferItem, Payment
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse
+from .models import Invoice, InvoiceItem, Offer, OfferItem, Payment, EmailDelivery
+from .delivery import queue_document_email
+from .tasks import send_bulk_document_emails
+from .pdf import delete_document_pdfs, get_document_pdf, pdf_filename
+from .qr import qr_code_path
 from .forms import InvoiceForm, InvoiceItemForm, OfferForm, OfferItemForm, PaymentForm
+from .line_items import save_line_items, copy_line_items
+from apps.crm.cache import rate_limit
+from apps.crm.pagination import paginate
 from django.forms import inlineformset_factory
 
 
@@ -20,18 +25,26 @@ def invoice_list(request):
     if status:
         invoices = invoices.filter(status=status)
     
-    paginator = Paginator(invoices, 20)
-    page_number = request.GET.get('page')
-    invoices_page = paginator.get_page(page_number)
+    invoices_page = paginate(request, invoices)
     
-    return render(request, 'invoices/invoice_list.html', {'invoices': invoices_page, 'status': status})
+    from apps.templates.models import EmailTemplate
+    email_templates = EmailTemplate.objects.filter(owner=request.user, template_type='invoice', is_active=True)
+    
+    return render(request, 'invoices/invoice_list.html', {
+        'invoices': invoices_page,
+        'status': status,
+        'email_templates': email_templates,
+    })
 
 
 @login_required
 def invoice_detail(request, pk):
     """Invoice detail view"""
     invoice = get_object_or_404(Invoice, pk=pk, owner=request.user)
-    return render(request, 'invoices/invoice_detail.html', {'invoice': invoice})
+    return render(request, 'invoices/invoice_detail.html', {
+        'invoice': invoice,
+        'email_delivery': invoice.email_deliveries.first(),
+    })
 
 
 @login_required
@@ -52,9 +65,7 @@ def invoice_create(request):
             invoice.save()
             
             formset.instance = invoice
-            formset.save()
-            
-            invoice.calculate_totals()
+            save_line_items(formset)
             
             # Generate QR code if payment URL provided
             if invoice.payment_url:
@@ -88,11 +99,10 @@ def invoice_update(request, pk):
         
         if form.is_valid() and formset.is_valid():
             invoice = form.save()
-            formset.save()
-            invoice.calculate_totals()
+            save_line_items(formset)
             
-            # Generate QR code if payment URL provided
-            if invoice.payment_url and not invoice.qr_code:
+            # Generate QR code if payment URL provided or changed
+            if invoice.payment_url and invoice.qr_code.name != qr_code_path(invoice.payment_url):
                 invoice.generate_qr_code()
             
             messages.success(request, _('Invoice updated successfully.'))
@@ -114,6 +124,7 @@ def invoice_delete(request, pk):
     """Delete invoice"""
     invoice = get_object_or_404(Invoice, pk=pk, owner=request.user)
     if request.method == 'POST':
+        delete_document_pdfs(invoice)
         invoice.delete()
         messages.success(request, _('Invoice deleted successfully.'))
         return redirect('invoices:invoice_list')
@@ -123,17 +134,24 @@ def invoice_delete(request, pk):
 
 @login_required
 def invoice_pdf(request, pk):
-    """Generate PDF for invoice"""
-    invoice = get_object_or_404(Invoice, pk=pk, owner=request.user)
-    
-    # Simple HTML response for now, can be enhanced with reportlab
-    html = render_to_string('invoices/invoice_pdf.html', {'invoice': invoice})
+    """Download the invoice as PDF"""
+    invoice = get_object_or_404(Invoice.objects.select_related('owner', 'template'), pk=pk, owner=request.user)
+    return _pdf_response(request, invoice)
+
+
+def _pdf_response(request, document):
+    """Serve the stored (or freshly rendered) PDF of an invoice or offer"""
+    pdf, fingerprint = get_document_pdf(document)
     
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = f'attachment; filename="invoice_{invoice.invoice_number}.pdf"'
+    etag = f'"{fingerprint}"'
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponseNotModified()
     
-    # For simplicity, returning HTML. In production, use reportlab or weasyprint
-    return HttpResponse(html)
+    response = HttpResponse(pdf, content_type='application/pdf')
+    response['Content-Disposition'] = f'inline; filename="{pdf_filename(document)}"'
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 # Offer Views
@@ -146,18 +164,26 @@ def offer_list(request):
     if status:
         offers = offers.filter(status=status)
     
-    paginator = Paginator(offers, 20)
-    page_number = request.GET.get('page')
-    offers_page = paginator.get_page(page_number)
+    offers_page = paginate(request, offers)
     
-    return render(request, 'invoices/offer_list.html', {'offers': offers_page, 'status': status})
+    from apps.templates.models import EmailTemplate
+    email_templates = EmailTemplate.objects.filter(owner=request.user, template_type='offer', is_active=True)
+    
+    return render(request, 'invoices/offer_list.html', {
+        'offers': offers_page,
+        'status': status,
+        'email_templates': email_templates,
+    })
 
 
 @login_required
 def offer_detail(request, pk):
     """Offer detail view"""
     offer = get_object_or_404(Offer, pk=pk, owner=request.user)
-    return render(request, 'invoices/offer_detail.html', {'offer': offer})
+    return render(request, 'invoices/offer_detail.html', {
+        'offer': offer,
+        'email_delivery': offer.email_deliveries.first(),
+    })
 
 
 @login_required
@@ -178,9 +204,7 @@ def offer_create(request):
             offer.save()
             
             formset.instance = offer
-            formset.save()
-            
-            offer.calculate_totals()
+            save_line_items(formset)
             
             messages.success(request, _('Offer created successfully.'))
             return redirect('invoices:offer_detail', pk=offer.pk)
@@ -210,8 +234,7 @@ def offer_update(request, pk):
         
         if form.is_valid() and formset.is_valid():
             offer = form.save()
-            formset.save()
-            offer.calculate_totals()
+            save_line_items(formset)
             
             messages.success(request, _('Offer updated successfully.'))
             return redirect('invoices:offer_detail', pk=offer.pk)
@@ -227,11 +250,19 @@ def offer_update(request, pk):
     })
 
 
+@login_required
+def offer_pdf(request, pk):
+    """Download the offer as PDF"""
+    offer = get_object_or_404(Offer.objects.select_related('owner', 'template'), pk=pk, owner=request.user)
+    return _pdf_response(request, offer)
+
+
 @login_required
 def offer_delete(request, pk):
     """Delete offer"""
     offer = get_object_or_404(Offer, pk=pk, owner=request.user)
     if request.method == 'POST':
+        delete_document_pdfs(offer)
         offer.delete()
         messages.success(request, _('Offer deleted successfully.'))
         return redirect('invoices:offer_list')
@@ -268,18 +299,8 @@ def offer_convert_to_invoice(request, pk):
         terms=offer.terms,
     )
     
-    # Copy items
-    for offer_item in offer.items.all():
-        InvoiceItem.objects.create(
-            invoice=invoice,
-            description=offer_item.description,
-            quantity=offer_item.quantity,
-            unit_price=offer_item.unit_price,
-            total=offer_item.total,
-            order=offer_item.order,
-        )
-    
-    invoice.calculate_totals()
+    # Copy items and recalculate totals once
+    copy_line_items(offer, invoice)
     
     # Update offer
     offer.converted_to_invoice = invoice
@@ -296,9 +317,7 @@ def payment_list(request):
     """List all payments"""
     payments = Payment.objects.filter(owner=request.user)
     
-    paginator = Paginator(payments, 20)
-    page_number = request.GET.get('page')
-    payments_page = paginator.get_page(page_number)
+    payments_page = paginate(request, payments)
     
     return render(request, 'invoices/payment_list.html', {'payments': payments_page})
 
@@ -379,14 +398,15 @@ def invoice_send_email(request, pk):
         except EmailTemplate.DoesNotExist:
             pass
     
+    # Delivery happens in a Celery worker; the detail page polls its status
     try:
-        invoice.send_email(request=request, email_template_id=template_id)
-        messages.success(request, _('Invoice email sent successfully to {email} using {template}').format(
+        queue_document_email(invoice, email_template_id=template_id)
+        messages.success(request, _('Invoice email to {email} using {template} has been queued for delivery').format(
             email=invoice.client_email,
             template=template_name
         ))
     except Exception as e:
-        messages.error(request, _('Failed to send email: {error}').format(error=str(e)))
+        messages.error(request, _('Failed to queue email: {error}').format(error=str(e)))
     
     return redirect('invoices:invoice_detail', pk=invoice.pk)
 
@@ -432,14 +452,77 @@ def offer_send_email(request, pk):
         except EmailTemplate.DoesNotExist:
             pass
     
+    # Delivery happens in a Celery worker; the detail page polls its status
     try:
-        offer.send_email(request=request, email_template_id=template_id)
-        messages.success(request, _('Offer email sent successfully to {email} using {template}').format(
+        queue_document_email(offer, email_template_id=template_id)
+        messages.success(request, _('Offer email to {email} using {template} has been queued for delivery').format(
             email=offer.client_email,
             template=template_name
         ))
     except Exception as e:
-        messages.error(request, _('Failed to send email: {error}').format(error=str(e)))
+        messages.error(request, _('Failed to queue email: {error}').format(error=str(e)))
     
     return redirect('invoices:offer_detail', pk=offer.pk)
 
+
+@login_required
+def email_delivery_status(request, pk):
+    """Current state of a queued invoice/offer email, polled by the detail pages"""
+    delivery = get_object_or_404(EmailDelivery, pk=pk, owner=request.user)
+    
+    return JsonResponse({
+        'id': delivery.pk,
+        'status': delivery.status,
+        'status_display': delivery.get_status_display(),
+        'is_pending': delivery.is_pending,
+        'to_email': delivery.to_email,
+        'attempts': delivery.attempts,
+        'last_error': delivery.last_error,
+        'next_attempt_at': delivery.next_attempt_at.isoformat() if delivery.next_attempt_at else None,
+        'sent_at': delivery.sent_at.isoformat() if delivery.sent_at else None,
+    })
+
+
+def _bulk_send_email(request, model, document_type):
+    """Queue one batch send for the documents selected in a list view"""
+    document_ids = [int(pk) for pk in request.POST.getlist('selected') if pk.isdigit()]
+    document_ids = list(
+        model.objects.filter(owner=request.user, pk__in=document_ids).values_list('pk', flat=True)
+    )
+    
+    if not document_ids:
+        messages.error(request, _('Select at least one document to send.'))
+        return
+    
+    template_id = request.POST.get('email_template', '').strip() or None
+    if template_id:
+        from apps.templates.models import EmailTemplate
+        # The worker would fail on someone else's (or a deleted) template without sending anything
+        if not template_id.isdigit() or not EmailTemplate.objects.filter(id=template_id, owner=request.user).exists():
+            messages.error(request, _('Email template not found'))
+            return
+        template_id = int(template_id)
+    
+    # Guard against accidental double submissions of a mass send
+    if not rate_limit(f'bulk_send_email:{request.user.pk}', limit=3, period=60):
+        messages.error(request, _('Too many bulk sends. Please wait a moment and try again.'))
+        return
+    
+    send_bulk_document_emails.delay(request.user.pk, document_type, document_ids, template_id)
+    messages.success(request, _('Sending {count} emails in the background.').format(count=len(document_ids)))
+
+
+@login_required
+def invoice_bulk_send_email(request):
+    """Email all selected invoices at once"""
+    if request.method == 'POST':
+        _bulk_send_email(request, Invoice, 'invoice')
+    return redirect('invoices:invoice_list')
+
+
+@login_required
+def offer_bulk_send_email(request):
+    """Email all selected offers at once"""
+    if request.method == 'POST':
+        _bulk_send_email(request, Offer, 'offer')
+    return redirect('invoices:offer_list')
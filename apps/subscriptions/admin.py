@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Subscription, SubscriptionHistory, Invoice
+from .models import Subscription, SubscriptionHistory, Invoice, StripeEvent, StripeSyncCursor
 
 
 @admin.register(Subscription)
@@ -25,3 +25,18 @@ class InvoiceAdmin(admin.ModelAdmin):
     search_fields = ('stripe_invoice_id', 'subscription__user__email')
     ordering = ('-created_at',)
 
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    list_display = ('event_id', 'event_type', 'ordering_key', 'status', 'attempts', 'received_at', 'processed_at')
+    list_filter = ('status', 'event_type', 'received_at')
+    search_fields = ('event_id', 'ordering_key')
+    ordering = ('-received_at',)
+    readonly_fields = ('received_at', 'processed_at')
+
+
+@admin.register(StripeSyncCursor)
+class StripeSyncCursorAdmin(admin.ModelAdmin):
+    list_display = ('name', 'cursor', 'updated_at')
+    readonly_fields = ('last_stats', 'updated_at')
@@ -6,3 +6,5 @@ class SubscriptionsConfig(AppConfig):
     name = 'apps.subscriptions'
     verbose_name = 'Subscriptions'
 
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -1,4 +1,5 @@
 from django.conf import settings
+from .snapshot import get_subscription_snapshot
 
 
 def subscription_context(request):
@@ -6,13 +7,10 @@ def subscription_context(request):
     context = {}
     
     if request.user.is_authenticated:
-        try:
-            subscription = request.user.subscription
-            context['user_subscription'] = subscription
-            context['user_plan'] = subscription.get_plan_config()
-        except:
-            context['user_subscription'] = None
-            context['user_plan'] = settings.SUBSCRIPTION_PLANS.get('free', {})
+        # Shares the request-memoized snapshot with SubscriptionMiddleware
+        subscription = get_subscription_snapshot(request)
+        context['user_subscription'] = subscription
+        context['user_plan'] = subscription.get_plan_config()
     
     context['subscription_plans'] = settings.SUBSCRIPTION_PLANS
     
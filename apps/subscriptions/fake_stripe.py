@@ -0,0 +1,162 @@
+"""
+In-memory stand-in for the subset of the Stripe API used by reconciliation.
+
+FakeStripe exposes ``Subscription.list`` and ``Event.list`` with Stripe's
+filters (customer, status, created ranges, event types), newest-first
+ordering, ``limit``/``starting_after`` pagination and ``auto_paging_iter``.
+Objects are plain dicts shaped like Stripe's. Calls are counted per
+resource so runs can be checked for the number of API requests.
+"""
+import itertools
+import threading
+import time
+from collections import Counter
+
+
+class FakeListObject(dict):
+    """One page of results, like stripe.ListObject"""
+    
+    def __init__(self, resource, params, data, has_more):
+        super().__init__(object='list', data=data, has_more=has_more)
+        self._resource = resource
+        self._params = params
+    
+    def auto_paging_iter(self):
+        page = self
+        while True:
+            yield from page['data']
+            if not page['has_more'] or not page['data']:
+                return
+            page = self._resource.list(**{**self._params, 'starting_after': page['data'][-1]['id']})
+
+
+def _created_matches(created, condition):
+    if condition is None:
+        return True
+    if not isinstance(condition, dict):
+        return created == condition
+    checks = {
+        'gt': lambda bound: created > bound,
+        'gte': lambda bound: created >= bound,
+        'lt': lambda bound: created < bound,
+        'lte': lambda bound: created <= bound,
+    }
+    return all(checks[op](bound) for op, bound in condition.items())
+
+
+class _FakeResource:
+    def __init__(self, stripe, name):
+        self._stripe = stripe
+        self._name = name
+    
+    def _objects(self):
+        raise NotImplementedError
+    
+    def _matches(self, obj, params):
+        return _created_matches(obj['created'], params.get('created'))
+    
+    def list(self, limit=10, starting_after=None, **params):
+        with self._stripe._lock:
+            self._stripe.calls[self._name] += 1
+            objects = sorted(
+                (obj for obj in self._objects() if self._matches(obj, params)),
+                key=lambda obj: (obj['created'], obj['_seq']),
+                reverse=True,
+            )
+        if starting_after:
+            ids = [obj['id'] for obj in objects]
+            objects = objects[ids.index(starting_after) + 1:] if starting_after in ids else []
+        page = [{k: v for k, v in obj.items() if k != '_seq'} for obj in objects[:limit]]
+        return FakeListObject(self, {'limit': limit, **params}, page, len(objects) > limit)
+
+
+class _FakeSubscriptions(_FakeResource):
+    def _objects(self):
+        return self._stripe.subscriptions.values()
+    
+    def _matches(self, obj, params):
+        status = params.get('status')
+        if status is None and obj['status'] == 'canceled':
+            # Stripe omits canceled subscriptions unless asked for them
+            return False
+        if status not in (None, 'all') and obj['status'] != status:
+            return False
+        if params.get('customer') and obj['customer'] != params['customer']:
+            return False
+        return super()._matches(obj, params)
+
+
+class _FakeEvents(_FakeResource):
+    def _objects(self):
+        return self._stripe.events
+    
+    def _matches(self, obj, params):
+        types = params.get('types') or ([params['type']] if params.get('type') else None)
+        if types and obj['type'] not in types:
+            return False
+        return super()._matches(obj, params)
+
+
+class FakeStripe:
+    """Offline Stripe with a controllable clock"""
+    
+    def __init__(self, now=None):
+        self.now = int(now if now is not None else time.time())
+        self.subscriptions = {}
+        self.events = []
+        self.calls = Counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.Subscription = _FakeSubscriptions(self, 'Subscription')
+        self.Event = _FakeEvents(self, 'Event')
+    
+    def tick(self, seconds=1):
+        self.now += seconds
+    
+    def _id(self, prefix):
+        return f'{prefix}_fake{next(self._ids):08d}'
+    
+    def _record(self, event_type, sub):
+        snapshot = {k: v for k, v in sub.items() if k != '_seq'}
+        self.events.append({
+            'id': self._id('evt'),
+            'type': event_type,
+            'created': self.now,
+            'data': {'object': snapshot},
+            '_seq': next(self._ids),
+        })
+    
+    def add_subscription(self, customer, price, status='active', period_days=30, **fields):
+        """Create a subscription (and its customer.subscription.created event)"""
+        sub = {
+            'id': self._id('sub'),
+            'object': 'subscription',
+            'customer': customer,
+            'status': status,
+            'created': self.now,
+            'current_period_start': self.now,
+            'current_period_end': self.now + period_days * 86400,
+            'cancel_at_period_end': False,
+            'items': {'data': [{'price': {'id': price}}]},
+            '_seq': next(self._ids),
+            **fields,
+        }
+        self.subscriptions[sub['id']] = sub
+        self._record('customer.subscription.created', sub)
+        return sub
+    
+    def update_subscription(self, sub_id, price=None, **fields):
+        """Change a subscription (and record customer.subscription.updated)"""
+        sub = self.subscriptions[sub_id]
+        if price:
+            sub['items'] = {'data': [{'price': {'id': price}}]}
+        sub.update(fields)
+        self._record('customer.subscription.updated', sub)
+        return sub
+    
+    def cancel_subscription(self, sub_id):
+        """Cancel a subscription (and record customer.subscription.deleted)"""
+        sub = self.subscriptions[sub_id]
+        sub['status'] = 'canceled'
+        self._record('customer.subscription.deleted', sub)
+        return sub
@@ -1,96 +1,72 @@
 """
 Django management command to sync subscriptions from Stripe.
 This fixes subscriptions that weren't updated due to missing webhooks.
+
+Runs are incremental: only Stripe changes since the previous run are
+fetched (see apps/subscriptions/reconciliation.py). Use --full to rescan
+everything and --fake to exercise the sync offline against FakeStripe.
 """
 
-from django.core.management.base import BaseCommand
-from django.conf import settings
-from apps.accounts.models import User
-from apps.subscriptions.models import Subscription, SubscriptionHistory
-import stripe
+import random
 
-stripe.api_key = settings.STRIPE_SECRET_KEY
+from django.core.management.base import BaseCommand
+from apps.subscriptions.fake_stripe import FakeStripe
+from apps.subscriptions.models import Subscription
+from apps.subscriptions.reconciliation import STRIPE_SYNC_WORKERS, SubscriptionReconciler
 
 
 class Command(BaseCommand):
     help = 'Sync subscriptions from Stripe to fix missing updates'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Ignore the cursor and scan all Stripe subscriptions')
+        parser.add_argument('--workers', type=int, default=STRIPE_SYNC_WORKERS,
+                            help='Concurrent per-customer Stripe lookups')
+        parser.add_argument('--dry-run', action='store_true', help='Report changes without writing them')
+        parser.add_argument('--fake', action='store_true',
+                            help='Run against an in-memory Stripe seeded from local subscriptions (implies --dry-run)')
+        parser.add_argument('--fake-changes', type=float, default=0.1,
+                            help='Share of fake subscriptions whose plan differs from the local one')
+
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('\n🔄 Syncing Subscriptions from Stripe\n'))
         self.stdout.write('=' * 50)
-        
-        # Get all users with Stripe customer IDs
-        users_with_stripe = Subscription.objects.exclude(stripe_customer_id__isnull=True).exclude(stripe_customer_id='')
-        
-        self.stdout.write(f'\nFound {users_with_stripe.count()} users with Stripe customers\n')
-        
-        updated_count = 0
-        
-        for subscription in users_with_stripe:
-            user = subscription.user
-            self.stdout.write(f'\n📋 Checking {user.email}...')
-            self.stdout.write(f'   Current plan: {subscription.plan}')
-            self.stdout.write(f'   Stripe customer: {subscription.stripe_customer_id}')
-            
-            try:
-                # Get all subscriptions for this customer from Stripe
-                stripe_subscriptions = stripe.Subscription.list(
-                    customer=subscription.stripe_customer_id,
-                    status='active',
-                    limit=10
-                )
-                
-                if stripe_subscriptions.data:
-                    # Get the most recent active subscription
-                    stripe_sub = stripe_subscriptions.data[0]
-                    
-                    self.stdout.write(f'   ✅ Found active Stripe subscription: {stripe_sub.id}')
-                    
-                    # Get the price ID
-                    price_id = stripe_sub['items']['data'][0]['price']['id']
-                    self.stdout.write(f'   Price ID: {price_id}')
-                    
-                    # Map price ID to plan
-                    plan_map = {
-                        settings.STRIPE_PRICE_FREE: 'free',
-                        settings.STRIPE_PRICE_BASIC: 'basic',
-                        settings.STRIPE_PRICE_PRO: 'pro',
-                        settings.STRIPE_PRICE_ENTERPRISE: 'enterprise',
-                    }
-                    
-                    new_plan = plan_map.get(price_id)
-                    
-                    if new_plan and new_plan != subscription.plan:
-                        old_plan = subscription.plan
-                        subscription.plan = new_plan
-                        subscription.status = 'active'
-                        subscription.stripe_subscription_id = stripe_sub.id
-                        subscription.save()
-                        
-                        # Create history entry
-                        SubscriptionHistory.objects.create(
-                            user=user,
-                            subscription=subscription,
-                            from_plan=old_plan,
-                            to_plan=new_plan,
-                            reason='Synced from Stripe'
-                        )
-                        
-                        self.stdout.write(self.style.SUCCESS(
-                            f'   🎉 Updated {user.email}: {old_plan} → {new_plan}'
-                        ))
-                        updated_count += 1
-                    elif new_plan == subscription.plan:
-                        self.stdout.write(f'   ℹ️  Already up to date ({new_plan})')
-                    else:
-                        self.stdout.write(f'   ⚠️  Unknown price ID: {price_id}')
-                else:
-                    self.stdout.write(f'   ℹ️  No active subscriptions in Stripe')
-            
-            except stripe.error.StripeError as e:
-                self.stdout.write(self.style.ERROR(f'   ❌ Stripe error: {str(e)}'))
-            except Exception as e:
-                self.stdout.write(self.style.ERROR(f'   ❌ Error: {str(e)}'))
-        
+
+        if options['fake']:
+            reconciler = self._fake_reconciler(options)
+        else:
+            reconciler = SubscriptionReconciler(workers=options['workers'], dry_run=options['dry_run'])
+
+        stats = reconciler.run(full=options['full'] or options['fake'])
+
+        self.stdout.write(f"\nMode: {stats['mode']}{' (dry run)' if stats['dry_run'] else ''}")
+        self.stdout.write(f"Stripe subscriptions fetched: {stats['stripe_subscriptions']}")
+        self.stdout.write(f"Per-customer lookups: {stats['customer_lookups']}")
+        self.stdout.write(f"Local subscriptions checked: {stats['checked']}")
+        if options['fake']:
+            self.stdout.write(f"Stripe API calls: {dict(reconciler.client.calls)}")
+
         self.stdout.write('\n' + '=' * 50)
-        self.stdout.write(self.style.SUCCESS(f'\n✅ Sync complete! Updated {updated_count} subscription(s)\n'))
+        self.stdout.write(self.style.SUCCESS(
+            f"\n✅ Sync complete! Updated {stats['updated']} subscription(s), "
+            f"{stats['plan_changes']} plan change(s) in {stats['seconds']}s\n"
+        ))
+
+    def _fake_reconciler(self, options):
+        """Reconciler against a FakeStripe mirroring local data, with some plans changed"""
+        fake = FakeStripe()
+        reconciler = SubscriptionReconciler(client=fake, workers=options['workers'], dry_run=True)
+        if not reconciler.plans:
+            reconciler.plans = {f'price_{plan}': plan for plan in ('free', 'basic', 'pro', 'enterprise')}
+        prices = {plan: price for price, plan in reconciler.plans.items()}
+
+        subscriptions = Subscription.objects.exclude(stripe_customer_id='')
+        for subscription in subscriptions.iterator():
+            plan = subscription.plan
+            if random.random() < options['fake_changes']:
+                plan = random.choice([other for other in prices if other != plan])
+            fake.add_subscription(subscription.stripe_customer_id, prices.get(plan, f'price_{plan}'))
+            fake.tick()
+
+        self.stdout.write(f'\nSeeded fake Stripe with {len(fake.subscriptions)} subscriptions')
+        return reconciler
@@ -2,6 +2,7 @@ from django.shortcuts import redirect
 from django.urls import reverse
 from django.contrib import messages
 from django.utils.translation import gettext as _
+from .snapshot import get_subscription_snapshot
 
 
 class SubscriptionMiddleware:
@@ -20,6 +21,7 @@ class SubscriptionMiddleware:
             '/static/',
             '/media/',
             '/i18n/',
+            '/api/',  # checked by apps.api.permissions.HasAPIAccess
         ]
     
     def __call__(self, request):
@@ -32,23 +34,14 @@ class SubscriptionMiddleware:
         if not request.user.is_authenticated:
             return self.get_response(request)
         
-        # Check subscription status
-        try:
-            subscription = request.user.subscription
-            
-            # Check if subscription is expired or cancelled
-            if subscription.status in ['expired', 'cancelled']:
-                if not path.startswith('/subscriptions/'):
-                    messages.warning(request, _('Your subscription has expired. Please renew to continue using the CRM.'))
-                    return redirect('subscriptions:plans')
-        except:
-            # No subscription found, create free subscription
-            from .models import Subscription
-            Subscription.objects.create(
-                user=request.user,
-                plan='free',
-                status='active'
-            )
+        # Check subscription status (cached snapshot, no per-request queries;
+        # a free subscription is created on first access)
+        subscription = get_subscription_snapshot(request)
+        
+        # Check if subscription is expired or cancelled
+        if subscription.status in ['expired', 'cancelled']:
+            if not path.startswith('/subscriptions/'):
+                messages.warning(request, _('Your subscription has expired. Please renew to continue using the CRM.'))
+                return redirect('subscriptions:plans')
         
         return self.get_response(request)
-
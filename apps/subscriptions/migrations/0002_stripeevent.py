@@ -0,0 +1,39 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(max_length=255, unique=True, verbose_name='Stripe event ID')),
+                ('event_type', models.CharField(max_length=100, verbose_name='event type')),
+                ('ordering_key', models.CharField(max_length=255, verbose_name='ordering key')),
+                ('payload', models.JSONField(verbose_name='payload')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('processed', 'Processed'), ('ignored', 'Ignored'), ('failed', 'Failed')], default='pending', max_length=20, verbose_name='status')),
+                ('attempts', models.IntegerField(default=0, verbose_name='attempts')),
+                ('last_error', models.TextField(blank=True, verbose_name='last error')),
+                ('stripe_created', models.DateTimeField(verbose_name='created in Stripe')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='received at')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='processed at')),
+            ],
+            options={
+                'verbose_name': 'Stripe event',
+                'verbose_name_plural': 'Stripe events',
+                'ordering': ['-received_at'],
+                'indexes': [
+                    models.Index(fields=['ordering_key', 'status', 'stripe_created'], name='stripeevent_key_status_idx'),
+                    models.Index(fields=['status', 'received_at'], name='stripeevent_status_recv_idx'),
+                    models.Index(fields=['processed_at'], name='stripeevent_processed_idx'),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0002_stripeevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StripeSyncCursor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='name')),
+                ('cursor', models.BigIntegerField(blank=True, null=True, verbose_name='cursor')),
+                ('last_stats', models.JSONField(blank=True, default=dict, verbose_name='last run statistics')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'Stripe sync cursor',
+                'verbose_name_plural': 'Stripe sync cursors',
+            },
+        ),
+    ]
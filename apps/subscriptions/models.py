@@ -1,9 +1,17 @@
 from django.db import models
+from django.db.models import Case, F, Q, Value, When
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
 
 
+def next_ai_reset_date(today):
+    """First day of the month after ``today``"""
+    if today.month == 12:
+        return today.replace(year=today.year + 1, month=1, day=1)
+    return today.replace(month=today.month + 1, day=1)
+
+
 class Subscription(models.Model):
     """User subscription model"""
     
@@ -52,6 +60,12 @@ class Subscription(models.Model):
     def __str__(self):
         return f"{self.user.email} - {self.get_plan_display()}"
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Middleware and templates read a cached snapshot (see snapshot.py)
+        from .snapshot import invalidate_subscription_snapshot
+        invalidate_subscription_snapshot(self.user_id)
+    
     def get_plan_config(self):
         """Get plan configuration from settings"""
         return settings.SUBSCRIPTION_PLANS.get(self.plan, {})
@@ -86,31 +100,77 @@ class Subscription(models.Model):
         team_count = TeamMember.objects.filter(organization=self.user, is_active=True).count()
         return team_count >= limit
     
+    def _ai_reset_due(self, today):
+        return not self.ai_requests_reset_date or self.ai_requests_reset_date < today
+    
     def can_use_ai(self):
-        """Check if user can use AI features"""
+        """Check if user can use AI features (read-only, does not charge a request)"""
         plan_config = self.get_plan_config()
         monthly_limit = plan_config.get('ai_requests_per_month', 0)
         
-        # Check if we need to reset the counter
-        today = timezone.now().date()
-        if not self.ai_requests_reset_date or self.ai_requests_reset_date < today:
-            self.ai_requests_used = 0
-            # Set reset date to first day of next month
-            if today.month == 12:
-                self.ai_requests_reset_date = today.replace(year=today.year + 1, month=1, day=1)
-            else:
-                self.ai_requests_reset_date = today.replace(month=today.month + 1, day=1)
-            self.save()
-        
         if monthly_limit == -1:  # unlimited
             return True
         
+        # A counter past its reset date starts the month at zero
+        if self._ai_reset_due(timezone.now().date()):
+            return monthly_limit > 0
+        
         return self.ai_requests_used < monthly_limit
     
+    def consume_ai_request(self):
+        """
+        Atomically check the monthly AI limit and charge one request.
+        
+        A single guarded UPDATE both resets the counter when the month rolled
+        over and increments it, and only matches the row while the limit is
+        not reached, so concurrent requests can never overshoot the quota or
+        lose increments. Returns True if the request was admitted.
+        """
+        plan_config = self.get_plan_config()
+        monthly_limit = plan_config.get('ai_requests_per_month', 0)
+        if monthly_limit == 0:
+            return False
+        
+        today = timezone.now().date()
+        reset_due = Q(ai_requests_reset_date__isnull=True) | Q(ai_requests_reset_date__lt=today)
+        next_reset = next_ai_reset_date(today)
+        
+        rows = Subscription.objects.filter(pk=self.pk)
+        if monthly_limit != -1:
+            rows = rows.filter(reset_due | Q(ai_requests_used__lt=monthly_limit))
+        
+        admitted = rows.update(
+            ai_requests_used=Case(When(reset_due, then=Value(1)), default=F('ai_requests_used') + 1),
+            ai_requests_reset_date=Case(When(reset_due, then=Value(next_reset)), default=F('ai_requests_reset_date')),
+        ) == 1
+        
+        if admitted:
+            if self._ai_reset_due(today):
+                self.ai_requests_used = 1
+                self.ai_requests_reset_date = next_reset
+            else:
+                self.ai_requests_used += 1
+            self._ai_usage_changed()
+        return admitted
+    
+    def refund_ai_request(self):
+        """Give back a request charged by consume_ai_request() that produced nothing"""
+        Subscription.objects.filter(pk=self.pk, ai_requests_used__gt=0).update(
+            ai_requests_used=F('ai_requests_used') - 1
+        )
+        self.ai_requests_used = max(self.ai_requests_used - 1, 0)
+        self._ai_usage_changed()
+    
     def increment_ai_usage(self):
-        """Increment AI request counter"""
+        """Increment AI request counter (unconditionally, without a limit check)"""
+        Subscription.objects.filter(pk=self.pk).update(ai_requests_used=F('ai_requests_used') + 1)
         self.ai_requests_used += 1
-        self.save()
+        self._ai_usage_changed()
+    
+    def _ai_usage_changed(self):
+        # update() bypasses save(), which normally invalidates the snapshot
+        from .snapshot import invalidate_subscription_snapshot
+        invalidate_subscription_snapshot(self.user_id)
     
     def is_paid_plan(self):
         """Check if this is a paid plan"""
@@ -168,3 +228,62 @@ class Invoice(models.Model):
     def __str__(self):
         return f"Invoice {self.stripe_invoice_id} - {self.amount_due} {self.currency}"
 
+
+
+class StripeEvent(models.Model):
+    """Raw Stripe webhook event, stored on receipt and processed by a Celery task"""
+    
+    STATUS_CHOICES = [
+        ('pending', _('Pending')),
+        ('processed', _('Processed')),
+        ('ignored', _('Ignored')),
+        ('failed', _('Failed')),
+    ]
+    
+    event_id = models.CharField(_('Stripe event ID'), max_length=255, unique=True)
+    event_type = models.CharField(_('event type'), max_length=100)
+    
+    # Events sharing a key (the Stripe customer, else the event itself) are applied in order
+    ordering_key = models.CharField(_('ordering key'), max_length=255)
+    
+    payload = models.JSONField(_('payload'))
+    
+    status = models.CharField(_('status'), max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.IntegerField(_('attempts'), default=0)
+    last_error = models.TextField(_('last error'), blank=True)
+    
+    stripe_created = models.DateTimeField(_('created in Stripe'))
+    received_at = models.DateTimeField(_('received at'), auto_now_add=True)
+    processed_at = models.DateTimeField(_('processed at'), null=True, blank=True)
+    
+    class Meta:
+        verbose_name = _('Stripe event')
+        verbose_name_plural = _('Stripe events')
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['ordering_key', 'status', 'stripe_created'], name='stripeevent_key_status_idx'),
+            models.Index(fields=['status', 'received_at'], name='stripeevent_status_recv_idx'),
+            models.Index(fields=['processed_at'], name='stripeevent_processed_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} ({self.event_id})"
+
+
+class StripeSyncCursor(models.Model):
+    """Progress marker of an incremental Stripe reconciliation"""
+    
+    name = models.CharField(_('name'), max_length=100, unique=True)
+    
+    # Unix timestamp up to which Stripe changes have been reconciled
+    cursor = models.BigIntegerField(_('cursor'), null=True, blank=True)
+    last_stats = models.JSONField(_('last run statistics'), default=dict, blank=True)
+    
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name = _('Stripe sync cursor')
+        verbose_name_plural = _('Stripe sync cursors')
+    
+    def __str__(self):
+        return f"{self.name}: {self.cursor}"
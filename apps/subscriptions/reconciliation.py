@@ -0,0 +1,260 @@
+"""
+Incremental reconciliation of local subscriptions with Stripe.
+
+A full run pages through every Stripe subscription. Later runs only look at
+what changed since the stored cursor: subscription events and subscriptions
+created after it (both auto-paginated), so a run touches the changed rows
+instead of calling Stripe once per customer. The few local rows Stripe does
+not report (a customer id without a subscription id, changed since the last
+run) are looked up per customer on a bounded thread pool. Differences are
+written with bulk_update, plan changes are recorded in SubscriptionHistory
+and the cursor only advances after a successful run.
+
+The Stripe client is injectable; fake_stripe.FakeStripe implements the used
+subset of the API for offline runs.
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+import stripe
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+SYNC_CURSOR_NAME = 'subscriptions'
+
+STRIPE_SYNC_WORKERS = getattr(settings, 'STRIPE_SYNC_WORKERS', 8)
+
+STRIPE_PAGE_SIZE = 100
+
+# Stripe keeps events for 30 days; older cursors fall back to a full scan
+EVENT_RETENTION_SECONDS = 29 * 24 * 3600
+
+# Re-read this much before the previous run's start; applying twice is harmless
+CURSOR_OVERLAP_SECONDS = 300
+
+SUBSCRIPTION_EVENT_TYPES = [
+    'customer.subscription.created',
+    'customer.subscription.updated',
+    'customer.subscription.deleted',
+]
+
+# Stripe subscription status -> local status; others (e.g. incomplete) are left alone
+STATUS_MAP = {
+    'active': 'active',
+    'trialing': 'active',
+    'past_due': 'past_due',
+    'unpaid': 'past_due',
+    'canceled': 'cancelled',
+    'incomplete_expired': 'expired',
+}
+
+SYNCED_FIELDS = [
+    'plan', 'status', 'stripe_subscription_id', 'stripe_customer_id', 'stripe_price_id',
+    'current_period_start', 'current_period_end', 'cancel_at_period_end', 'updated_at',
+]
+
+
+def price_plan_map():
+    """Stripe price id -> plan"""
+    prices = {
+        settings.STRIPE_PRICE_FREE: 'free',
+        settings.STRIPE_PRICE_BASIC: 'basic',
+        settings.STRIPE_PRICE_PRO: 'pro',
+        settings.STRIPE_PRICE_ENTERPRISE: 'enterprise',
+    }
+    return {price: plan for price, plan in prices.items() if price}
+
+
+def _timestamp(value):
+    return datetime.fromtimestamp(value, tz=dt_timezone.utc) if value else None
+
+
+def _price_id(stripe_sub):
+    items = (stripe_sub.get('items') or {}).get('data') or []
+    return items[0]['price']['id'] if items else ''
+
+
+def _rank(stripe_sub):
+    """Prefer live subscriptions, then the most recent one"""
+    return (stripe_sub['status'] in ('active', 'trialing', 'past_due'), stripe_sub.get('created') or 0)
+
+
+def _best(*candidates):
+    candidates = [candidate for candidate in candidates if candidate]
+    return max(candidates, key=_rank) if candidates else None
+
+
+class SubscriptionReconciler:
+    """Bring local Subscription rows in line with Stripe"""
+    
+    def __init__(self, client=stripe, workers=STRIPE_SYNC_WORKERS, dry_run=False, cursor_name=SYNC_CURSOR_NAME):
+        self.client = client
+        self.workers = max(workers, 1)
+        self.dry_run = dry_run
+        self.cursor_name = cursor_name
+        self.plans = price_plan_map()
+    
+    # Fetching ------------------------------------------------------------
+    
+    def _list(self, resource, **params):
+        return resource.list(limit=STRIPE_PAGE_SIZE, **params).auto_paging_iter()
+    
+    def _all_subscriptions(self):
+        return {sub['id']: sub for sub in self._list(self.client.Subscription, status='all')}
+    
+    def _changed_since(self, cursor):
+        changed = {}
+        # Events are listed newest first, so the first snapshot seen wins
+        for event in self._list(self.client.Event, types=SUBSCRIPTION_EVENT_TYPES, created={'gte': cursor}):
+            sub = event['data']['object']
+            changed.setdefault(sub['id'], sub)
+        for sub in self._list(self.client.Subscription, status='all', created={'gte': cursor}):
+            changed.setdefault(sub['id'], sub)
+        return changed
+    
+    def _latest_for_customer(self, customer_id):
+        subs = self.client.Subscription.list(customer=customer_id, status='all', limit=10)
+        return _best(*subs['data'])
+    
+    # Applying ------------------------------------------------------------
+    
+    def _apply(self, subscription, stripe_sub, now):
+        """Copy Stripe state onto a local row; return True if anything changed"""
+        status = STATUS_MAP.get(stripe_sub['status'])
+        if status is None:
+            return False
+        
+        price_id = _price_id(stripe_sub)
+        if status in ('cancelled', 'expired'):
+            plan = 'free'
+        else:
+            plan = self.plans.get(price_id, subscription.plan)
+        
+        values = {
+            'plan': plan,
+            'status': status,
+            'stripe_subscription_id': stripe_sub['id'],
+            'stripe_customer_id': stripe_sub.get('customer') or subscription.stripe_customer_id,
+            'stripe_price_id': price_id or subscription.stripe_price_id,
+            'current_period_start': _timestamp(stripe_sub.get('current_period_start')),
+            'current_period_end': _timestamp(stripe_sub.get('current_period_end')),
+            'cancel_at_period_end': bool(stripe_sub.get('cancel_at_period_end')),
+        }
+        if all(getattr(subscription, field) == value for field, value in values.items()):
+            return False
+        
+        for field, value in values.items():
+            setattr(subscription, field, value)
+        subscription.updated_at = now
+        return True
+    
+    # Run -----------------------------------------------------------------
+    
+    def run(self, full=False):
+        """
+        Reconcile subscriptions.
+        
+        Args:
+            full: Ignore the cursor and scan every Stripe subscription
+        
+        Returns:
+            Dictionary of run statistics
+        """
+        from .models import StripeSyncCursor, Subscription, SubscriptionHistory
+        from .snapshot import invalidate_subscription_snapshot
+        
+        started = time.perf_counter()
+        run_started_at = int(time.time())
+        
+        state, _created = StripeSyncCursor.objects.get_or_create(name=self.cursor_name)
+        cursor = None if full else state.cursor
+        if cursor is not None and run_started_at - cursor > EVENT_RETENTION_SECONDS:
+            cursor = None
+        
+        changed = self._changed_since(cursor) if cursor is not None else self._all_subscriptions()
+        
+        by_customer = {}
+        for sub in changed.values():
+            customer = sub.get('customer')
+            if customer:
+                by_customer[customer] = _best(by_customer.get(customer), sub)
+        
+        if cursor is None:
+            # Full scan: every Stripe subscription is known, no lookups needed
+            local = list(Subscription.objects.filter(~Q(stripe_customer_id='') | ~Q(stripe_subscription_id='')))
+            lookups = []
+        else:
+            local = list(
+                Subscription.objects.filter(
+                    Q(stripe_subscription_id__in=list(changed)) | Q(stripe_customer_id__in=list(by_customer))
+                )
+            ) if changed else []
+            seen = {subscription.pk for subscription in local}
+            
+            # Local rows Stripe did not report: a customer without a known
+            # subscription that changed locally since the last run
+            lookups = list(
+                Subscription.objects.exclude(stripe_customer_id='').filter(
+                    stripe_subscription_id='', updated_at__gte=_timestamp(cursor)
+                ).exclude(pk__in=seen)
+            )
+        
+        if lookups:
+            customers = sorted({subscription.stripe_customer_id for subscription in lookups})
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                for customer, sub in zip(customers, pool.map(self._latest_for_customer, customers)):
+                    if sub:
+                        by_customer[customer] = _best(by_customer.get(customer), sub)
+            local += lookups
+        
+        now = timezone.now()
+        updated = []
+        history = []
+        for subscription in local:
+            stripe_sub = _best(
+                changed.get(subscription.stripe_subscription_id),
+                by_customer.get(subscription.stripe_customer_id),
+            )
+            if stripe_sub is None:
+                continue
+            old_plan = subscription.plan
+            if self._apply(subscription, stripe_sub, now):
+                updated.append(subscription)
+                if subscription.plan != old_plan:
+                    history.append(SubscriptionHistory(
+                        user_id=subscription.user_id,
+                        subscription=subscription,
+                        from_plan=old_plan,
+                        to_plan=subscription.plan,
+                        reason='Synced from Stripe',
+                    ))
+        
+        stats = {
+            'mode': 'incremental' if cursor is not None else 'full',
+            'stripe_subscriptions': len(changed),
+            'customer_lookups': len(lookups),
+            'checked': len(local),
+            'updated': len(updated),
+            'plan_changes': len(history),
+            'dry_run': self.dry_run,
+        }
+        
+        if not self.dry_run:
+            with transaction.atomic():
+                Subscription.objects.bulk_update(updated, SYNCED_FIELDS, batch_size=500)
+                SubscriptionHistory.objects.bulk_create(history, batch_size=500)
+            
+            # bulk_update bypasses Subscription.save()
+            for subscription in updated:
+                invalidate_subscription_snapshot(subscription.user_id)
+        
+        stats['seconds'] = round(time.perf_counter() - started, 2)
+        
+        if not self.dry_run:
+            state.cursor = run_started_at - CURSOR_OVERLAP_SECONDS
+            state.last_stats = stats
+            state.save()
+        return stats
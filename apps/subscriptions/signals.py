@@ -0,0 +1,28 @@
+"""
+Signal handlers keeping the cached subscription snapshot fresh.
+Subscription.save() invalidates the snapshot itself.
+"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from apps.crm.models import Contact
+from .models import Subscription
+from .snapshot import invalidate_subscription_snapshot
+
+
+@receiver(post_delete, sender=Subscription)
+def invalidate_deleted_subscription(sender, instance, **kwargs):
+    """Drop the snapshot of a deleted subscription"""
+    invalidate_subscription_snapshot(instance.user_id)
+
+
+@receiver(post_save, sender=Contact)
+def invalidate_added_contact(sender, instance, created, **kwargs):
+    """Refresh the contact usage counter when a contact is added"""
+    if created:
+        invalidate_subscription_snapshot(instance.owner_id)
+
+
+@receiver(post_delete, sender=Contact)
+def invalidate_deleted_contact(sender, instance, **kwargs):
+    """Refresh the contact usage counter when a contact is removed"""
+    invalidate_subscription_snapshot(instance.owner_id)
@@ -0,0 +1,87 @@
+"""
+Cached subscription snapshot.
+
+The middleware and the context processor need the user's plan, status,
+limits and usage on every authenticated request. Instead of loading the
+Subscription row (and counting contacts) each time, a plain snapshot is
+kept in the user's "subscription" cache namespace for a short TTL and
+memoized on the request, so each request reads it at most once.
+
+The namespace is invalidated whenever a Subscription is saved or deleted,
+which includes every Stripe webhook handler, and when contacts are added
+or removed.
+"""
+from django.conf import settings
+from apps.crm.cache import get_or_compute, invalidate_namespace
+
+SUBSCRIPTION_NAMESPACE = 'subscription'
+
+SUBSCRIPTION_SNAPSHOT_TIMEOUT = 60
+
+
+class SubscriptionSnapshot:
+    """Read-only view of a user's subscription with the same helpers as the model"""
+
+    def __init__(self, data):
+        self.__dict__.update(data)
+
+    def get_plan_display(self):
+        return self.plan_display
+
+    def get_plan_config(self):
+        return settings.SUBSCRIPTION_PLANS.get(self.plan, {})
+
+    def can_use_feature(self, feature_name):
+        return feature_name in self.get_plan_config().get('features', [])
+
+    def has_reached_contacts_limit(self):
+        limit = self.get_plan_config().get('contacts_limit', 0)
+        if limit == -1:  # unlimited
+            return False
+        return self.contacts_count >= limit
+
+    def is_paid_plan(self):
+        return self.plan != 'free'
+
+
+def build_snapshot_data(user):
+    """Load the subscription (creating a free one if missing) and its usage"""
+    from apps.crm.models import Contact
+    from .models import Subscription
+
+    subscription, _created = Subscription.objects.get_or_create(
+        user=user,
+        defaults={'plan': 'free', 'status': 'active'},
+    )
+
+    return {
+        'id': subscription.pk,
+        'plan': subscription.plan,
+        'plan_display': str(subscription.get_plan_display()),
+        'status': subscription.status,
+        'cancel_at_period_end': subscription.cancel_at_period_end,
+        'current_period_end': subscription.current_period_end,
+        'ai_requests_used': subscription.ai_requests_used,
+        'contacts_count': Contact.objects.filter(owner=user).count(),
+    }
+
+
+def get_subscription_snapshot(request):
+    """Subscription snapshot for the request user, memoized on the request"""
+    if not hasattr(request, '_subscription_snapshot'):
+        user = request.user
+        data = get_or_compute(
+            SUBSCRIPTION_NAMESPACE,
+            ['snapshot'],
+            lambda: build_snapshot_data(user),
+            SUBSCRIPTION_SNAPSHOT_TIMEOUT,
+            owner_id=user.pk,
+        )
+        request._subscription_snapshot = SubscriptionSnapshot(data)
+    return request._subscription_snapshot
+
+
+def invalidate_subscription_snapshot(user_id):
+    """Drop the cached snapshot of a user"""
+    if user_id:
+        invalidate_namespace(SUBSCRIPTION_NAMESPACE, user_id)
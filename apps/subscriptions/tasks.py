@@ -0,0 +1,71 @@
+from celery import shared_task
+from django.core.cache import cache
+from django.utils import timezone
+from datetime import timedelta
+from .models import StripeEvent
+from .reconciliation import SubscriptionReconciler
+from .webhooks import process_events
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Upper bound for one drain of a customer's events; the lock expires after it
+STRIPE_EVENT_LOCK_TIMEOUT = 300
+
+STRIPE_EVENT_RETRY_BACKOFF = 30
+
+
+@shared_task(bind=True, max_retries=None)
+def process_stripe_events(self, ordering_key):
+    """
+    Apply the pending Stripe events of one customer in order.
+    
+    A cache lock makes sure a single worker drains a customer at a time; a
+    task that finds the lock taken retries shortly, so events stored while
+    another worker is draining are never left behind. Failing events are
+    retried with exponential backoff up to STRIPE_EVENT_MAX_ATTEMPTS.
+    """
+    lock_key = f'stripe-events:lock:{ordering_key}'
+    if not cache.add(lock_key, self.request.id or True, STRIPE_EVENT_LOCK_TIMEOUT):
+        raise self.retry(countdown=2)
+    
+    try:
+        stats = process_events(ordering_key)
+    finally:
+        cache.delete(lock_key)
+    
+    if stats['error']:
+        countdown = min(STRIPE_EVENT_RETRY_BACKOFF * 2 ** self.request.retries, 3600)
+        logger.warning(f"Stripe event processing for {ordering_key} failed, retrying in {countdown}s: {stats['error']}")
+        raise self.retry(countdown=countdown)
+    
+    return (
+        f"Processed {stats['processed']} Stripe events for {ordering_key} "
+        f"({stats['ignored']} ignored, {stats['failed']} failed)"
+    )
+
+
+@shared_task
+def process_pending_stripe_events():
+    """Re-queue customers whose events are still pending (e.g. lost task messages)"""
+    stale = timezone.now() - timedelta(minutes=5)
+    keys = list(
+        StripeEvent.objects.filter(status='pending', received_at__lt=stale)
+        .values_list('ordering_key', flat=True).distinct()
+    )
+    
+    for ordering_key in keys:
+        process_stripe_events.delay(ordering_key)
+    
+    return f"Re-queued {len(keys)} customers with pending Stripe events"
+
+
+@shared_task
+def reconcile_stripe_subscriptions():
+    """Incrementally sync subscriptions with Stripe"""
+    stats = SubscriptionReconciler().run()
+    
+    return (
+        f"Reconciled {stats['checked']} subscriptions ({stats['mode']}): "
+        f"{stats['updated']} updated, {stats['plan_changes']} plan changes"
+    )
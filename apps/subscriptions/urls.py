@@ -10,5 +10,6 @@ urlpatterns = [
     path('current/', views.current_subscription, name='current'),
     path('cancel/', views.cancel_subscription, name='cancel'),
     path('webhook/', views.stripe_webhook, name='webhook'),
+    path('webhook/stats/', views.webhook_stats_view, name='webhook_stats'),
 ]
 
@@ -4,7 +4,11 @@ from django.contrib import messages
 from django.utils.translation import gettext as _
 from django.conf import settings
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import transaction
+from django.http import HttpResponse, JsonResponse
+from .tasks import process_stripe_events
+from .webhooks import store_event, webhook_stats
 import stripe
 import json
 
@@ -242,132 +246,18 @@ def stripe_webhook(request):
     except stripe.error.SignatureVerificationError:
         return HttpResponse(status=400)
     
-    # Handle the event
-    if event['type'] == 'checkout.session.completed':
-        session = event['data']['object']
-        handle_checkout_session_completed(session)
-    
-    elif event['type'] == 'invoice.paid':
-        invoice = event['data']['object']
-        handle_invoice_paid(invoice)
-    
-    elif event['type'] == 'invoice.payment_failed':
-        invoice = event['data']['object']
-        handle_invoice_payment_failed(invoice)
-    
-    elif event['type'] == 'customer.subscription.updated':
-        subscription_data = event['data']['object']
-        handle_subscription_updated(subscription_data)
-    
-    elif event['type'] == 'customer.subscription.deleted':
-        subscription_data = event['data']['object']
-        handle_subscription_deleted(subscription_data)
+    # Store the event and acknowledge; processing happens on Celery, in
+    # order per customer (see webhooks.py). Redeliveries are acknowledged
+    # without being stored again.
+    stripe_event, created = store_event(json.loads(payload))
+    if created:
+        ordering_key = stripe_event.ordering_key
+        transaction.on_commit(lambda: process_stripe_events.delay(ordering_key))
     
     return HttpResponse(status=200)
 
 
-def handle_checkout_session_completed(session):
-    """Handle successful checkout"""
-    from apps.accounts.models import User
-    from .models import Subscription, SubscriptionHistory
-    
-    user_id = session['metadata'].get('user_id')
-    plan = session['metadata'].get('plan')
-    
-    if user_id and plan:
-        user = User.objects.get(id=user_id)
-        subscription = user.subscription
-        
-        old_plan = subscription.plan
-        subscription.plan = plan
-        subscription.status = 'active'
-        subscription.stripe_subscription_id = session.get('subscription')
-        subscription.save()
-        
-        # Create history entry
-        SubscriptionHistory.objects.create(
-            user=user,
-            subscription=subscription,
-            from_plan=old_plan,
-            to_plan=plan
-        )
-
-
-def handle_invoice_paid(invoice_data):
-    """Handle paid invoice"""
-    from .models import Subscription, Invoice as SubInvoice
-    
-    subscription_id = invoice_data.get('subscription')
-    if subscription_id:
-        try:
-            subscription = Subscription.objects.get(stripe_subscription_id=subscription_id)
-            
-            # Create or update invoice record
-            SubInvoice.objects.update_or_create(
-                stripe_invoice_id=invoice_data['id'],
-                defaults={
-                    'subscription': subscription,
-                    'amount_due': invoice_data['amount_due'] / 100,
-                    'amount_paid': invoice_data['amount_paid'] / 100,
-                    'currency': invoice_data['currency'].upper(),
-                    'status': invoice_data['status'],
-                    'invoice_pdf': invoice_data.get('invoice_pdf', ''),
-                    'hosted_invoice_url': invoice_data.get('hosted_invoice_url', ''),
-                }
-            )
-        except Subscription.DoesNotExist:
-            pass
-
-
-def handle_invoice_payment_failed(invoice_data):
-    """Handle failed payment"""
-    from .models import Subscription
-    
-    subscription_id = invoice_data.get('subscription')
-    if subscription_id:
-        try:
-            subscription = Subscription.objects.get(stripe_subscription_id=subscription_id)
-            subscription.status = 'past_due'
-            subscription.save()
-        except Subscription.DoesNotExist:
-            pass
-
-
-def handle_subscription_updated(subscription_data):
-    """Handle subscription update"""
-    from .models import Subscription
-    from django.utils import timezone
-    
-    try:
-        subscription = Subscription.objects.get(stripe_subscription_id=subscription_data['id'])
-        subscription.status = subscription_data['status']
-        subscription.current_period_start = timezone.datetime.fromtimestamp(subscription_data['current_period_start'])
-        subscription.current_period_end = timezone.datetime.fromtimestamp(subscription_data['current_period_end'])
-        subscription.cancel_at_period_end = subscription_data.get('cancel_at_period_end', False)
-        subscription.save()
-    except Subscription.DoesNotExist:
-        pass
-
-
-def handle_subscription_deleted(subscription_data):
-    """Handle subscription deletion"""
-    from .models import Subscription, SubscriptionHistory
-    
-    try:
-        subscription = Subscription.objects.get(stripe_subscription_id=subscription_data['id'])
-        old_plan = subscription.plan
-        subscription.plan = 'free'
-        subscription.status = 'cancelled'
-        subscription.save()
-        
-        # Create history entry
-        SubscriptionHistory.objects.create(
-            user=subscription.user,
-            subscription=subscription,
-            from_plan=old_plan,
-            to_plan='free',
-            reason='Subscription ended'
-        )
-    except Subscription.DoesNotExist:
-        pass
-
+@staff_member_required
+def webhook_stats_view(request):
+    """Lag and throughput counters of the Stripe webhook queue"""
+    return JsonResponse(webhook_stats())
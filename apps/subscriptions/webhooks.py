@@ -0,0 +1,243 @@
+"""
+Stripe webhook ingestion.
+
+The webhook view only verifies the signature and stores the raw event in
+StripeEvent; the unique event id makes Stripe's redeliveries no-ops. Events
+are then applied by the process_stripe_events Celery task, one ordering key
+(the Stripe customer) at a time and in Stripe creation order, so bursts at
+period boundaries never hold web workers and each event is applied once.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import Avg, F, Min
+from django.utils import timezone
+
+STRIPE_EVENT_MAX_ATTEMPTS = 5
+
+
+def event_ordering_key(event):
+    """Stripe customer of an event, or the event id for customer-less events"""
+    data_object = event['data']['object']
+    customer = data_object.get('customer')
+    if isinstance(customer, dict):
+        customer = customer.get('id')
+    return customer or event['id']
+
+
+def store_event(event):
+    """
+    Persist a verified Stripe event (the decoded webhook body).
+    
+    Returns:
+        (StripeEvent, created); created is False for redeliveries
+    """
+    from .models import StripeEvent
+    
+    try:
+        with transaction.atomic():
+            stripe_event = StripeEvent.objects.create(
+                event_id=event['id'],
+                event_type=event['type'],
+                ordering_key=event_ordering_key(event),
+                payload=event,
+                stripe_created=datetime.fromtimestamp(event['created'], tz=dt_timezone.utc),
+            )
+    except IntegrityError:
+        return StripeEvent.objects.get(event_id=event['id']), False
+    return stripe_event, True
+
+
+def process_events(ordering_key, max_attempts=STRIPE_EVENT_MAX_ATTEMPTS):
+    """
+    Apply the pending events of one ordering key, oldest first.
+    
+    Stops at the first event that fails (keeping it pending) so later events
+    of the same customer are not applied before it, unless it has used up
+    ``max_attempts`` and is marked failed.
+    
+    The caller must make sure only one process handles a key at a time.
+    
+    Returns:
+        Dictionary with ``processed``, ``ignored`` and ``failed`` counts and
+        the ``error`` of a failure that should be retried, if any
+    """
+    from .models import StripeEvent
+    
+    stats = {'processed': 0, 'ignored': 0, 'failed': 0, 'error': None}
+    pending = StripeEvent.objects.filter(ordering_key=ordering_key, status='pending').order_by('stripe_created', 'pk')
+    
+    for stripe_event in pending:
+        handler = EVENT_HANDLERS.get(stripe_event.event_type)
+        try:
+            with transaction.atomic():
+                if handler:
+                    handler(stripe_event.payload['data']['object'])
+                StripeEvent.objects.filter(pk=stripe_event.pk).update(
+                    status='processed' if handler else 'ignored',
+                    attempts=F('attempts') + 1,
+                    processed_at=timezone.now(),
+                )
+        except Exception as e:
+            attempts = stripe_event.attempts + 1
+            failed = attempts >= max_attempts
+            StripeEvent.objects.filter(pk=stripe_event.pk).update(
+                status='failed' if failed else 'pending',
+                attempts=attempts,
+                last_error=str(e),
+                processed_at=timezone.now() if failed else None,
+            )
+            if not failed:
+                stats['error'] = str(e)
+                break
+            stats['failed'] += 1
+        else:
+            stats['processed' if handler else 'ignored'] += 1
+    
+    return stats
+
+
+def webhook_stats(window=timedelta(hours=1)):
+    """
+    Lag and throughput counters for the webhook queue.
+    
+    Returns:
+        Dictionary with the pending backlog, the age of the oldest pending
+        event (lag), events completed within ``window`` and per minute, the
+        average receive-to-processed latency and the failed total
+    """
+    from .models import StripeEvent
+    
+    now = timezone.now()
+    pending = StripeEvent.objects.filter(status='pending')
+    oldest = pending.aggregate(oldest=Min('received_at'))['oldest']
+    
+    recent = StripeEvent.objects.filter(processed_at__gte=now - window, status__in=['processed', 'ignored'])
+    completed = recent.count()
+    latency = recent.aggregate(latency=Avg(F('processed_at') - F('received_at')))['latency']
+    
+    return {
+        'pending': pending.count(),
+        'lag_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+        'processed_last_window': completed,
+        'window_seconds': int(window.total_seconds()),
+        'processed_per_minute': round(completed / (window.total_seconds() / 60), 2),
+        'avg_processing_seconds': round(latency.total_seconds(), 3) if latency else 0.0,
+        'failed': StripeEvent.objects.filter(status='failed').count(),
+    }
+
+
+def handle_checkout_session_completed(session):
+    """Handle successful checkout"""
+    from apps.accounts.models import User
+    from .models import Subscription, SubscriptionHistory
+    
+    user_id = session['metadata'].get('user_id')
+    plan = session['metadata'].get('plan')
+    
+    if user_id and plan:
+        user = User.objects.get(id=user_id)
+        subscription = user.subscription
+        
+        old_plan = subscription.plan
+        subscription.plan = plan
+        subscription.status = 'active'
+        subscription.stripe_subscription_id = session.get('subscription')
+        subscription.save()
+        
+        # Create history entry
+        SubscriptionHistory.objects.create(
+            user=user,
+            subscription=subscription,
+            from_plan=old_plan,
+            to_plan=plan
+        )
+
+
+def handle_invoice_paid(invoice_data):
+    """Handle paid invoice"""
+    from .models import Subscription, Invoice as SubInvoice
+    
+    subscription_id = invoice_data.get('subscription')
+    if subscription_id:
+        try:
+            subscription = Subscription.objects.get(stripe_subscription_id=subscription_id)
+            
+            # Create or update invoice record
+            SubInvoice.objects.update_or_create(
+                stripe_invoice_id=invoice_data['id'],
+                defaults={
+                    'subscription': subscription,
+                    'amount_due': invoice_data['amount_due'] / 100,
+                    'amount_paid': invoice_data['amount_paid'] / 100,
+                    'currency': invoice_data['currency'].upper(),
+                    'status': invoice_data['status'],
+                    'invoice_pdf': invoice_data.get('invoice_pdf', ''),
+                    'hosted_invoice_url': invoice_data.get('hosted_invoice_url', ''),
+                }
+            )
+        except Subscription.DoesNotExist:
+            pass
+
+
+def handle_invoice_payment_failed(invoice_data):
+    """Handle failed payment"""
+    from .models import Subscription
+    
+    subscription_id = invoice_data.get('subscription')
+    if subscription_id:
+        try:
+            subscription = Subscription.objects.get(stripe_subscription_id=subscription_id)
+            subscription.status = 'past_due'
+            subscription.save()
+        except Subscription.DoesNotExist:
+            pass
+
+
+def handle_subscription_updated(subscription_data):
+    """Handle subscription update"""
+    from .models import Subscription
+    from django.utils import timezone
+    
+    try:
+        subscription = Subscription.objects.get(stripe_subscription_id=subscription_data['id'])
+        subscription.status = subscription_data['status']
+        subscription.current_period_start = timezone.datetime.fromtimestamp(subscription_data['current_period_start'])
+        subscription.current_period_end = timezone.datetime.fromtimestamp(subscription_data['current_period_end'])
+        subscription.cancel_at_period_end = subscription_data.get('cancel_at_period_end', False)
+        subscription.save()
+    except Subscription.DoesNotExist:
+        pass
+
+
+def handle_subscription_deleted(subscription_data):
+    """Handle subscription deletion"""
+    from .models import Subscription, SubscriptionHistory
+    
+    try:
+        subscription = Subscription.objects.get(stripe_subscription_id=subscription_data['id'])
+        old_plan = subscription.plan
+        subscription.plan = 'free'
+        subscription.status = 'cancelled'
+        subscription.save()
+        
+        # Create history entry
+        SubscriptionHistory.objects.create(
+            user=subscription.user,
+            subscription=subscription,
+            from_plan=old_plan,
+            to_plan='free',
+            reason='Subscription ended'
+        )
+    except Subscription.DoesNotExist:
+        pass
+
+
+
+EVENT_HANDLERS = {
+    'checkout.session.completed': handle_checkout_session_completed,
+    'invoice.paid': handle_invoice_paid,
+    'invoice.payment_failed': handle_invoice_payment_failed,
+    'customer.subscription.updated': handle_subscription_updated,
+    'customer.subscription.deleted': handle_subscription_deleted,
+}
@@ -0,0 +1,82 @@
+"""
+Process-local cache of compiled Django templates.
+
+Building a django.template.Template tokenizes and parses its source, which is
+wasted work when the same email template is rendered for hundreds of
+recipients. Compiled templates are kept in a thread-safe LRU keyed by
+(model, pk, field, updated_at), so editing a template naturally misses the
+cache and the stale entry ages out.
+"""
+import hashlib
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.template import Template
+
+TEMPLATE_CACHE_SIZE = getattr(settings, 'TEMPLATE_CACHE_SIZE', 256)
+
+
+class CompiledTemplateCache:
+    """LRU cache of compiled Template objects with hit/miss counters"""
+
+    def __init__(self, maxsize=TEMPLATE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._templates = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, source):
+        """Return the compiled template for ``key``, compiling ``source`` on a miss"""
+        with self._lock:
+            template = self._templates.get(key)
+            if template is not None:
+                self._templates.move_to_end(key)
+                self.hits += 1
+                return template
+            self.misses += 1
+
+        # Compile outside the lock; a concurrent miss on the same key just compiles twice
+        template = Template(source)
+
+        with self._lock:
+            self._templates[key] = template
+            self._templates.move_to_end(key)
+            while len(self._templates) > self.maxsize:
+                self._templates.popitem(last=False)
+
+        return template
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self._templates),
+                'maxsize': self.maxsize,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+template_cache = CompiledTemplateCache()
+
+
+def compiled_field(instance, field):
+    """Compiled template for a text field of a saved model instance"""
+    source = getattr(instance, field)
+    if instance.pk is None:
+        return Template(source)
+    key = (instance._meta.label, instance.pk, field, instance.updated_at)
+    return template_cache.get(key, source)
+
+
+def compiled_source(source):
+    """Compiled template for an ad-hoc source string (keyed by its hash)"""
+    key = ('source', hashlib.sha1(source.encode('utf-8')).hexdigest())
+    return template_cache.get(key, source)
@@ -1,6 +1,13 @@
 from django.db import models
 from django.conf import settings
 from django.utils.translation import gettext_lazy as _
+from html import unescape
+import re
+
+from .cache import compiled_field
+
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+BLANK_LINES_RE = re.compile(r'\n\s*\n')
 
 
 class DocumentTemplate(models.Model):
@@ -164,27 +171,20 @@ class EmailTemplate(models.Model):
         Returns:
             Tuple of (subject, html_content, plain_text)
         """
-        from django.template import Template, Context
-        
-        # Render subject
-        subject_template = Template(self.subject)
-        rendered_subject = subject_template.render(Context(context))
+        from django.template import Context
         
-        # Render HTML content
-        html_template = Template(self.html_content)
-        rendered_html = html_template.render(Context(context))
+        # Compiled templates are cached per (pk, updated_at), see apps/templates/cache.py
+        rendered_subject = compiled_field(self, 'subject').render(Context(context))
+        rendered_html = compiled_field(self, 'html_content').render(Context(context))
         
         # Render or generate plain text
         if self.plain_text:
-            text_template = Template(self.plain_text)
-            rendered_text = text_template.render(Context(context))
+            rendered_text = compiled_field(self, 'plain_text').render(Context(context))
         else:
             # Simple HTML to text conversion
-            from html import unescape
-            import re
-            rendered_text = re.sub(r'<[^>]+>', '', rendered_html)
+            rendered_text = HTML_TAG_RE.sub('', rendered_html)
             rendered_text = unescape(rendered_text)
-            rendered_text = re.sub(r'\n\s*\n', '\n\n', rendered_text)
+            rendered_text = BLANK_LINES_RE.sub('\n\n', rendered_text)
         
         return rendered_subject, rendered_html, rendered_text
 
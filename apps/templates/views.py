@@ -136,7 +136,7 @@ def template_studio(request):
 def generate_ai_template(request):
     """Generate template using AI based on user prompt"""
     import logging
-    from django.core.cache import cache
+    from apps.crm.cache import rate_limit
     
     logger = logging.getLogger(__name__)
     
@@ -151,14 +151,11 @@ def generate_ai_template(request):
             }, status=403)
         
         # Rate limiting - max 5 requests per minute
-        rate_limit_key = f"ai_template_gen:{request.user.id}"
-        requests_count = cache.get(rate_limit_key, 0)
-        if requests_count >= 5:
+        if not rate_limit(f"ai_template_gen:{request.user.id}", limit=5, period=60):
             return JsonResponse({
                 'success': False,
                 'error': _('Too many requests. Please wait a moment and try again.')
             }, status=429)
-        cache.set(rate_limit_key, requests_count + 1, 60)  # 60 seconds
         
         # Parse and validate request
         data = json.loads(request.body)
@@ -179,24 +176,35 @@ def generate_ai_template(request):
                 'error': _('Description is too long. Please keep it under 2000 characters.')
             }, status=400)
         
+        # Charge the request atomically; the check above may be stale
+        if not subscription.consume_ai_request():
+            return JsonResponse({
+                'success': False,
+                'error': _('You have reached your AI request limit for this month. Please upgrade your plan.'),
+                'upgrade_required': True
+            }, status=403)
+        
         # Initialize AI assistant
         assistant = GeminiAssistant(request.user)
         
         # Generate template with timeout protection
-        html_content = assistant.generate_complete_template(user_prompt, template_type)
+        try:
+            html_content = assistant.generate_complete_template(user_prompt, template_type)
+        except Exception:
+            # Nothing was delivered, so the charged request is given back
+            subscription.refund_ai_request()
+            raise
         
         # Validate output size
         MAX_HTML_SIZE = 100000  # 100KB
         if len(html_content) > MAX_HTML_SIZE:
             logger.warning(f"Generated template too large for user {request.user.id}: {len(html_content)} bytes")
+            subscription.refund_ai_request()
             return JsonResponse({
                 'success': False,
                 'error': _('Generated template is too large. Please simplify your requirements.')
             }, status=400)
         
-        # Increment AI usage counter
-        subscription.increment_ai_usage()
-        
         return JsonResponse({
             'success': True,
             'html_content': html_content,
@@ -223,7 +231,7 @@ def generate_ai_template(request):
 def refine_ai_template(request):
     """Refine existing template based on user feedback"""
     import logging
-    from django.core.cache import cache
+    from apps.crm.cache import rate_limit
     
     logger = logging.getLogger(__name__)
     
@@ -238,14 +246,11 @@ def refine_ai_template(request):
             }, status=403)
         
         # Rate limiting - max 5 requests per minute
-        rate_limit_key = f"ai_template_refine:{request.user.id}"
-        requests_count = cache.get(rate_limit_key, 0)
-        if requests_count >= 5:
+        if not rate_limit(f"ai_template_refine:{request.user.id}", limit=5, period=60):
             return JsonResponse({
                 'success': False,
                 'error': _('Too many requests. Please wait a moment and try again.')
             }, status=429)
-        cache.set(rate_limit_key, requests_count + 1, 60)
         
         # Parse and validate request
         data = json.loads(request.body)
@@ -274,23 +279,34 @@ def refine_ai_template(request):
                 'error': _('Current template is too large.')
             }, status=400)
         
+        # Charge the request atomically; the check above may be stale
+        if not subscription.consume_ai_request():
+            return JsonResponse({
+                'success': False,
+                'error': _('You have reached your AI request limit for this month. Please upgrade your plan.'),
+                'upgrade_required': True
+            }, status=403)
+        
         # Initialize AI assistant
         assistant = GeminiAssistant(request.user)
         
         # Refine template
-        refined_html = assistant.refine_template(current_html, user_feedback)
+        try:
+            refined_html = assistant.refine_template(current_html, user_feedback)
+        except Exception:
+            # Nothing was delivered, so the charged request is given back
+            subscription.refund_ai_request()
+            raise
         
         # Validate output size
         if len(refined_html) > MAX_HTML_SIZE:
             logger.warning(f"Refined template too large for user {request.user.id}: {len(refined_html)} bytes")
+            subscription.refund_ai_request()
             return JsonResponse({
                 'success': False,
                 'error': _('Refined template is too large. Please simplify your requirements.')
             }, status=400)
         
-        # Increment AI usage counter
-        subscription.increment_ai_usage()
-        
         return JsonResponse({
             'success': True,
             'html_content': refined_html,
@@ -415,7 +431,7 @@ def save_ai_template(request):
 def generate_ai_email_template(request):
     """Generate email template using AI based on user prompt"""
     import logging
-    from django.core.cache import cache
+    from apps.crm.cache import rate_limit
     
     logger = logging.getLogger(__name__)
     
@@ -430,14 +446,11 @@ def generate_ai_email_template(request):
             }, status=403)
         
         # Rate limiting
-        rate_limit_key = f"ai_email_template_gen:{request.user.id}"
-        requests_count = cache.get(rate_limit_key, 0)
-        if requests_count >= 5:
+        if not rate_limit(f"ai_email_template_gen:{request.user.id}", limit=5, period=60):
             return JsonResponse({
                 'success': False,
                 'error': _('Too many requests. Please wait a moment and try again.')
             }, status=429)
-        cache.set(rate_limit_key, requests_count + 1, 60)
         
         # Parse request
         data = json.loads(request.body)
@@ -456,14 +469,24 @@ def generate_ai_email_template(request):
                 'error': _('Description is too long. Please keep it under 2000 characters.')
             }, status=400)
         
+        # Charge the request atomically; the check above may be stale
+        if not subscription.consume_ai_request():
+            return JsonResponse({
+                'success': False,
+                'error': _('You have reached your AI request limit for this month. Please upgrade your plan.'),
+                'upgrade_required': True
+            }, status=403)
+        
         # Initialize AI assistant
         assistant = GeminiAssistant(request.user)
         
         # Generate email template
-        result = assistant.generate_email_template(user_prompt, template_type)
-        
-        # Increment AI usage
-        subscription.increment_ai_usage()
+        try:
+            result = assistant.generate_email_template(user_prompt, template_type)
+        except Exception:
+            # Nothing was delivered, so the charged request is given back
+            subscription.refund_ai_request()
+            raise
         
         return JsonResponse({
             'success': True,
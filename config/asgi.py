@@ -7,6 +7,8 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+# Read by settings.py: no persistent database connections under ASGI
+os.environ.setdefault('DJANGO_ASGI', 'True')
 
 application = get_asgi_application()
 
@@ -21,5 +21,17 @@ app.conf.beat_schedule = {
         'task': 'apps.invoices.tasks.send_payment_reminders',
         'schedule': crontab(hour=9, minute=0),  # Run daily at 9:00 AM
     },
+    'process-pending-stripe-events': {
+        'task': 'apps.subscriptions.tasks.process_pending_stripe_events',
+        'schedule': crontab(minute='*/5'),  # Safety net for lost webhook tasks
+    },
+    'reconcile-stripe-subscriptions': {
+        'task': 'apps.subscriptions.tasks.reconcile_stripe_subscriptions',
+        'schedule': crontab(minute=30),  # Hourly, incremental
+    },
+    'purge-old-exports': {
+        'task': 'apps.crm.tasks.purge_old_exports',
+        'schedule': crontab(hour=3, minute=15),
+    },
 }
 
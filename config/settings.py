@@ -75,6 +75,7 @@ INSTALLED_APPS = [
     'crispy_forms',
     'crispy_bootstrap5',
     'rest_framework',
+    'rest_framework.authtoken',
     'django_celery_beat',
     
     # Local apps
@@ -85,6 +86,7 @@ INSTALLED_APPS = [
     'apps.subscriptions',
     'apps.ai_assistant',
     'apps.faq',
+    'apps.api',
 ]
 
 MIDDLEWARE = [
@@ -123,12 +125,19 @@ TEMPLATES = [
 WSGI_APPLICATION = 'config.wsgi.application'
 
 # Database
+# Under ASGI every request runs its sync code in a fresh thread, and Django
+# keeps one connection per thread, so persistent connections would pile up
+# until PostgreSQL runs out of slots. config/asgi.py sets DJANGO_ASGI; WSGI,
+# Celery and management commands keep reusing connections.
+SERVING_ASGI = os.getenv('DJANGO_ASGI', 'False') == 'True'
+CONN_MAX_AGE = 0 if SERVING_ASGI else int(os.getenv('CONN_MAX_AGE', '600'))
+
 try:
     import dj_database_url
     DATABASES = {
         'default': dj_database_url.config(
             default=f'sqlite:///{BASE_DIR / "db.sqlite3"}',
-            conn_max_age=600,
+            conn_max_age=CONN_MAX_AGE,
             conn_health_checks=True,
         )
     }
@@ -184,6 +193,9 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# DejaVu TrueType fonts for invoice/offer PDFs (Debian/Ubuntu: fonts-dejavu-core)
+PDF_FONT_DIR = os.getenv('PDF_FONT_DIR', '/usr/share/fonts/truetype/dejavu')
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -207,6 +219,13 @@ STRIPE_PRICE_ENTERPRISE = os.getenv('STRIPE_PRICE_ENTERPRISE', '')
 # Gemini AI
 GEMINI_API_KEY = os.getenv('GEMINI_API_KEY', '')
 
+# AI gateway (apps/ai_assistant/services.py); AI_BACKEND=stub answers locally
+# without calling Gemini, e.g. for load tests
+AI_BACKEND = os.getenv('AI_BACKEND', 'gemini')
+AI_MAX_CONCURRENCY = int(os.getenv('AI_MAX_CONCURRENCY', '16'))
+AI_TENANT_CONCURRENCY = int(os.getenv('AI_TENANT_CONCURRENCY', '2'))
+AI_REQUEST_TIMEOUT = float(os.getenv('AI_REQUEST_TIMEOUT', '30'))
+
 # Celery Configuration
 CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
 CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
@@ -215,6 +234,38 @@ CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
 
+# Cache Configuration
+# Redis (the same REDIS_URL Celery uses) so caches and rate limits are shared
+# by all gunicorn workers; per-process memory caches only for local development.
+REDIS_URL = os.getenv('REDIS_URL', '')
+
+if REDIS_URL:
+    def _redis_cache(prefix, timeout=300):
+        return {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': prefix,
+            'TIMEOUT': timeout,
+        }
+
+    CACHES = {
+        'default': _redis_cache('crm'),
+        'sessions': _redis_cache('session', timeout=60 * 60 * 24 * 14),
+        'fragments': _redis_cache('fragment', timeout=60 * 60),
+        'ratelimit': _redis_cache('ratelimit', timeout=60),
+    }
+else:
+    CACHES = {
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+        'sessions': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'sessions'},
+        'fragments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'fragments'},
+        'ratelimit': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ratelimit'},
+    }
+
+# Sessions are read from cache and written through to the database
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
 # Login URLs
 LOGIN_URL = 'accounts:login'
 LOGIN_REDIRECT_URL = 'crm:dashboard'
@@ -224,6 +275,7 @@ LOGOUT_REDIRECT_URL = 'accounts:login'
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
+        'rest_framework.authentication.TokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -2,7 +2,7 @@
 URL configuration for CRM project.
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.conf.urls.i18n import i18n_patterns
@@ -11,6 +11,7 @@ from apps.accounts.health import health_check
 urlpatterns = [
     path('health/', health_check, name='health_check'),
     path('i18n/', include('django.conf.urls.i18n')),
+    re_path(r'^api/(?P<version>v1)/', include('apps.api.urls')),
 ]
 
 urlpatterns += i18n_patterns(